@@ -0,0 +1,203 @@
+import datetime
+import hashlib
+import functools
+from flask import Blueprint, Response, jsonify, make_response, request
+from flask.json.provider import DefaultJSONProvider
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+from data import db_session, account_store, pricing, suggest
+from data.idempotency_key import IdempotencyKey
+
+# orjson сериализует ответы в несколько раз быстрее стандартного json, без него используется json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Сколько хранится ответ на запрос с заголовком Idempotency-Key
+IDEMPOTENCY_TTL = datetime.timedelta(hours=24)
+# Наибольшее число позиций в одном запросе добавления в корзину
+MAX_ITEMS = 100
+# Адреса, доступные без входа
+PUBLIC_ENDPOINTS = {'api.suggest_names'}
+# Подсказки меняются только вместе с каталогом, поэтому браузер может хранить ответ минуту
+SUGGEST_MAX_AGE = 60
+
+# JSON API корзины и заказов, адреса начинаются с /api
+blueprint = Blueprint('api', __name__, url_prefix='/api')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def init_app(app):
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    app.register_blueprint(blueprint)
+
+
+def error(status, code, **details):
+    return jsonify(error=code, **details), status
+
+
+def quote_dict(quote):
+    return {field: getattr(quote, field) for field in account_store.LINE_FIELDS} if quote else None
+
+
+def line_dict(line):
+    return {'id': line.id, **quote_dict(line)}
+
+
+# Позиция из запроса: идентификаторы - целые числа, цены - числа или null
+def valid_item(item):
+    if not isinstance(item, dict):
+        return False
+    numbers = (int, float)
+    return (all(type(item.get(name)) is int for name in ('item_id', 'currency_id'))
+            and type(item.get('price')) in numbers
+            and (item.get('discount') is None or type(item['discount']) is int)
+            and (item.get('discount_price') is None or type(item['discount_price']) in numbers))
+
+
+def totals_list(totals):
+    return [{'currency_id': currency_id, 'amount': amount} for currency_id, amount in totals.items()]
+
+
+# API доступно только вошедшим пользователям, вместо страницы входа возвращается ошибка 401
+@blueprint.before_request
+def require_login():
+    if request.endpoint not in PUBLIC_ENDPOINTS and not current_user.is_authenticated:
+        return error(401, 'unauthorized')
+
+
+# Повтор запроса с тем же заголовком Idempotency-Key возвращает сохранённый ответ, а не выполняет операцию снова
+# Ключ резервируется до выполнения операции, поэтому одновременный повтор получает 409
+def idempotent(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+        db_sess = db_session.current_session()
+        user_id = current_user.id
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        db_sess.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == user_id, IdempotencyKey.created_at < datetime.datetime.now() - IDEMPOTENCY_TTL
+        ).delete(synchronize_session=False)
+        record = IdempotencyKey(user_id=user_id, key=key, endpoint=request.endpoint, request_hash=request_hash)
+        db_sess.add(record)
+        try:
+            db_sess.commit()
+        except IntegrityError:
+            db_sess.rollback()
+            record = db_sess.get(IdempotencyKey, (user_id, key))
+            if record is None:
+                return error(409, 'idempotency_key_in_use')
+            if record.endpoint != request.endpoint or record.request_hash != request_hash:
+                return error(422, 'idempotency_key_reused')
+            if record.status is None:
+                return error(409, 'request_in_progress')
+            return Response(record.response, status=record.status, mimetype='application/json')
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db_sess.rollback()
+            db_sess.delete(record)
+            db_sess.commit()
+            raise
+        record.status = response.status_code
+        record.response = response.get_data(as_text=True)
+        db_sess.commit()
+        return response
+    return wrapper
+
+
+# Подсказки при вводе в строку поиска: GET /api/suggest?q=<начало названия>&limit=<число>
+@blueprint.route('/suggest')
+def suggest_names():
+    limit = min(max(request.args.get('limit', suggest.LIMIT, type=int), 1), suggest.MAX_LIMIT)
+    response = jsonify(suggest.suggest(request.args.get('q', ''), limit))
+    response.cache_control.public = True
+    response.cache_control.max_age = SUGGEST_MAX_AGE
+    return response
+
+
+# Корзина: позиции и сумма по каждой валюте
+@blueprint.route('/cart')
+def get_cart():
+    db_sess = db_session.current_session()
+    lines = account_store.get_cart(db_sess, current_user.id)
+    return jsonify(lines=[line_dict(line) for line in lines],
+                   totals=totals_list(account_store.summarize(lines)))
+
+
+# Сумма корзины по каждой валюте без списка позиций
+@blueprint.route('/cart/totals')
+def get_cart_totals():
+    totals = account_store.get_cart_totals(db_session.current_session(), current_user.id)
+    return jsonify(totals=totals_list(totals))
+
+
+# Добавление нескольких позиций: {"items": [{"item_id", "currency_id", "price", "discount", "discount_price"}]}
+# Цена каждой позиции сверяется с таблицей цен; если хотя бы одна не совпадает, ничего не добавляется,
+# а в ответе 409 возвращаются актуальные цены этих товаров
+# Тело не в формате JSON получает ту же ошибку invalid_items, что и неверный список позиций
+@blueprint.route('/cart/items', methods=['POST'])
+@idempotent
+def add_cart_items():
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items or len(items) > MAX_ITEMS or not all(map(valid_item, items)):
+        return error(400, 'invalid_items', max_items=MAX_ITEMS)
+    quotes = []
+    stale = []
+    for item in items:
+        quote = pricing.validate(item['item_id'], item['currency_id'], item['price'],
+                                 item.get('discount'), item.get('discount_price'))
+        if quote is None:
+            current = pricing.get_prices().quote(item['item_id'])
+            stale.append({'item_id': item['item_id'], 'current': quote_dict(current)})
+        else:
+            quotes.append(quote)
+    if stale:
+        return error(409, 'price_changed', items=stale)
+    db_sess = db_session.current_session()
+    lines = account_store.add_lines(db_sess, current_user.id, quotes)
+    return jsonify(lines=[line_dict(line) for line in lines],
+                   totals=totals_list(account_store.get_cart_totals(db_sess, current_user.id))), 201
+
+
+# Удаление позиции корзины по её идентификатору
+@blueprint.route('/cart/items/<int:line_id>', methods=['DELETE'])
+def delete_cart_item(line_id):
+    if not account_store.remove_line(db_session.current_session(), current_user.id, line_id):
+        return error(404, 'line_not_found')
+    return '', 204
+
+
+# История заказов от новых к старым по ORDERS_PER_PAGE, следующая страница - GET /api/orders?before=<next_before>
+@blueprint.route('/orders')
+def get_orders():
+    db_sess = db_session.current_session()
+    order_ids, next_before = account_store.get_orders_page(db_sess, current_user.id,
+                                                           request.args.get('before', type=int))
+    totals = account_store.get_order_totals(db_sess, order_ids)
+    return jsonify(orders=[{'id': order_id, 'totals': totals_list(totals[order_id])} for order_id in order_ids],
+                   next_before=next_before)
+
+
+# Оформление заказа из всей корзины
+@blueprint.route('/orders', methods=['POST'])
+@idempotent
+def create_order():
+    db_sess = db_session.current_session()
+    order_id = account_store.checkout(db_sess, current_user.id)
+    if order_id is None:
+        return error(409, 'insufficient_funds')
+    lines = account_store.get_order_lines(db_sess, current_user.id, order_id)
+    return jsonify(order_id=order_id, totals=totals_list(account_store.summarize(lines))), 201
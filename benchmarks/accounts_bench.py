@@ -0,0 +1,99 @@
+# Сравнение задержек добавления в корзину: json-файл аккаунта против таблиц в базе данных
+# Запуск из корня проекта: python -m benchmarks.accounts_bench
+import os
+import json
+import time
+import tempfile
+import threading
+from data import db_session, account_store
+from data.currency import Currency
+from data.user import User
+
+THREADS = 8
+OPERATIONS = 200
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+# Прежний способ: чтение и перезапись всего json-файла без блокировок
+def json_add_to_cart(path, info):
+    with open(path, 'r+', encoding='utf-8') as jsonfile:
+        data = json.load(jsonfile)
+        data['shopping_cart']['items'].append(info)
+        data['shopping_cart']['summary'][info['currency_id']] = \
+            data['shopping_cart']['summary'].get(info['currency_id'], 0) + float(info['price'])
+        jsonfile.seek(0)
+        jsonfile.truncate()
+        json.dump(data, jsonfile)
+
+
+def sql_add_to_cart(_, info):
+    db_sess = db_session.create_session()
+    try:
+        account_store.add_to_cart(db_sess, 1, int(info['item_id']), int(info['currency_id']), float(info['price']))
+    finally:
+        db_sess.close()
+
+
+# Запуск THREADS потоков по OPERATIONS операций, возвращает задержки и число ошибок
+def run(operation, target):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        for i in range(OPERATIONS):
+            info = {'item_id': '1', 'currency_id': '1', 'price': '1.5', 'discount': 'None', 'discount_price': 'None'}
+            start = time.perf_counter()
+            try:
+                operation(target, info)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def report(name, latencies, errors, stored):
+    expected = THREADS * OPERATIONS
+    print(f"{name}: p50 {percentile(latencies, 50) * 1000:.2f} мс, p99 {percentile(latencies, 99) * 1000:.2f} мс, "
+          f"ошибок {errors}, сохранено {stored} из {expected}")
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'user_1.json')
+    with open(path, 'w', encoding='utf-8') as jsonfile:
+        json.dump({'shopping_cart': {'items': [], 'summary': {}}, 'orders': {}, 'currencies': {'1': 0}}, jsonfile)
+    latencies, errors = run(json_add_to_cart, path)
+    try:
+        with open(path, 'r', encoding='utf-8') as jsonfile:
+            stored = len(json.load(jsonfile)['shopping_cart']['items'])
+    except ValueError:
+        stored = 'файл повреждён'
+    report('json', latencies, errors, stored)
+
+    db_session.global_init(os.path.join(directory, 'bench.db'))
+    db_sess = db_session.create_session()
+    db_sess.add(Currency(id=1, name='bench', logotype='', is_integer=False))
+    db_sess.add(User(id=1, name='bench', got_bonus=0))
+    db_sess.flush()
+    account_store.create_account(db_sess, 1, [1])
+    db_sess.commit()
+    latencies, errors = run(sql_add_to_cart, None)
+    report('sql', latencies, errors, len(account_store.get_cart(db_sess, 1)))
+
+
+if __name__ == '__main__':
+    main()
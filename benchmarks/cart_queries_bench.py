@@ -0,0 +1,70 @@
+# Проверка, что число SQL-запросов при построении корзины не зависит от её размера
+# Запуск из корня проекта: python -m benchmarks.cart_queries_bench
+import os
+import time
+import tempfile
+from flask import Flask
+from sqlalchemy import event
+from data import db_session, account_store, catalog
+from data.cart_line import CartLine
+from data.currency import Currency
+from data.item import Item
+from data.user import User
+
+CART_SIZES = (1, 10, 200, 2000)
+ITEMS = 500
+
+
+# Подсчёт запросов, выполненных внутри функции
+def count_queries(engine, function):
+    counter = [0]
+
+    def before_cursor_execute(*args):
+        counter[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return counter[0], elapsed
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    db_session.global_init(os.path.join(directory, 'bench.db'))
+    db_sess = db_session.create_session()
+    engine = db_sess.get_bind()
+    db_sess.add(Currency(id=1, name='bench', logotype='bench.png', is_integer=False))
+    db_sess.add(User(id=1, name='bench', got_bonus=0))
+    db_sess.add_all(Item(id=i, name=f'item {i}', category=1, description='a;b', photo_name=f'{i}.png')
+                    for i in range(1, ITEMS + 1))
+    db_sess.commit()
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), '..', 'static'))
+    with app.test_request_context():
+        catalog.get_catalog()
+        results = dict()
+        for size in CART_SIZES:
+            db_sess.query(CartLine).delete()
+            db_sess.add_all(CartLine(user_id=1, item_id=i % ITEMS + 1, currency_id=1, price=1)
+                            for i in range(size))
+            db_sess.commit()
+            lines = account_store.get_cart(db_sess, 1)
+            # Тёплый каталог: товары берутся из снимка
+            warm = count_queries(engine, lambda: catalog.build_line_rows(db_sess, lines))
+            # Холодный снимок без товаров: недостающие товары загружаются одним запросом
+            catalog.get_catalog().items.clear()
+            cold = count_queries(engine, lambda: catalog.build_line_rows(db_sess, lines))
+            catalog.invalidate()
+            catalog.get_catalog()
+            results[size] = (warm, cold)
+            print(f"позиций {size}: из каталога {warm[0]} запросов за {warm[1] * 1000:.2f} мс, "
+                  f"без каталога {cold[0]} запросов за {cold[1] * 1000:.2f} мс")
+    assert len({warm[0] for warm, cold in results.values()}) == 1, 'число запросов растёт с размером корзины'
+    assert len({cold[0] for warm, cold in results.values()}) == 1, 'число запросов растёт с размером корзины'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Импорт каталога из NDJSON и CSV пачками (flask catalog import) против добавления по одной строке через ORM
+# Запуск из корня проекта: python -m benchmarks.catalog_import_bench
+import os
+import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import sqlalchemy as sa
+from data import db_session, catalog_io
+from data.item import Item
+from benchmarks.seed import WORDS
+
+ITEMS = 1_000_000
+# Строк для способа «по одной»: весь миллион занял бы слишком много времени
+SINGLE_ROWS = 2_000
+
+
+# Пиковая память процесса включает отображённый в память файл базы (mmap_size в db_session.SQLITE_PRAGMAS)
+# и кэш страниц SQLite; сами строки файла держатся в памяти только одной пачкой
+def max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_files(directory, categories, photos):
+    rng = random.Random(1)
+    paths = {name: os.path.join(directory, f'items.{name}') for name in ('ndjson', 'csv')}
+    with open(paths['ndjson'], 'w', encoding='utf-8') as ndjson:
+        catalog_io.write_rows(({'name': f'{" ".join(rng.sample(WORDS, 2)).capitalize()} {i}',
+                                'category': rng.choice(categories), 'description': ';'.join(rng.sample(WORDS, 3)),
+                                'special_price': None, 'special_currency': None, 'photo_name': rng.choice(photos)}
+                               for i in range(ITEMS)), ndjson, 'ndjson', catalog_io.TABLES['items']['fields'])
+    with open(paths['ndjson'], encoding='utf-8') as ndjson, open(paths['csv'], 'w', encoding='utf-8',
+                                                                 newline='') as csv_file:
+        catalog_io.write_rows(catalog_io.read_rows(ndjson, 'ndjson'), csv_file, 'csv',
+                              catalog_io.TABLES['items']['fields'])
+    return paths
+
+
+def run_import(path, file_format):
+    start = time.perf_counter()
+    with open(path, encoding='utf-8', newline='') as source:
+        stats = catalog_io.import_rows('items', catalog_io.read_rows(source, file_format))
+    elapsed = time.perf_counter() - start
+    total = stats['inserted'] + stats['updated']
+    print(f"{file_format}: добавлено {stats['inserted']}, обновлено {stats['updated']} за {elapsed:.1f} с "
+          f"({total / elapsed:.0f} строк/с), пиковая память процесса {max_rss():.0f} МБ")
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'store_database.db')
+    shutil.copy('db/store_database.db', database)
+    db_session.global_init(database)
+    db_sess = db_session.create_session()
+    categories = [name for name, in db_sess.execute(sa.text('SELECT name FROM categories'))]
+    photos = [name for name, in db_sess.query(Item.photo_name)]
+    paths = make_files(directory, categories, photos)
+    print(f"файлы: NDJSON {os.path.getsize(paths['ndjson']) / 1024 / 1024:.0f} МБ, "
+          f"CSV {os.path.getsize(paths['csv']) / 1024 / 1024:.0f} МБ; память до импорта {max_rss():.0f} МБ")
+    # Прежний способ: объект ORM и отдельная транзакция на каждую строку
+    start = time.perf_counter()
+    for i in range(SINGLE_ROWS):
+        db_sess.add(Item(name=f'Строка {i}', category=1, description='', photo_name=photos[0]))
+        db_sess.commit()
+    single = SINGLE_ROWS / (time.perf_counter() - start)
+    db_sess.close()
+    print(f"по одной строке: {single:.0f} строк/с, {ITEMS} строк заняли бы {ITEMS / single / 60:.0f} мин")
+    run_import(paths['ndjson'], 'ndjson')
+    # Повторный импорт того же каталога: все строки находятся по названию и обновляются
+    run_import(paths['csv'], 'csv')
+
+
+if __name__ == '__main__':
+    main()
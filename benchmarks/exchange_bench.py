@@ -0,0 +1,62 @@
+# Пересчёт матрицы курсов и пересчёт сумм в одну валюту: цикл Python против векторных операций RateTable
+# Запуск из корня проекта: python -m benchmarks.exchange_bench
+import time
+import random
+import numpy as np
+from data import exchange_rates
+from data.catalog import Catalog, CurrencyRecord
+
+CURRENCY_COUNTS = (14, 100, 1000)
+AMOUNT_COUNTS = (10, 10_000, 1_000_000)
+REPEATS = 20
+
+
+def make_catalog(size):
+    currencies = [CurrencyRecord(id=i, name=str(i), logotype='', is_integer=i % 3 == 0, logo_url='')
+                  for i in range(1, size + 1)]
+    return Catalog(1, [], currencies, [], [])
+
+
+def measure(function, repeats=REPEATS):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+# Матрица курсов списками Python из той же стоимости валют в базовых единицах
+def loop_matrix(base):
+    return [[first / second for second in base] for first in base]
+
+
+def loop_convert(table, amounts, from_ids, to_id):
+    target = table.base[table.index[to_id]]
+    base = dict(zip(table.ids.tolist(), table.base.tolist()))
+    return [amount * base[currency_id] / target for amount, currency_id in zip(amounts, from_ids)]
+
+
+def main():
+    for size in CURRENCY_COUNTS:
+        catalog = make_catalog(size)
+        table = exchange_rates.build_rates(catalog, 0)
+        base = table.base.tolist()
+        vectorized = measure(lambda: exchange_rates.build_rates(catalog, 0))
+        loop = measure(lambda: loop_matrix(base), 3 if size >= 1000 else REPEATS)
+        print(f"валют {size}: матрица {size}x{size} в цикле {loop:.3f} мс, build_rates {vectorized:.3f} мс")
+    table = exchange_rates.build_rates(make_catalog(CURRENCY_COUNTS[0]), 0)
+    ids = table.ids.tolist()
+    for count in AMOUNT_COUNTS:
+        amounts = [random.uniform(0, 1000) for _ in range(count)]
+        from_ids = [random.choice(ids) for _ in range(count)]
+        repeats = 3 if count >= 1_000_000 else REPEATS
+        loop = measure(lambda: loop_convert(table, amounts, from_ids, 1), repeats)
+        vectorized = measure(lambda: table.convert_many(amounts, from_ids, 1), repeats)
+        # Суммы, уже загруженные в массивы, без преобразования списков
+        amount_array, id_array = np.array(amounts), np.array(from_ids)
+        arrays = measure(lambda: table.convert_many(amount_array, id_array, 1), repeats)
+        print(f"сумм {count}: цикл {loop:.3f} мс, convert_many {vectorized:.3f} мс (из списков), "
+              f"{arrays:.3f} мс (из массивов)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# Объём изображений на типовых страницах: исходные файлы против копий из build_images.py
+# Запуск из корня проекта после python build_images.py: python -m benchmarks.image_report
+from data import images
+
+# Состав страниц: сколько изображений каждого вида загружает браузер
+PAGES = {
+    'главная (13 карточек и специальное предложение)': {('items', 'card'): 14},
+    'поиск (30 карточек)': {('items', 'card'): 30},
+    'товар (фото и три значка валют)': {('items', 'full'): 1, ('currencies', 'thumb'): 3},
+    'корзина (5 позиций)': {('items', 'card'): 5, ('currencies', 'thumb'): 11},
+}
+
+
+# Средний размер исходного файла и копии каждого размера по папке
+def average_sizes(manifest):
+    totals = dict()
+    for name, entry in manifest.items():
+        folder = name.split('/', 1)[0]
+        source = entry['bytes']['original']
+        sizes = totals.setdefault(folder, {'count': 0, 'source': 0})
+        sizes['count'] += 1
+        sizes['source'] += source
+        for variant in images.VARIANTS:
+            sizes[variant] = sizes.get(variant, 0) + entry['bytes'].get(variant, source)
+    return {folder: {key: value / sizes['count'] for key, value in sizes.items() if key != 'count'}
+            for folder, sizes in totals.items()}
+
+
+def main():
+    manifest = images.get_manifest()
+    if not manifest:
+        print("Манифест не найден, сначала выполните python build_images.py")
+        return
+    averages = average_sizes(manifest)
+    for page, content in PAGES.items():
+        before = sum(averages[folder]['source'] * count for (folder, variant), count in content.items())
+        after = sum(averages[folder][variant] * count for (folder, variant), count in content.items())
+        print(f"{page}: {before / 1024:.0f} КБ -> {after / 1024:.0f} КБ, "
+              f"экономия {(before - after) / 1024:.0f} КБ ({(1 - after / before) * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+# Очередь фоновых задач: время ответа регистрации с созданием счёта в запросе и в задаче,
+# пропускная способность воркеров в потоках, процессах и с пачками задач в одной транзакции
+# и соблюдение предела одновременных задач очереди
+# Запуск из корня проекта: python -m benchmarks.jobs_bench
+import os
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from data import db_session, jobs, account_store
+from data.currency import Currency
+from data.job import Job
+from data.user import User
+
+JOBS = 2000
+REGISTRATIONS = 300
+# Задачи очереди limited спят SLEEP секунд, чтобы несколько выполнялись одновременно
+LIMITED = 40
+SLEEP = 0.05
+BATCH = 50
+
+__running = 0
+__peak = 0
+__lock = threading.Lock()
+
+
+@jobs.task('bench.noop', queue='bench')
+def noop(db_sess, number):
+    pass
+
+
+# Та же пустая задача, которую воркер выполняет пачками по BATCH с одним коммитом на пачку
+@jobs.task('bench.batch', queue='bench', batch=BATCH)
+def batch(db_sess, number):
+    pass
+
+
+@jobs.task('bench.sleep', queue='limited')
+def sleep(db_sess):
+    global __running, __peak
+    with __lock:
+        __running += 1
+        __peak = max(__peak, __running)
+    time.sleep(SLEEP)
+    with __lock:
+        __running -= 1
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def pending():
+    db_sess = db_session.create_session()
+    try:
+        return db_sess.query(Job).filter(Job.status.in_(('queued', 'running'))).count()
+    finally:
+        db_sess.close()
+
+
+def wait_until_empty():
+    while pending():
+        time.sleep(0.05)
+
+
+def new_user(db_sess, number, label):
+    user = User(name='bench', surname='bench', email=f'{label}{number}@jobs.bench', age=30, address='-',
+                got_bonus=0)
+    db_sess.add(user)
+    db_sess.flush()
+    return user
+
+
+# Транзакция регистрации: счёт создаётся в запросе (прежний способ) или задачей в очереди
+def registration(label, in_request):
+    db_sess = db_session.create_session()
+    timings = []
+    for number in range(REGISTRATIONS):
+        start = time.perf_counter()
+        user = new_user(db_sess, number, label)
+        if in_request:
+            account_store.create_account(db_sess, user.id, [i for i, in db_sess.query(Currency.id)])
+        else:
+            jobs.enqueue(db_sess, 'accounts.create', {'user_id': user.id}, key=f'account:{user.id}')
+        db_sess.commit()
+        timings.append(time.perf_counter() - start)
+    db_sess.close()
+    print(f"регистрация, счёт {'в запросе' if in_request else 'в задаче'}: p50 "
+          f"{percentile(timings, 50) * 1000:.2f} мс, p95 {percentile(timings, 95) * 1000:.2f} мс")
+
+
+def submit_all(count, name):
+    db_sess = db_session.create_session()
+    for number in range(count):
+        jobs.enqueue(db_sess, name, {'number': number})
+    db_sess.commit()
+    db_sess.close()
+
+
+def throughput(label, threads, processes=0, name='bench.noop'):
+    submit_all(JOBS, name)
+    start = time.perf_counter()
+    if processes:
+        children = [multiprocessing.Process(target=jobs._work, args=(threads, ['bench']), daemon=True)
+                    for _ in range(processes)]
+        for child in children:
+            child.start()
+        wait_until_empty()
+        for child in children:
+            child.terminate()
+    else:
+        worker = jobs.Worker(threads, ['bench'])
+        wait_until_empty()
+        worker.stop()
+    elapsed = time.perf_counter() - start
+    print(f'{label}: {JOBS} задач за {elapsed:.2f} с ({JOBS / elapsed:.0f} задач/с)')
+
+
+def main():
+    from data import account_jobs
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'store_database.db')
+    shutil.copy('db/store_database.db', database)
+    db_session.global_init(database)
+    registration('request', True)
+    worker = jobs.Worker(jobs.THREADS, ['accounts'])
+    registration('job', False)
+    wait_until_empty()
+    worker.stop()
+    throughput('1 процесс, 1 поток', 1)
+    throughput('1 процесс, 4 потока', 4)
+    throughput('2 процесса по 2 потока', 2, processes=2)
+    throughput(f'1 процесс, 1 поток, пачки по {BATCH}', 1, name='bench.batch')
+    # Предел очереди limited - DEFAULT_CONCURRENCY, потоков больше
+    db_sess = db_session.create_session()
+    for _ in range(LIMITED):
+        jobs.enqueue(db_sess, 'bench.sleep')
+    db_sess.commit()
+    db_sess.close()
+    start = time.perf_counter()
+    worker = jobs.Worker(8, ['limited'])
+    wait_until_empty()
+    worker.stop()
+    print(f'очередь limited: 8 потоков, одновременно выполнялось не больше {__peak} задач '
+          f'(предел {jobs.DEFAULT_CONCURRENCY}), {LIMITED} задач за {time.perf_counter() - start:.2f} с')
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Пропускная способность входа в аккаунт в зависимости от числа потоков хэширования паролей
+# Запуск из корня проекта: python -m benchmarks.login_bench
+import os
+import time
+import shutil
+import tempfile
+import threading
+from data import db_session, passwords
+from data.user import User
+
+POOL_SIZES = (1, 2, 4, 8)
+CLIENTS = 16
+DURATION = 5
+EMAIL = 'bench@example.com'
+PASSWORD = 'Benchmark12'
+
+
+# Запросы /login из CLIENTS потоков в течение DURATION секунд, каждый третий - с неверным паролем
+def load(app):
+    counts = {200: 0, 302: 0, 503: 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + DURATION
+
+    def worker(offset):
+        client = app.test_client()
+        number = offset
+        while time.monotonic() < deadline:
+            password = PASSWORD if number % 3 else 'Wrong12345'
+            number += 1
+            status = client.post('/login', data={'email': EMAIL, 'password': password}).status_code
+            with lock:
+                counts[status] = counts.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'bench.db')
+    shutil.copyfile('db/store_database.db', database)
+    from main import create_app
+    app = create_app({'DATABASE_URL': database, 'TESTING': True, 'WTF_CSRF_ENABLED': False})
+    db_sess = db_session.create_session()
+    user = User(email=EMAIL, name='bench', surname='bench', age=20, address='-', got_bonus=0)
+    user.set_password(PASSWORD)
+    db_sess.add(user)
+    db_sess.commit()
+    db_sess.close()
+    print(f"Процессоров: {os.cpu_count()}, параметры хэширования {passwords.METHOD}, клиентов {CLIENTS}")
+    for pool_size in POOL_SIZES:
+        app.config['PASSWORD_POOL_SIZE'] = pool_size
+        passwords.init_app(app)
+        counts = load(app)
+        total = counts[200] + counts[302]
+        print(f"потоков хэширования {pool_size}: {total / DURATION:.1f} входов/с "
+              f"(успешных {counts[302]}, неверный пароль {counts[200]}, отказов 503: {counts[503]})")
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Пересчёт цен всего каталога: цикл со случайным выбором цены для каждого товара против векторного reprice
+# и время получения цены одного товара из таблицы
+# Запуск из корня проекта: python -m benchmarks.pricing_bench
+import time
+import random
+from data import pricing
+from data.catalog import Catalog, ItemRecord, CurrencyRecord
+
+SIZES = (58, 100_000, 1_000_000)
+LOOKUPS = 100_000
+
+
+def make_catalog(size):
+    currencies = [CurrencyRecord(id=i, name=str(i), logotype='', is_integer=i % 3 == 0, logo_url='')
+                  for i in range(1, 15)]
+    items = [ItemRecord(id=i, name=str(i), category=1, description='', properties=(), short_description='',
+                        special_price=1000 if i % 50 == 0 else None, special_currency=1 if i % 50 == 0 else None,
+                        photo_name='', photo_url='', card_url='')
+             for i in range(1, size + 1)]
+    return Catalog(1, items, currencies, [], [])
+
+
+# Прежний выбор цены на странице товара, выполненный для каждого товара каталога
+def loop_reprice(catalog):
+    prices = dict()
+    for item in catalog.item_list:
+        if item.special_price:
+            price = item.special_price
+            currency = catalog.currencies[item.special_currency]
+        else:
+            price = random.randint(0, 99999999)
+            price /= 10 ** random.randint(0, len(str(price)))
+            currency = random.choice(catalog.currency_list)
+        discount = discount_price = None
+        if random.randint(1, 10) == 10:
+            discount = random.randint(1, 400)
+            discount_price = price - price * discount / 100
+            if currency.is_integer:
+                price = int(price)
+                discount_price = int(discount_price)
+        prices[item.id] = (currency.id, price, discount, discount_price)
+    return prices
+
+
+def main():
+    # Первый вызов NumPy медленнее из-за инициализации
+    pricing.reprice(make_catalog(10), 0)
+    for size in SIZES:
+        catalog = make_catalog(size)
+        start = time.perf_counter()
+        loop_reprice(catalog)
+        loop = time.perf_counter() - start
+        start = time.perf_counter()
+        table = pricing.reprice(catalog, pricing.current_bucket())
+        vectorized = time.perf_counter() - start
+        ids = [random.randint(1, size) for _ in range(LOOKUPS)]
+        start = time.perf_counter()
+        for item_id in ids:
+            table.quote(item_id)
+        lookup = (time.perf_counter() - start) / LOOKUPS * 1e6
+        print(f"товаров {size}: цикл {loop * 1000:.1f} мс, reprice {vectorized * 1000:.1f} мс "
+              f"(ускорение {loop / vectorized:.1f}x), цена одного товара {lookup:.2f} мкс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Расчёт похожих товаров: полный пересчёт, пересчёт после изменения нескольких товаров
+# с его отличием от полного и время получения похожих товаров из таблицы, отображённой в память
+# Запуск из корня проекта: python -m benchmarks.recommendations_bench
+import os
+import time
+import random
+import tempfile
+import numpy as np
+from data import recommendations
+
+SIZES = (1_000, 10_000, 100_000)
+VOCABULARY = 20_000
+CATEGORIES = 18
+CHANGED = 100
+LOOKUPS = 100_000
+
+
+# Описания из 3-6 свойств по 2-4 слова; частота слов убывает по закону Ципфа, как в обычных текстах
+def make_rows(size, rng):
+    weights = 1 / np.arange(1, VOCABULARY + 1)
+    words = np.random.default_rng(1).choice(VOCABULARY, size=size * 20, p=weights / weights.sum())
+    words = iter(f'слово{word}' for word in words)
+    return [(i, rng.randint(1, CATEGORIES),
+             ';'.join(' '.join(next(words) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(3, 6))))
+            for i in range(1, size + 1)]
+
+
+def main():
+    rng = random.Random(1)
+    directory = tempfile.mkdtemp()
+    for size in SIZES:
+        rows = make_rows(size, rng)
+        start = time.perf_counter()
+        table, _ = recommendations.build(rows)
+        full = time.perf_counter() - start
+        changed = set(rng.sample(range(size), min(CHANGED, size)))
+        updated = [(item_id, category, description + ';новое свойство' if position in changed else description)
+                   for position, (item_id, category, description) in enumerate(rows)]
+        start = time.perf_counter()
+        approximate, recomputed = recommendations.build(updated, table)
+        incremental = time.perf_counter() - start
+        # Отличие частичного пересчёта от полного: доля общих похожих товаров в строке
+        exact, _ = recommendations.build(updated)
+        overlap = [len(set(approximate.lookup(item_id)) & set(exact.lookup(item_id))) / recommendations.TOP_N
+                   for item_id, _, _ in updated]
+        recommendations.save(table, directory)
+        mapped = recommendations.load(directory)
+        ids = [rng.randint(1, size) for _ in range(LOOKUPS)]
+        start = time.perf_counter()
+        for item_id in ids:
+            mapped.lookup(item_id)
+        lookup = (time.perf_counter() - start) / LOOKUPS * 1e6
+        print(f"товаров {size}: полный расчёт {full:.2f} с; изменено {len(changed)}, пересчитано строк {recomputed} "
+              f"за {incremental:.2f} с (совпадение с полным расчётом {sum(overlap) / len(overlap):.3f}, "
+              f"худшая строка {min(overlap):.3f}); похожие товары одного товара {lookup:.2f} мкс, "
+              f"таблица {os.path.getsize(recommendations._paths(directory, recommendations._current(directory))['similar']) / 1024 / 1024:.1f} МБ")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+# Нагрузочный тест: воспроизведение смеси сценариев из benchmarks/mixes.json (просмотр, поиск, вход,
+# корзина и оформление заказа) на синтетической базе из benchmarks/seed.py
+# Запросы выполняются в процессе через тестовый клиент Flask (inprocess) и/или через настоящий gunicorn (server)
+# Для каждого адреса считаются запросы в секунду, задержки p50/p95/p99 и число SQL-запросов из заголовка
+# Server-Timing; результаты сохраняются в JSON, --compare сравнивает их с результатами прошлого запуска
+# Запуск из корня проекта: python -m benchmarks.replay --target both --items 10000 --users 1000 --duration 20
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from collections import defaultdict, Counter
+from urllib.parse import quote, urlencode, urlsplit
+from werkzeug.exceptions import HTTPException
+from benchmarks import seed
+from benchmarks.server_bench import wait_until_ready
+
+MIXES = os.path.join(os.path.dirname(__file__), 'mixes.json')
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+DURATION = 20
+WARMUP = 3
+CONCURRENCY = {'inprocess': 4, 'server': 16}
+PORT = 8766
+SERVER_COMMAND = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+# Ухудшение задержки p95 или пропускной способности больше чем на эту долю считается регрессией
+REGRESSION = 0.10
+QUERIES = re.compile(r'db;desc="(\d+) queries"')
+
+
+# Значения подстановок сценария: item_id и query выбираются заново при каждой подстановке,
+# остальные (email, password и извлечённые из ответов) хранятся до конца сценария
+class Variables(dict):
+    def __init__(self, rng, items, **values):
+        super().__init__(values)
+        self.rng = rng
+        self.items = items
+
+    def __missing__(self, key):
+        if key == 'item_id':
+            return self.rng.randint(1, self.items)
+        if key == 'query':
+            return self.rng.choice(seed.WORDS)
+        raise KeyError(key)
+
+
+# Клиент внутри процесса: запросы проходят весь стек Flask без сети
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None):
+        response = self.client.open(path, method=method, data=form)
+        return response.status_code, response.headers, response.get_data(as_text=True)
+
+
+# Перенаправления не выполняются, чтобы, как и в тестовом клиенте, каждый запрос учитывался отдельно
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# Клиент настоящего сервера с собственными cookie, как у отдельного посетителя
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(), NoRedirect())
+
+    def request(self, method, path, form=None):
+        data = urlencode(form).encode('utf-8') if form else None
+        url = self.base_url + quote(path, safe='/?&=%')
+        try:
+            response = self.opener.open(urllib.request.Request(url, data=data, method=method), timeout=30)
+        except urllib.error.HTTPError as error:
+            response = error
+        with response:
+            return response.status, response.headers, response.read().decode('utf-8', 'replace')
+
+
+def percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+# Значение атрибута из HTML: шаблоны экранируют в адресах только '&' (например, ссылка добавления в корзину
+# содержит '&currency_id' без экранирования), поэтому html.unescape здесь не подходит - он превращает '&curren' в '¤'
+def unescape_attribute(value):
+    return value.replace('&amp;', '&')
+
+
+# Проверка ответа шага: expect задаёт ожидаемый статус и, для перенаправлений, адрес из Location
+# (например, {"status": 302, "location": "/orders"}); без expect ошибкой считаются статусы 4xx и 5xx
+# и отсутствие ответа. Так перенаправление не туда, например на страницу товара при отклонённой цене,
+# тоже считается ошибкой
+def expected(step, status, headers):
+    expect = step.get('expect')
+    if expect is None:
+        return 0 < status < 400
+    if status != expect.get('status', status):
+        return False
+    return 'location' not in expect or urlsplit(headers.get('Location', '')).path == expect['location']
+
+
+# Имя обработчика для адреса, чтобы /item/1 и /item/2 попадали в одну строку отчёта
+def route_name(router, method, path):
+    try:
+        endpoint, _ = router.match(urlsplit(path).path, method)
+    except HTTPException:
+        return 'unknown'
+    return endpoint
+
+
+# Запуск сценариев в concurrency потоках в течение duration секунд
+# Возвращает {адрес: [(задержка, число SQL-запросов или None, ошибка)]}, число сценариев и время работы
+def run(make_client, router, mixes, items, users, duration, concurrency, seed_value=1):
+    names = list(mixes)
+    weights = [mixes[name]['weight'] for name in names]
+    results = [None] * concurrency
+    deadline = time.monotonic() + duration
+
+    def worker(number):
+        rng = random.Random(seed_value * 1000 + number)
+        client = make_client()
+        samples = defaultdict(list)
+        scenarios = Counter()
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            variables = Variables(rng, items, email=seed.user_email(rng.randint(1, users)), password=seed.PASSWORD)
+            for step in mixes[name]['steps']:
+                path = step['path'].format_map(variables)
+                form = {key: value.format_map(variables) for key, value in step.get('form', {}).items()}
+                start = time.perf_counter()
+                try:
+                    status, headers, body = client.request(step['method'], path, form or None)
+                except OSError:
+                    status, headers, body = 0, {}, ''
+                elapsed = time.perf_counter() - start
+                queries = QUERIES.search(headers.get('Server-Timing', ''))
+                failed = not expected(step, status, headers)
+                for variable, pattern in step.get('extract', {}).items():
+                    found = re.search(pattern, body)
+                    if found:
+                        variables[variable] = unescape_attribute(found.group(1))
+                    else:
+                        failed = True
+                samples[route_name(router, step['method'], path)].append(
+                    (elapsed, int(queries.group(1)) if queries else None, failed))
+                # Без извлечённого значения следующие шаги сценария не имеют смысла
+                if failed:
+                    break
+            scenarios[name] += 1
+        results[number] = (samples, scenarios)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    samples = defaultdict(list)
+    scenarios = Counter()
+    for worker_samples, worker_scenarios in results:
+        for route, values in worker_samples.items():
+            samples[route].extend(values)
+        scenarios.update(worker_scenarios)
+    return samples, scenarios, elapsed
+
+
+def _summary(values, elapsed):
+    latencies = sorted(value[0] * 1000 for value in values)
+    queries = [value[1] for value in values if value[1] is not None]
+    return {
+        'requests': len(values),
+        'errors': sum(1 for value in values if value[2]),
+        'throughput': round(len(values) / elapsed, 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries': round(sum(queries) / len(queries), 2) if queries else None
+    }
+
+
+def summarize(samples, elapsed):
+    return {
+        'total': _summary([value for values in samples.values() for value in values], elapsed),
+        'routes': {route: _summary(values, elapsed) for route, values in sorted(samples.items())}
+    }
+
+
+def print_report(target, report):
+    print(f"\n{target}: {report['total']['throughput']:.1f} запросов/с, сценарии {report['scenarios']}")
+    print(f"{'адрес':<28}{'запросов':>10}{'ошибок':>8}{'в сек':>9}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}"
+          f"{'SQL':>6}")
+    for route, row in list(report['routes'].items()) + [('всего', report['total'])]:
+        queries = '-' if row['queries'] is None else f"{row['queries']:.1f}"
+        print(f"{route:<28}{row['requests']:>10}{row['errors']:>8}{row['throughput']:>9.1f}{row['p50_ms']:>9.2f}"
+              f"{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}{queries:>6}")
+
+
+# Сравнение с прошлым запуском той же цели; возвращает число регрессий
+# Доля адресов в смеси случайна, поэтому пропускная способность сравнивается только в целом, а задержки - по адресам
+def compare(previous, report):
+    print(f"\nсравнение {report['target']} с запуском {previous.get('started')} ({previous.get('commit')}):")
+    rows = [(route, previous['routes'].get(route), row) for route, row in report['routes'].items()]
+    rows.append(('всего', previous['total'], report['total']))
+    regressions = 0
+    for route, old, row in rows:
+        if old is None or not old['p95_ms']:
+            continue
+        latency = row['p95_ms'] / old['p95_ms'] - 1
+        worse = latency > REGRESSION
+        line = f"{route:<28}p95 {latency:+.0%}"
+        if route == 'всего' and old['throughput']:
+            throughput = row['throughput'] / old['throughput'] - 1
+            worse = worse or throughput < -REGRESSION
+            line += f", запросов/с {throughput:+.0%}"
+        regressions += worse
+        print(line + ('  РЕГРЕССИЯ' if worse else ''))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест на воспроизведении сценариев')
+    parser.add_argument('--target', choices=('inprocess', 'server', 'both'), default='inprocess')
+    parser.add_argument('--items', type=int, default=seed.ITEMS)
+    parser.add_argument('--users', type=int, default=seed.USERS)
+    parser.add_argument('--duration', type=float, default=DURATION)
+    parser.add_argument('--warmup', type=float, default=WARMUP)
+    parser.add_argument('--concurrency', type=int, help='число одновременных посетителей')
+    parser.add_argument('--mixes', default=MIXES, help='JSON со сценариями и их весами')
+    parser.add_argument('--output', help='каталог для JSON с результатами', default=RESULTS_DIR)
+    parser.add_argument('--compare', help='JSON прошлого запуска той же цели')
+    args = parser.parse_args()
+
+    with open(args.mixes, encoding='utf-8') as mixes_file:
+        mixes = json.load(mixes_file)
+    database = seed.seed(items=args.items, users=args.users)
+    from main import create_app
+    app = create_app({'DATABASE_URL': database})
+    router = app.url_map.bind('localhost')
+    targets = ('inprocess', 'server') if args.target == 'both' else (args.target,)
+    os.makedirs(args.output, exist_ok=True)
+    regressions = 0
+    for target in targets:
+        concurrency = args.concurrency or CONCURRENCY[target]
+        server = None
+        if target == 'inprocess':
+            def make_client():
+                return InProcessClient(app)
+        else:
+            base_url = f'http://127.0.0.1:{PORT}'
+            env = dict(os.environ, PORT=str(PORT), DATABASE_URL=database)
+            server = subprocess.Popen(SERVER_COMMAND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+            def make_client():
+                return HttpClient(base_url)
+        try:
+            if server is not None:
+                wait_until_ready(base_url + '/')
+            # Прогрев: кэши, таблица цен и пул соединений заполняются до начала измерений
+            run(make_client, router, mixes, args.items, args.users, args.warmup, concurrency)
+            samples, scenarios, elapsed = run(make_client, router, mixes, args.items, args.users, args.duration,
+                                              concurrency)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        report = {'target': target, 'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(),
+                  'config': {'items': args.items, 'users': args.users, 'duration': args.duration,
+                             'concurrency': concurrency, 'mixes': os.path.basename(args.mixes)},
+                  'scenarios': dict(scenarios), **summarize(samples, elapsed)}
+        print_report(target, report)
+        path = os.path.join(args.output, f"{time.strftime('%Y%m%d-%H%M%S')}-{target}.json")
+        with open(path, 'w', encoding='utf-8') as results_file:
+            json.dump(report, results_file, ensure_ascii=False, indent=2)
+        print(f"результаты: {path}")
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as previous_file:
+                previous = json.load(previous_file)
+            if previous.get('target') == target:
+                regressions += compare(previous, report)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# Сравнение поиска через LIKE '%...%' и индекса FTS5 на синтетическом каталоге
+# Запуск из корня проекта: python -m benchmarks.search_bench
+import os
+import time
+import random
+import tempfile
+from data import db_session, search_index
+from data.item import Item
+
+ITEMS = 100_000
+CATEGORIES = 18
+REPEATS = 20
+WORDS = ('шкаф', 'стол', 'лампа', 'диван', 'кресло', 'полка', 'ковёр', 'зеркало', 'чайник', 'пушка',
+         'броня', 'патрон', 'ракета', 'планета', 'машина', 'книга', 'гитара', 'аптечка', 'камень', 'ключ')
+TERMS = ('шкаф', 'гитар', 'зеркало чайник', 'ракета')
+
+
+def like_search(db_sess, text, category_id):
+    query = db_sess.query(Item).filter(Item.name.like(f"%{text}%"))
+    if category_id is not None:
+        query = query.filter(Item.category == category_id)
+    return query.all()
+
+
+def measure(function):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function()
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def main():
+    random.seed(1)
+    db_session.global_init(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    db_sess = db_session.create_session()
+    db_sess.bulk_insert_mappings(Item, [
+        {'id': i, 'name': ' '.join(random.sample(WORDS, 3)), 'category': random.randint(1, CATEGORIES),
+         'description': ';'.join(random.sample(WORDS, 4)), 'photo_name': f'{i}.png'}
+        for i in range(1, ITEMS + 1)
+    ])
+    db_sess.commit()
+    print(f"товаров: {ITEMS}")
+    for term in TERMS:
+        for category_id in (None, 5):
+            like = measure(lambda: like_search(db_sess, term, category_id))
+            fts = measure(lambda: search_index.search(db_sess, term, category_id))
+            print(f"'{term}', категория {category_id}: LIKE {like:.2f} мс, FTS5 {fts:.2f} мс "
+                  f"(первая страница из {search_index.search(db_sess, term, category_id)[1]})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Временная база с синтетическим каталогом и пользователями для нагрузочных тестов
+# Магазины, категории и валюты копируются из db/store_database.db, товары и пользователи создаются заново
+# Запуск из корня проекта: python -m benchmarks.seed --items 10000 --users 1000 /tmp/bench.db
+import os
+import random
+import shutil
+import argparse
+import tempfile
+import sqlalchemy as sa
+from data import db_session, passwords
+from data.balance import Balance
+from data.currency import Currency
+from data.item import Item
+from data.user import User
+
+SOURCE = 'db/store_database.db'
+ITEMS = 10_000
+USERS = 1_000
+# Пароль всех синтетических пользователей
+PASSWORD = 'benchmark'
+# Начальный баланс в каждой валюте, чтобы оформление заказов не упиралось в нехватку средств
+BALANCE = 10 ** 9
+WORDS = ('шкаф', 'стол', 'лампа', 'диван', 'кресло', 'полка', 'ковёр', 'зеркало', 'чайник', 'пушка',
+         'броня', 'патрон', 'ракета', 'планета', 'машина', 'книга', 'гитара', 'аптечка', 'камень', 'ключ')
+# Таблицы, которые очищаются перед заполнением; порядок учитывает внешние ключи
+CLEARED_TABLES = ('idempotency_keys', 'order_totals', 'order_lines', 'orders', 'cart_lines', 'balances', 'users',
+                  'items')
+
+
+def user_email(number):
+    return f'user{number}@bench.test'
+
+
+# Копия базы из SOURCE с items товарами и users пользователями, возвращает путь к базе
+# Схема создаётся через db_session.global_init, поэтому в одном процессе можно заполнить только одну базу
+def seed(path=None, items=ITEMS, users=USERS, seed_value=1):
+    rng = random.Random(seed_value)
+    path = path or os.path.join(tempfile.mkdtemp(), 'store_database.db')
+    shutil.copy(SOURCE, path)
+    db_session.global_init(path)
+    db_sess = db_session.create_session()
+    try:
+        photos = [name for name, in db_sess.query(Item.photo_name).filter(Item.photo_name.isnot(None))]
+        categories = [category for category, in db_sess.query(Item.category).distinct()]
+        currency_ids = [currency_id for currency_id, in db_sess.query(Currency.id)]
+        for table in CLEARED_TABLES:
+            db_sess.execute(sa.text(f'DELETE FROM {table}'))
+        db_sess.bulk_insert_mappings(Item, [
+            {'id': i, 'name': ' '.join(rng.sample(WORDS, 2)).capitalize(), 'category': rng.choice(categories),
+             'description': ';'.join(rng.sample(WORDS, 3)), 'photo_name': rng.choice(photos),
+             'special_price': rng.randint(1, 1000) if i % 50 == 0 else None,
+             'special_currency': rng.choice(currency_ids) if i % 50 == 0 else None}
+            for i in range(1, items + 1)
+        ])
+        # Хэш пароля считается один раз: scrypt для каждого из тысяч пользователей занял бы минуты
+        hashed = passwords.hash_password(PASSWORD)
+        db_sess.bulk_insert_mappings(User, [
+            {'id': i, 'email': user_email(i), 'name': f'Пользователь {i}', 'surname': 'Тестовый', 'age': 30,
+             'address': 'Москва', 'hashed_password': hashed, 'got_bonus': False}
+            for i in range(1, users + 1)
+        ])
+        db_sess.bulk_insert_mappings(Balance, [
+            {'user_id': i, 'currency_id': currency_id, 'amount': BALANCE}
+            for i in range(1, users + 1) for currency_id in currency_ids
+        ])
+        db_sess.commit()
+    finally:
+        db_sess.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Временная база для нагрузочных тестов')
+    parser.add_argument('path', nargs='?')
+    parser.add_argument('--items', type=int, default=ITEMS)
+    parser.add_argument('--users', type=int, default=USERS)
+    args = parser.parse_args()
+    path = seed(args.path, args.items, args.users)
+    print(f"база {path}: товаров {args.items}, пользователей {args.users}, пароль '{PASSWORD}'")
+
+
+if __name__ == '__main__':
+    main()
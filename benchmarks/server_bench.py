@@ -0,0 +1,82 @@
+# Сравнение пропускной способности сервера разработки (python main.py) и gunicorn (wsgi.py)
+# Запуск из корня проекта: python -m benchmarks.server_bench
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from urllib.parse import quote
+
+PORT = 8765
+DURATION = 10
+CONCURRENCY = 16
+PATHS = ('/', '/item/5', '/search?name=' + quote('стол') + '&category=' + quote('Всё'))
+SERVERS = {
+    'werkzeug': [sys.executable, 'main.py'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+}
+
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Сервер {url} не запустился')
+
+
+# Запросы к каждому адресу из PATHS по кругу из CONCURRENCY потоков
+def load(base_url):
+    counts = {path: 0 for path in PATHS}
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + DURATION
+
+    def worker(offset):
+        number = offset
+        while time.monotonic() < deadline:
+            path = PATHS[number % len(PATHS)]
+            number += 1
+            try:
+                urllib.request.urlopen(base_url + path, timeout=10).read()
+            except OSError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                counts[path] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(CONCURRENCY)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts, errors[0]
+
+
+def main():
+    database = os.path.join(tempfile.mkdtemp(), 'store_database.db')
+    shutil.copy('db/store_database.db', database)
+    env = dict(os.environ, PORT=str(PORT), DATABASE_URL=database)
+    base_url = f'http://127.0.0.1:{PORT}'
+    for name, command in SERVERS.items():
+        server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(base_url + '/')
+            counts, errors = load(base_url)
+        finally:
+            server.terminate()
+            server.wait()
+        total = sum(counts.values())
+        details = ', '.join(f'{path} {count / DURATION:.0f}/с' for path, count in counts.items())
+        print(f"{name}: {total / DURATION:.0f} запросов/с ({details}), ошибок {errors}")
+
+
+if __name__ == '__main__':
+    main()
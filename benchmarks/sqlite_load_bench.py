@@ -0,0 +1,82 @@
+# Нагрузочный тест SQLite с несколькими процессами: настройки по умолчанию против профиля WAL
+# Запуск из корня проекта: python -m benchmarks.sqlite_load_bench
+import os
+import time
+import random
+import tempfile
+import multiprocessing
+from sqlalchemy.exc import OperationalError
+
+WORKERS = (1, 2, 4)
+DURATION = 3
+ITEMS = 1000
+USERS = 100
+# Доля операций записи
+WRITE_SHARE = 0.2
+
+
+def seed(path):
+    from data import db_session
+    from data.currency import Currency
+    from data.item import Item
+    from data.user import User
+    db_session.global_init(path, sqlite_pragmas={})
+    db_sess = db_session.create_session()
+    db_sess.add(Currency(id=1, name='bench', logotype='bench.png', is_integer=False))
+    db_sess.add_all(Item(id=i, name=f'item {i}', category=1, description='a;b', photo_name=f'{i}.png')
+                    for i in range(1, ITEMS + 1))
+    db_sess.add_all(User(id=i, name=f'user {i}', got_bonus=0) for i in range(1, USERS + 1))
+    db_sess.commit()
+
+
+def worker(path, pragmas, results):
+    from data import db_session, account_store
+    from data.item import Item
+    db_session.global_init(path, sqlite_pragmas=pragmas)
+    reads = writes = errors = 0
+    deadline = time.monotonic() + DURATION
+    while time.monotonic() < deadline:
+        db_sess = db_session.create_session()
+        user_id = random.randint(1, USERS)
+        try:
+            if random.random() < WRITE_SHARE:
+                account_store.add_to_cart(db_sess, user_id, random.randint(1, ITEMS), 1, 1.0)
+                writes += 1
+            else:
+                db_sess.query(Item).get(random.randint(1, ITEMS))
+                account_store.get_cart(db_sess, user_id)
+                reads += 1
+        except OperationalError:
+            errors += 1
+        finally:
+            db_sess.close()
+    results.put((reads, writes, errors))
+
+
+def run(context, pragmas, workers):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    process = context.Process(target=seed, args=(path,))
+    process.start()
+    process.join()
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(path, pragmas, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    totals = [sum(values) for values in zip(*(results.get() for _ in processes))]
+    for process in processes:
+        process.join()
+    return totals
+
+
+def main():
+    from data.db_session import SQLITE_PRAGMAS
+    context = multiprocessing.get_context('spawn')
+    for name, pragmas in (('по умолчанию', {'busy_timeout': 5000}), ('WAL', SQLITE_PRAGMAS)):
+        for workers in WORKERS:
+            reads, writes, errors = run(context, pragmas, workers)
+            print(f"{name}, процессов {workers}: чтений {reads / DURATION:.0f}/с, записей {writes / DURATION:.0f}/с, "
+                  f"ошибок блокировки {errors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# Холодный запуск: время импорта, создания приложения и прогрева и задержка первых запросов к страницам
+# в новом процессе без прогрева, с прогревом и пустым кэшем байт-кода шаблонов и с прогревом и готовым кэшем,
+# а также время от запуска gunicorn до готовности /healthz
+# Запуск из корня проекта: python -m benchmarks.startup_bench
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+RUNS = 5
+PORT = 8767
+PATHS = ('/', '/item/5', '/search', '/search?name=стол&category=Всё', '/login', '/register', '/faq',
+         '/delivery_info')
+SERVER_COMMAND = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+
+
+# Один запуск в отдельном процессе: выводит JSON с временем этапов и первых запросов
+def child(warm):
+    start = time.perf_counter()
+    import main
+    from data import startup
+    imported = time.perf_counter()
+    app = main.create_app()
+    created = time.perf_counter()
+    if warm:
+        startup.warm(app)
+    warmed = time.perf_counter()
+    client = app.test_client()
+    first = dict()
+    for path in PATHS:
+        request_start = time.perf_counter()
+        client.get(path)
+        first[path] = time.perf_counter() - request_start
+    print(json.dumps({'import': imported - start, 'create_app': created - imported, 'warm': warmed - created,
+                      'first_requests': sum(first.values()), 'slowest': max(first.values())}))
+
+
+def run_child(warm, env):
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.startup_bench', '--child', str(int(warm))],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(label, runs):
+    values = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+    print(f"{label:<34}{values['import']:>8.0f}{values['create_app']:>8.0f}{values['warm']:>8.0f}"
+          f"{values['first_requests']:>10.1f}{values['slowest']:>9.1f}")
+
+
+# Время от запуска gunicorn до первого ответа 200 на /healthz
+def time_to_ready(env):
+    server = subprocess.Popen(SERVER_COMMAND, env=dict(env, PORT=str(PORT)), stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    start = time.perf_counter()
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{PORT}/healthz', timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        child(sys.argv[2] == '1')
+        return
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'store_database.db')
+    shutil.copy('db/store_database.db', database)
+    templates = os.path.join(directory, 'templates')
+    env = dict(os.environ, DATABASE_URL=database, TEMPLATE_CACHE_DIR=templates, JOB_WORKERS='0')
+    # Первый запуск записывает схему и отпечаток в базу, чтобы все варианты сравнивались на готовой базе
+    run_child(False, env)
+    print(f"медиана {RUNS} запусков, мс{'импорт':>10}{'create':>8}{'прогрев':>8}{'первые':>10}{'худший':>9}")
+    report('без прогрева', [run_child(False, env) for _ in range(RUNS)])
+    cold = []
+    for _ in range(RUNS):
+        shutil.rmtree(templates, ignore_errors=True)
+        cold.append(run_child(True, env))
+    report('прогрев, пустой кэш шаблонов', cold)
+    report('прогрев, готовый кэш шаблонов', [run_child(True, env) for _ in range(RUNS)])
+    ready = [time_to_ready(dict(env, WEB_WORKERS='2')) for _ in range(3)]
+    print(f'gunicorn, 2 воркера: готов к приёму запросов (/healthz 200) через {statistics.median(ready):.2f} с')
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Статические файлы главной страницы при первом и повторном посещении:
+# обычный обработчик /static/ против копий с хэшем из /assets/
+# Запуск из корня проекта после python build_images.py и python build_assets.py: python -m benchmarks.static_bench
+import os
+import re
+import time
+import shutil
+import tempfile
+from data import assets, images
+
+VISITS = 50
+ACCEPT_ENCODING = 'br, gzip'
+
+
+# Исходный путь в static для каждого файла из /assets/
+def source_paths():
+    sources = {entry['file']: path for path, entry in assets.get_manifest().items()}
+    for name, entry in images.get_manifest().items():
+        for path in entry['files'].values():
+            sources[path] = f'img/{name}'
+    return sources
+
+
+def transfer_size(response):
+    headers = sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+    return headers + len(response.get_data())
+
+
+# Первое посещение: все файлы без кэша
+# Повторное: файлы без immutable браузер проверяет условными запросами, файлы с immutable берёт из кэша без запроса
+def visit(client, urls, validators=None):
+    size = 0
+    requests = 0
+    start = time.perf_counter()
+    for url in urls:
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if validators is not None:
+            if validators[url] is None:
+                continue
+            headers['If-None-Match'] = validators[url]
+        response = client.get(url, headers=headers)
+        requests += 1
+        size += transfer_size(response)
+    return size, requests, (time.perf_counter() - start) * 1000
+
+
+def measure(client, urls, immutable):
+    first_size, first_requests, first_time = visit(client, urls)
+    validators = {url: None if immutable else client.get(url).headers.get('ETag') for url in urls}
+    repeat_size = repeat_requests = repeat_time = 0
+    for _ in range(VISITS):
+        size, requests, elapsed = visit(client, urls, validators)
+        repeat_size += size
+        repeat_requests += requests
+        repeat_time += elapsed
+    print(f"  первое посещение: {first_requests} запросов, {first_size / 1024:.1f} КБ, {first_time:.2f} мс")
+    print(f"  повторное посещение: {repeat_requests / VISITS:.0f} запросов, {repeat_size / VISITS / 1024:.1f} КБ, "
+          f"{repeat_time / VISITS:.2f} мс")
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'bench.db')
+    shutil.copyfile('db/store_database.db', database)
+    from main import create_app
+    client = create_app({'DATABASE_URL': database, 'TESTING': True}).test_client()
+    page = client.get('/').get_data(as_text=True)
+    urls = sorted(set(re.findall(r'(?:src|href)="(/assets/[^"]+)"', page)))
+    if not urls:
+        print("Копии не найдены, сначала выполните python build_images.py и python build_assets.py")
+        return
+    sources = source_paths()
+    static_urls = [f"/static/{sources[url[len('/assets/'):]]}" for url in urls]
+    print(f"Файлов на главной странице: {len(urls)}")
+    print("/static/ (исходные файлы, условные запросы):")
+    measure(client, static_urls, immutable=False)
+    print("/assets/ (копии с хэшем, immutable, сжатые варианты):")
+    measure(client, urls, immutable=True)
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
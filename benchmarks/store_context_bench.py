@@ -0,0 +1,48 @@
+# Накладные расходы на настройки магазина в каждом запросе: прежние url_for против store_context
+# Запуск из корня проекта: python -m benchmarks.store_context_bench
+import os
+import time
+import tempfile
+from flask import Flask, url_for
+from data import db_session
+from data.store import Store
+from data.store_context import get_store_settings
+
+CALLS = 100_000
+
+
+# Прежний вариант: четыре поля и два url_for при каждом вызове
+def old_store_settings(store):
+    store_settings = dict()
+    store_settings['title'] = store.name
+    store_settings['slogan'] = store.slogan
+    store_settings['logotype'] = url_for('static', filename=f'img/logotypes/{store.logotype}')
+    store_settings['icon'] = url_for('static', filename=f'img/icons/{store.icon}')
+    return store_settings
+
+
+def measure(function):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        function()
+    return (time.perf_counter() - start) / CALLS * 1_000_000
+
+
+def main():
+    db_session.global_init(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    db_sess = db_session.create_session()
+    db_sess.add_all(Store(id=i, name=f'store {i}', slogan='slogan', logotype=f'{i}.png', icon=f'{i}.png')
+                    for i in range(1, 6))
+    db_sess.commit()
+    store = db_sess.query(Store).first()
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), '..', 'static'))
+    app.config['SECRET_KEY'] = 'bench'
+    with app.test_request_context():
+        get_store_settings()
+        old = measure(lambda: old_store_settings(store))
+        new = measure(get_store_settings)
+    print(f"url_for при каждом запросе: {old:.2f} мкс, store_context: {new:.2f} мкс на вызов")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Выбор товаров для главной страницы: прежние загрузка и перемешивание всего каталога против storefront
+# Запуск из корня проекта: python -m benchmarks.storefront_bench
+import os
+import time
+import random
+import tempfile
+from array import array
+import sqlalchemy as sa
+from data import db_session, storefront
+from data.item import Item
+
+SIZES = (58, 10_000, 1_000_000)
+# Прежний вариант на миллионе товаров занимает секунды, поэтому число повторов ограничено
+REPEATS = {58: 200, 10_000: 20, 1_000_000: 1}
+
+
+# Прежний вариант: все товары, перемешивание и четверть списка
+def old_storefront(db_sess):
+    items = db_sess.query(Item).all()
+    random.shuffle(items)
+    items = items[:len(items) // 4]
+    special_offer = items.pop()
+    special_offer.description.split(';')
+    db_sess.expunge_all()
+    return items, special_offer
+
+
+# Выбор средствами базы данных: просматривает всю таблицу при каждом запросе
+def sample_from_sql(db_sess, k):
+    return [i for i, in db_sess.query(Item.id).order_by(sa.func.random()).limit(k)]
+
+
+def measure(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    db_session.global_init(os.path.join(directory, 'bench.db'))
+    db_sess = db_session.create_session()
+    inserted = 0
+    for size in SIZES:
+        db_sess.bulk_insert_mappings(Item, [
+            {'id': i, 'name': f'item {i}', 'category': 1, 'description': 'a;b;c', 'photo_name': f'{i}.png'}
+            for i in range(inserted + 1, size + 1)
+        ])
+        db_sess.commit()
+        inserted = size
+        k = storefront.storefront_size(size)
+        ids = array('l', range(1, size + 1))
+        repeats = REPEATS[size]
+        old = measure(lambda: old_storefront(db_sess), repeats)
+        memory = measure(lambda: storefront.sample_from_array(ids, k), repeats * 100)
+        sql = measure(lambda: sample_from_sql(db_sess, k), repeats)
+        print(f"товаров {size}: загрузка и перемешивание {old:.3f} мс, массив в памяти {memory:.3f} мс, "
+              f"ORDER BY RANDOM() {sql:.3f} мс (k = {k})")
+
+
+if __name__ == '__main__':
+    main()
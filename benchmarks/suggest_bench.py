@@ -0,0 +1,63 @@
+# Подсказки поиска: построение индекса префиксов и время одного запроса против просмотра всех названий
+# Запуск из корня проекта: python -m benchmarks.suggest_bench
+import time
+import random
+from data import suggest
+from data.catalog import Catalog, ItemRecord, CategoryRecord
+from benchmarks.seed import WORDS
+
+SIZES = (1_000, 100_000, 1_000_000)
+LOOKUPS = 10_000
+SCANS = 20
+ADJECTIVES = ('большой', 'малый', 'красный', 'Ёмкий', 'старый', 'новый', 'дубовый', 'стальной', 'лёгкий', 'умный')
+
+
+def make_catalog(size):
+    rng = random.Random(1)
+    items = [ItemRecord(id=i, name=f'{rng.choice(ADJECTIVES).capitalize()} {rng.choice(WORDS)} {i}', category=1,
+                        description='', properties=(), short_description='', special_price=None,
+                        special_currency=None, photo_name='', photo_url='', card_url='')
+             for i in range(1, size + 1)]
+    return Catalog(1, items, [], [CategoryRecord(id=1, name='Мебель')], [])
+
+
+# Прежний способ без индекса: проверка каждого названия
+def scan(catalog, prefix, limit):
+    found = []
+    for item in catalog.item_list:
+        if any(word.startswith(prefix) for word in suggest.fold(item.name).split()):
+            found.append(item.id)
+            if len(found) == limit:
+                break
+    return found
+
+
+def main():
+    rng = random.Random(2)
+    for size in SIZES:
+        catalog = make_catalog(size)
+        start = time.perf_counter()
+        index = suggest.SuggestIndex(catalog)
+        build = time.perf_counter() - start
+        words = [suggest.fold(rng.choice(ADJECTIVES + WORDS)) for _ in range(LOOKUPS)]
+        prefixes = [word[:rng.randint(1, len(word))] for word in words]
+        start = time.perf_counter()
+        for prefix in prefixes:
+            index.items.search(prefix, suggest.LIMIT)
+        lookup = (time.perf_counter() - start) / LOOKUPS * 1e6
+        # Редкое сочетание, при котором просмотр доходит почти до конца списка
+        rare = suggest.fold(f'{size}')
+        start = time.perf_counter()
+        for _ in range(SCANS):
+            scan(catalog, rare, suggest.LIMIT)
+        linear = (time.perf_counter() - start) / SCANS * 1e6
+        start = time.perf_counter()
+        for _ in range(SCANS):
+            index.items.search(rare, suggest.LIMIT)
+        indexed = (time.perf_counter() - start) / SCANS * 1e6
+        print(f"названий {size}: ключей {len(index.items)}, построение {build:.2f} с, "
+              f"запрос {lookup:.1f} мкс; редкий префикс: просмотр {linear / 1000:.1f} мс, индекс {indexed:.1f} мкс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+import gzip
+import json
+import shutil
+import hashlib
+from data.assets import BUILD_FOLDER, MANIFEST_PATH
+
+# Файлы и папки static, для которых собираются копии с хэшем в имени
+# Фото товаров и значки валют отдаются копиями из build_images.py
+SOURCES = ('css', 'js', 'img/logotypes', 'img/icons', 'img/arrow.png', 'img/delivery.png', 'img/exchange.png',
+           'img/faq.png', 'img/login.png', 'img/order.png', 'img/shopping_cart.png')
+# Текстовые файлы, для которых заранее собираются сжатые варианты; изображения уже сжаты
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt')
+
+
+def compress(data):
+    variants = {'gzip': ('gz', gzip.compress(data, compresslevel=9, mtime=0))}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants['br'] = ('br', brotli.compress(data, quality=11))
+    return variants
+
+
+def source_files(static_folder):
+    for source in SOURCES:
+        path = os.path.join(static_folder, source)
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                yield f'{source}/{filename}'
+        else:
+            yield source
+
+
+# Копии файлов с именем <name>.<хэш>.<ext> и их сжатые варианты .gz и .br, если сжатый файл меньше исходного
+def build(static_folder='static'):
+    output = os.path.join(static_folder, BUILD_FOLDER)
+    os.makedirs(output, exist_ok=True)
+    manifest = dict()
+    for path in source_files(static_folder):
+        source = os.path.join(static_folder, path)
+        with open(source, 'rb') as source_file:
+            data = source_file.read()
+        stem, extension = os.path.splitext(os.path.basename(path))
+        name = f'{stem}.{hashlib.sha1(data).hexdigest()[:12]}{extension}'
+        entry = {'file': f'{BUILD_FOLDER}/{name}', 'encodings': [], 'bytes': {'original': len(data)}}
+        target = os.path.join(output, name)
+        if not os.path.exists(target):
+            shutil.copyfile(source, target)
+        if extension in COMPRESSIBLE:
+            for encoding, (suffix, compressed) in compress(data).items():
+                if len(compressed) < len(data):
+                    with open(f'{target}.{suffix}', 'wb') as compressed_file:
+                        compressed_file.write(compressed)
+                    entry['encodings'].append(encoding)
+                    entry['bytes'][encoding] = len(compressed)
+        manifest[path] = entry
+    # Удаление копий, которые больше не упоминаются в манифесте
+    used = {os.path.basename(entry['file']) for entry in manifest.values()}
+    for name in os.listdir(output):
+        original = name[:-3] if name.endswith(('.gz', '.br')) else name
+        if original not in used and name != os.path.basename(MANIFEST_PATH):
+            os.remove(os.path.join(output, name))
+    with open(os.path.join(output, os.path.basename(MANIFEST_PATH)), 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    return manifest
+
+
+def main():
+    manifest = build()
+    print(f"Собрано файлов: {len(manifest)}")
+    for path, entry in manifest.items():
+        sizes = ', '.join(f"{encoding} {size} Б" for encoding, size in entry['bytes'].items())
+        print(f"  {path} -> {entry['file']} ({sizes})")
+
+
+if __name__ == '__main__':
+    main()
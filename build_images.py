@@ -0,0 +1,103 @@
+import os
+import io
+import json
+import hashlib
+from data.images import DERIVED_FOLDER, MANIFEST_PATH, VARIANTS
+
+# Папки static/img, для которых собираются уменьшенные копии
+FOLDERS = ('items', 'currencies')
+QUALITY = 80
+# Фон страниц, на который накладываются прозрачные части изображений при сохранении в JPEG без прозрачности
+BACKGROUND = (255, 255, 255)
+
+
+def encode(image, webp):
+    buffer = io.BytesIO()
+    if webp:
+        image.save(buffer, 'WEBP', quality=QUALITY, method=4)
+    else:
+        if image.mode in ('RGBA', 'LA'):
+            # Без наложения на фон convert('RGB') делает прозрачные части значков и логотипов чёрными
+            from PIL import Image
+            flat = Image.new('RGB', image.size, BACKGROUND)
+            flat.paste(image, mask=image.getchannel('A'))
+            image = flat
+        image.convert('RGB').save(buffer, 'JPEG', quality=QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+# Сборка копий каждого размера в WebP (или JPEG, если Pillow собран без WebP)
+# Имя копии содержит хэш содержимого, поэтому её можно кэшировать навсегда
+# Если копия не меньше исходного файла, в манифест записывается исходный файл
+# Изображения, которые не изменились с прошлой сборки, повторно не обрабатываются
+def build(static_folder='static'):
+    try:
+        from PIL import Image, features
+    except ImportError:
+        raise SystemExit('Для сборки изображений необходим Pillow: pip install Pillow')
+    webp = features.check('webp')
+    extension = 'webp' if webp else 'jpg'
+    output = os.path.join(static_folder, DERIVED_FOLDER)
+    os.makedirs(output, exist_ok=True)
+    manifest_path = os.path.join(output, os.path.basename(MANIFEST_PATH))
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+            previous = json.load(manifest_file)
+    except (OSError, ValueError):
+        previous = dict()
+    manifest = dict()
+    for folder in FOLDERS:
+        for filename in sorted(os.listdir(os.path.join(static_folder, 'img', folder))):
+            source = os.path.join(static_folder, 'img', folder, filename)
+            with open(source, 'rb') as source_file:
+                source_hash = hashlib.sha1(source_file.read()).hexdigest()
+            entry = previous.get(f'{folder}/{filename}')
+            if entry and entry.get('source') == source_hash and all(
+                    os.path.exists(os.path.join(static_folder, path)) for path in entry['files'].values()):
+                manifest[f'{folder}/{filename}'] = entry
+                continue
+            try:
+                original = Image.open(source)
+                original.load()
+            except OSError:
+                # Векторные и нераспознанные файлы отдаются как есть
+                continue
+            # Палитра и другие режимы приводятся к RGBA, чтобы прозрачность сохранилась до encode
+            if original.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                original = original.convert('RGBA')
+            entry = {'source': source_hash, 'files': dict(), 'bytes': {'original': os.path.getsize(source)}}
+            for variant, size in VARIANTS.items():
+                image = original.copy()
+                image.thumbnail((size, size))
+                data = encode(image, webp)
+                if len(data) >= entry['bytes']['original']:
+                    entry['files'][variant] = f'img/{folder}/{filename}'
+                    entry['bytes'][variant] = entry['bytes']['original']
+                    continue
+                name = f'{os.path.splitext(filename)[0]}.{variant}.{hashlib.sha1(data).hexdigest()[:12]}.{extension}'
+                with open(os.path.join(output, name), 'wb') as derived:
+                    derived.write(data)
+                entry['files'][variant] = f'{DERIVED_FOLDER}/{name}'
+                entry['bytes'][variant] = len(data)
+            manifest[f'{folder}/{filename}'] = entry
+    # Удаление копий, которые больше не упоминаются в манифесте
+    used = {os.path.basename(path) for entry in manifest.values() for path in entry['files'].values()}
+    for name in os.listdir(output):
+        if name not in used and name != os.path.basename(MANIFEST_PATH):
+            os.remove(os.path.join(output, name))
+    with open(manifest_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    return manifest
+
+
+def main():
+    manifest = build()
+    original = sum(entry['bytes']['original'] for entry in manifest.values())
+    print(f"Обработано изображений: {len(manifest)}, исходный размер {original / 1024 / 1024:.1f} МБ")
+    for variant in VARIANTS:
+        total = sum(entry['bytes'][variant] for entry in manifest.values())
+        print(f"  {variant}: {total / 1024 / 1024:.1f} МБ")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import os
+import time
+import argparse
+from data import db_session, recommendations
+from data.item import Item
+
+
+# Пакетный расчёт похожих товаров для страниц товаров
+# Без --full пересчитываются только изменившиеся с прошлого расчёта товары и товары, которым они были похожи
+# Такой пересчёт приближённый (веса слов общие для каталога), поэтому полный расчёт нужно запускать периодически,
+# например раз в сутки
+def build(database, full=False):
+    db_session.global_init(database)
+    db_sess = db_session.create_session()
+    try:
+        rows = db_sess.query(Item.id, Item.category, Item.description).order_by(Item.id).all()
+    finally:
+        db_sess.close()
+    previous = None if full else recommendations.load(mmap_mode=None)
+    start = time.perf_counter()
+    table, recomputed = recommendations.build(rows, previous)
+    recommendations.save(table)
+    print(f"товаров {len(rows)}, пересчитано {recomputed}, {time.perf_counter() - start:.2f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Расчёт похожих товаров')
+    parser.add_argument('--full', action='store_true', help='пересчитать таблицу целиком')
+    parser.add_argument('--database', default=os.environ.get('DATABASE_URL', 'db/store_database.db'))
+    args = parser.parse_args()
+    build(args.database, args.full)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,2 @@
-from . import store, item, currency, category, user
\ No newline at end of file
+from . import store, item, currency, category, user, balance, cart_line, order, order_line, order_total, \
+    catalog_version, search_index, idempotency_key, job
\ No newline at end of file
@@ -0,0 +1,22 @@
+from . import jobs, account_store, user_cache
+from .currency import Currency
+
+# Сколько начислений бонуса воркер выполняет одной транзакцией
+BONUS_BATCH = 50
+
+
+# Пустой счёт нового пользователя по всем валютам; валюты, по которым строка счёта уже есть, пропускаются
+@jobs.task('accounts.create', queue='accounts')
+def create_account(db_sess, user_id):
+    existing = {balance.currency_id for balance in account_store.get_balances(db_sess, user_id)}
+    currency_ids = [i for i, in db_sess.query(Currency.id) if i not in existing]
+    account_store.create_account(db_sess, user_id, currency_ids)
+
+
+# Однократный бонус: флаг got_bonus и начисления меняются в транзакции задачи
+# Ключи grants после JSON - строки, поэтому идентификаторы валют приводятся к числам
+# Начисления - короткие записи, поэтому готовые задачи выполняются пачками с одним коммитом на пачку
+@jobs.task('accounts.bonus', queue='bonus', batch=BONUS_BATCH)
+def grant_bonus(db_sess, user_id, grants):
+    if account_store.apply_bonus(db_sess, user_id, {int(i): amount for i, amount in grants.items()}):
+        jobs.after_commit(db_sess, lambda: user_cache.invalidate(user_id))
@@ -0,0 +1,267 @@
+import os
+import json
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from .balance import Balance
+from .cart_line import CartLine
+from .order import Order
+from .order_line import OrderLine
+from .order_total import OrderTotal
+from .user import User
+
+# Поля, общие для позиции корзины и позиции заказа
+LINE_FIELDS = ('item_id', 'currency_id', 'price', 'discount', 'discount_price')
+# Число заказов на странице истории и в одном запросе выгрузки
+ORDERS_PER_PAGE = 20
+EXPORT_BATCH = 500
+
+
+# Стоимость позиции с учётом скидки
+def line_cost(line):
+    return line.discount_price if line.discount_price is not None else line.price
+
+
+# Значение из запроса или json-файла, где отсутствие записано строкой 'None'
+def parse_optional(value, kind=float):
+    if value is None or value == 'None':
+        return None
+    return kind(value)
+
+
+# Сумма цен по каждой валюте
+def summarize(lines):
+    summary = dict()
+    for line in lines:
+        summary[line.currency_id] = summary.get(line.currency_id, 0) + line_cost(line)
+    return summary
+
+
+# Зачисление денег на счёт, строка счёта создаётся при необходимости
+def _deposit(db_sess: Session, user_id, currency_id, amount):
+    updated = db_sess.query(Balance).filter(
+        Balance.user_id == user_id, Balance.currency_id == currency_id
+    ).update({Balance.amount: Balance.amount + amount}, synchronize_session=False)
+    if not updated:
+        db_sess.add(Balance(user_id=user_id, currency_id=currency_id, amount=amount))
+        db_sess.flush()
+
+
+# Списание денег со счёта, только если их достаточно
+def _withdraw(db_sess: Session, user_id, currency_id, amount):
+    return db_sess.query(Balance).filter(
+        Balance.user_id == user_id, Balance.currency_id == currency_id, Balance.amount >= amount
+    ).update({Balance.amount: Balance.amount - amount}, synchronize_session=False) == 1
+
+
+# Создание пустого счёта по всем валютам
+# Вызывается внутри транзакции регистрации, коммит делает вызывающий код
+def create_account(db_sess: Session, user_id, currency_ids):
+    for currency_id in currency_ids:
+        db_sess.add(Balance(user_id=user_id, currency_id=currency_id, amount=0))
+
+
+def get_balances(db_sess: Session, user_id):
+    return db_sess.query(Balance).filter(Balance.user_id == user_id).order_by(Balance.currency_id).all()
+
+
+def add_to_cart(db_sess: Session, user_id, item_id, currency_id, price, discount=None, discount_price=None):
+    line = CartLine(user_id=user_id, item_id=item_id, currency_id=currency_id, price=price,
+                    discount=discount, discount_price=discount_price)
+    db_sess.add(line)
+    db_sess.commit()
+    return line
+
+
+# Добавление нескольких позиций одной транзакцией
+# lines - объекты с полями LINE_FIELDS, например цены из data/pricing.py
+def add_lines(db_sess: Session, user_id, lines):
+    cart_lines = [CartLine(user_id=user_id, **{field: getattr(line, field) for field in LINE_FIELDS})
+                  for line in lines]
+    db_sess.add_all(cart_lines)
+    db_sess.commit()
+    return cart_lines
+
+
+def get_cart(db_sess: Session, user_id):
+    return db_sess.query(CartLine).filter(CartLine.user_id == user_id).order_by(CartLine.id).all()
+
+
+# Сумма корзины по каждой валюте, посчитанная базой данных
+def get_cart_totals(db_sess: Session, user_id):
+    cost = sa.func.coalesce(CartLine.discount_price, CartLine.price)
+    return dict(db_sess.query(CartLine.currency_id, sa.func.sum(cost)).filter(
+        CartLine.user_id == user_id).group_by(CartLine.currency_id).order_by(CartLine.currency_id).all())
+
+
+# Удаление позиции корзины по её идентификатору
+def remove_line(db_sess: Session, user_id, line_id):
+    deleted = db_sess.query(CartLine).filter(
+        CartLine.id == line_id, CartLine.user_id == user_id
+    ).delete(synchronize_session=False)
+    db_sess.commit()
+    return deleted == 1
+
+
+# Однократное начисление бонуса без коммита: флаг got_bonus и счёт меняются в транзакции вызывающего,
+# например задачи accounts.bonus
+def apply_bonus(db_sess: Session, user_id, grants):
+    flagged = db_sess.query(User).filter(
+        User.id == user_id, sa.or_(User.got_bonus.is_(None), User.got_bonus == 0)
+    ).update({User.got_bonus: 1}, synchronize_session=False)
+    if not flagged:
+        return False
+    for currency_id, amount in grants.items():
+        _deposit(db_sess, user_id, currency_id, amount)
+    return True
+
+
+# Оформление заказа из корзины
+# Возвращает идентификатор заказа или None, если средств недостаточно
+def checkout(db_sess: Session, user_id):
+    lines = get_cart(db_sess, user_id)
+    line_ids = [line.id for line in lines]
+    summary = summarize(lines)
+    # Позиции удаляются по идентификаторам, чтобы параллельный заказ той же корзины не прошёл дважды
+    if line_ids:
+        deleted = db_sess.query(CartLine).filter(CartLine.id.in_(line_ids)).delete(synchronize_session=False)
+        if deleted != len(line_ids):
+            db_sess.rollback()
+            return None
+    for currency_id, amount in summary.items():
+        if not _withdraw(db_sess, user_id, currency_id, amount):
+            db_sess.rollback()
+            return None
+    order = Order(user_id=user_id)
+    db_sess.add(order)
+    db_sess.flush()
+    db_sess.add_all(OrderLine(order_id=order.id, **{field: getattr(line, field) for field in LINE_FIELDS})
+                    for line in lines)
+    db_sess.add_all(OrderTotal(order_id=order.id, currency_id=currency_id, amount=amount)
+                    for currency_id, amount in summary.items())
+    db_sess.commit()
+    return order.id
+
+
+# Страница истории заказов от новых к старым, начиная с заказов старше before
+# Выборка идёт по индексу user_id (в SQLite он включает id) и не зависит от числа заказов на предыдущих страницах
+# Возвращает идентификаторы заказов и before для следующей страницы (None, если страница последняя)
+def get_orders_page(db_sess: Session, user_id, before=None, limit=ORDERS_PER_PAGE):
+    query = db_sess.query(Order.id).filter(Order.user_id == user_id)
+    if before is not None:
+        query = query.filter(Order.id < before)
+    order_ids = [i for i, in query.order_by(Order.id.desc()).limit(limit + 1)]
+    if len(order_ids) > limit:
+        return order_ids[:limit], order_ids[limit - 1]
+    return order_ids, None
+
+
+# Суммы заказов по валютам: {order_id: {currency_id: amount}}
+def get_order_totals(db_sess: Session, order_ids):
+    totals = {order_id: dict() for order_id in order_ids}
+    if order_ids:
+        for total in db_sess.query(OrderTotal).filter(OrderTotal.order_id.in_(order_ids)).order_by(
+                OrderTotal.order_id, OrderTotal.currency_id):
+            totals[total.order_id][total.currency_id] = total.amount
+    return totals
+
+
+# Все заказы пользователя с позициями, от старых к новым
+# Генератор читает заказы пачками по batch, поэтому расход памяти не зависит от числа заказов
+def iter_orders(db_sess: Session, user_id, batch=EXPORT_BATCH):
+    after = 0
+    while True:
+        order_ids = [i for i, in db_sess.query(Order.id).filter(
+            Order.user_id == user_id, Order.id > after).order_by(Order.id).limit(batch)]
+        if not order_ids:
+            return
+        lines = {order_id: [] for order_id in order_ids}
+        for line in db_sess.query(OrderLine).filter(OrderLine.order_id.in_(order_ids)).order_by(OrderLine.id):
+            lines[line.order_id].append(line)
+        totals = get_order_totals(db_sess, order_ids)
+        for order_id in order_ids:
+            yield order_id, lines[order_id], totals[order_id]
+        db_sess.expunge_all()
+        after = order_ids[-1]
+
+
+# Позиции заказа или None, если у пользователя нет такого заказа
+def get_order_lines(db_sess: Session, user_id, order_id):
+    if not db_sess.query(Order.id).filter(Order.id == order_id, Order.user_id == user_id).first():
+        return None
+    return db_sess.query(OrderLine).filter(OrderLine.order_id == order_id).order_by(OrderLine.id).all()
+
+
+def _drop_order(db_sess: Session, order_id):
+    db_sess.query(OrderTotal).filter(OrderTotal.order_id == order_id).delete(synchronize_session=False)
+    db_sess.query(OrderLine).filter(OrderLine.order_id == order_id).delete(synchronize_session=False)
+    db_sess.query(Order).filter(Order.id == order_id).delete(synchronize_session=False)
+
+
+def delete_order(db_sess: Session, user_id, order_id):
+    if get_order_lines(db_sess, user_id, order_id) is None:
+        return False
+    _drop_order(db_sess, order_id)
+    db_sess.commit()
+    return True
+
+
+# Возврат денег за заказ и его удаление в одной транзакции
+def refund_order(db_sess: Session, user_id, order_id):
+    lines = get_order_lines(db_sess, user_id, order_id)
+    if lines is None:
+        return False
+    for currency_id, amount in summarize(lines).items():
+        _deposit(db_sess, user_id, currency_id, amount)
+    _drop_order(db_sess, order_id)
+    db_sess.commit()
+    return True
+
+
+# Обмен amount единиц первой валюты на received единиц второй; средства проверяются и переводятся одной транзакцией
+def exchange(db_sess: Session, user_id, first_id, second_id, amount, received):
+    if not _withdraw(db_sess, user_id, first_id, amount):
+        db_sess.rollback()
+        return False
+    _deposit(db_sess, user_id, second_id, received)
+    db_sess.commit()
+    return True
+
+
+def _line_values(info):
+    return {'item_id': int(info['item_id']), 'currency_id': int(info['currency_id']),
+            'price': float(info['price']), 'discount': parse_optional(info['discount'], int),
+            'discount_price': parse_optional(info['discount_price'])}
+
+
+# Одноразовый перенос данных из json-файлов accounts/user_<id>.json в базу данных
+# Пользователи, у которых уже есть счёт в базе, пропускаются, поэтому повторный запуск безопасен
+def migrate_json_accounts(db_sess: Session, directory='accounts'):
+    migrated = 0
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('user_') and name.endswith('.json')):
+            continue
+        user_id = int(name[len('user_'):-len('.json')])
+        if not db_sess.query(User.id).filter(User.id == user_id).first():
+            continue
+        if db_sess.query(Balance.user_id).filter(Balance.user_id == user_id).first():
+            continue
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as jsonfile:
+            data = json.load(jsonfile)
+        for currency_id, amount in data['currencies'].items():
+            db_sess.add(Balance(user_id=user_id, currency_id=int(currency_id), amount=amount))
+        for info in data['shopping_cart']['items']:
+            db_sess.add(CartLine(user_id=user_id, **_line_values(info)))
+        for key, order_data in data['orders'].items():
+            # Номер заказа сохраняется, если он ещё не занят заказом другого пользователя
+            order = Order(user_id=user_id)
+            if not db_sess.query(Order.id).filter(Order.id == int(key)).first():
+                order.id = int(key)
+            db_sess.add(order)
+            db_sess.flush()
+            lines = [OrderLine(order_id=order.id, **_line_values(info)) for info in order_data['items']]
+            db_sess.add_all(lines)
+            db_sess.add_all(OrderTotal(order_id=order.id, currency_id=currency_id, amount=amount)
+                            for currency_id, amount in summarize(lines).items())
+        db_sess.commit()
+        migrated += 1
+    return migrated
@@ -0,0 +1,90 @@
+import os
+import json
+import mimetypes
+from flask import abort, current_app, request, send_from_directory, url_for
+from . import images
+
+# Каталог копий статических файлов с хэшем содержимого в имени и файл соответствия исходных путей копиям
+BUILD_FOLDER = 'build'
+MANIFEST_PATH = os.path.join('static', BUILD_FOLDER, 'manifest.json')
+# Имя файла меняется вместе с содержимым, поэтому браузер может хранить его год без повторных проверок
+MAX_AGE = 365 * 24 * 60 * 60
+# Предварительно сжатые варианты в порядке предпочтения: кодировка и расширение файла
+ENCODINGS = (('br', 'br'), ('gzip', 'gz'))
+
+__manifest = None
+__files = None
+
+
+# Манифест читается один раз; если копии не собраны (python build_assets.py), файлы отдаются из static как есть
+def get_manifest():
+    global __manifest
+    if __manifest is None:
+        try:
+            with open(MANIFEST_PATH, 'r', encoding='utf-8') as manifest_file:
+                __manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            __manifest = {}
+    return __manifest
+
+
+# Файлы, которые отдаются с неограниченным кэшированием, и их сжатые варианты:
+# копии из build_assets.py и уменьшенные изображения из build_images.py
+def _immutable_files():
+    global __files
+    if __files is None:
+        files = {entry['file']: tuple(entry['encodings']) for entry in get_manifest().values()}
+        for entry in images.get_manifest().values():
+            for path in entry['files'].values():
+                if path.startswith(images.DERIVED_FOLDER + '/'):
+                    files[path] = ()
+        __files = files
+    return __files
+
+
+def reload_manifest():
+    global __manifest, __files
+    __manifest = None
+    __files = None
+    images.reload_manifest()
+    return get_manifest()
+
+
+# Адрес файла static/<path>: копия с хэшем, если она собрана, иначе обычный путь к static
+def url(path):
+    entry = get_manifest().get(path)
+    if entry is not None:
+        return url_for('asset', filename=entry['file'])
+    if path in _immutable_files():
+        return url_for('asset', filename=path)
+    return url_for('static', filename=path)
+
+
+# Выдача файла с заголовком immutable
+# Сжатый вариант выбирается по Accept-Encoding, условные запросы и Range обрабатывает send_from_directory,
+# а тело передаётся через wsgi.file_wrapper, который gunicorn отправляет системным вызовом sendfile
+def serve(filename):
+    encodings = _immutable_files().get(filename)
+    if encodings is None:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, extension in ENCODINGS:
+        if encoding in encodings and request.accept_encodings[encoding]:
+            response = send_from_directory(current_app.static_folder, f'{filename}.{extension}',
+                                           mimetype=mimetype, max_age=MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            del response.headers['Content-Disposition']
+            break
+    else:
+        response = send_from_directory(current_app.static_folder, filename, mimetype=mimetype, max_age=MAX_AGE)
+    if encodings:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# Адрес /assets/<file> и функция asset(path) для шаблонов
+def init_app(app):
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve)
+    app.jinja_env.globals['asset'] = url
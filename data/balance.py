@@ -0,0 +1,10 @@
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+from sqlalchemy_serializer import SerializerMixin
+
+
+class Balance(SerializerMixin, SqlAlchemyBase):
+    __tablename__ = 'balances'
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'), primary_key=True)
+    currency_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('currencies.id'), primary_key=True)
+    amount = sqlalchemy.Column(sqlalchemy.Float, nullable=False, default=0)
@@ -0,0 +1,14 @@
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+from sqlalchemy_serializer import SerializerMixin
+
+
+class CartLine(SerializerMixin, SqlAlchemyBase):
+    __tablename__ = 'cart_lines'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'), index=True, nullable=False)
+    item_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('items.id'), nullable=False)
+    currency_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('currencies.id'), nullable=False)
+    price = sqlalchemy.Column(sqlalchemy.Float, nullable=False)
+    discount = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
+    discount_price = sqlalchemy.Column(sqlalchemy.Float, nullable=True)
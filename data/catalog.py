@@ -0,0 +1,156 @@
+import time
+import threading
+from . import db_session, images, assets
+from .item import Item
+from .currency import Currency
+from .category import Category
+from .store import Store
+from .catalog_version import CatalogVersion
+from .account_store import line_cost
+
+# Как часто (в секундах) сверять номер версии каталога с базой данных
+CHECK_INTERVAL = 5
+
+__catalog = None
+__checked_at = 0.0
+__lock = threading.Lock()
+
+
+# Неизменяемая запись справочника
+class _Record:
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} доступен только для чтения')
+
+    def __repr__(self):
+        return f'{type(self).__name__}(id={self.id!r})'
+
+
+class ItemRecord(_Record):
+    __slots__ = ('id', 'name', 'category', 'description', 'properties', 'short_description',
+                 'special_price', 'special_currency', 'photo_name', 'photo_url', 'card_url')
+
+
+class CurrencyRecord(_Record):
+    __slots__ = ('id', 'name', 'logotype', 'is_integer', 'logo_url')
+
+
+class CategoryRecord(_Record):
+    __slots__ = ('id', 'name')
+
+
+class StoreRecord(_Record):
+    __slots__ = ('id', 'name', 'slogan', 'logotype', 'icon', 'logotype_url', 'icon_url')
+
+
+# Снимок справочных таблиц с картами по идентификаторам
+class Catalog:
+    __slots__ = ('version', 'items', 'item_list', 'currencies', 'currency_list',
+                 'categories', 'category_list', 'category_ids', 'stores', 'store_list')
+
+    def __init__(self, version, items, currencies, categories, stores):
+        self.version = version
+        self.item_list = tuple(items)
+        self.items = {i.id: i for i in self.item_list}
+        self.currency_list = tuple(currencies)
+        self.currencies = {i.id: i for i in self.currency_list}
+        self.category_list = tuple(categories)
+        self.categories = {i.id: i for i in self.category_list}
+        self.category_ids = {i.name: i.id for i in self.category_list}
+        self.store_list = tuple(stores)
+        self.stores = {i.id: i for i in self.store_list}
+
+
+# Путь к изображению нужного размера из манифеста уменьшенных копий
+def _static(folder, filename, variant='full'):
+    return assets.url(images.resolve(folder, filename, variant))
+
+
+def _item_record(item):
+    properties = tuple((item.description or '').split(';'))
+    return ItemRecord(id=item.id, name=item.name, category=item.category, description=item.description,
+                      properties=properties, short_description=properties[0],
+                      special_price=item.special_price, special_currency=item.special_currency,
+                      photo_name=item.photo_name, photo_url=_static('items', item.photo_name),
+                      card_url=_static('items', item.photo_name, 'card'))
+
+
+def _load(db_sess, version):
+    items = [_item_record(i) for i in db_sess.query(Item).order_by(Item.id)]
+    currencies = [CurrencyRecord(id=i.id, name=i.name, logotype=i.logotype, is_integer=i.is_integer,
+                                 logo_url=_static('currencies', i.logotype, 'thumb'))
+                  for i in db_sess.query(Currency).order_by(Currency.id)]
+    categories = [CategoryRecord(id=i.id, name=i.name) for i in db_sess.query(Category).order_by(Category.id)]
+    stores = [StoreRecord(id=i.id, name=i.name, slogan=i.slogan, logotype=i.logotype, icon=i.icon,
+                          logotype_url=_static('logotypes', i.logotype), icon_url=_static('icons', i.icon))
+              for i in db_sess.query(Store).order_by(Store.id)]
+    return Catalog(version, items, currencies, categories, stores)
+
+
+# Текущий снимок каталога
+# Версия в базе проверяется не чаще раза в CHECK_INTERVAL секунд, остальные вызовы не обращаются к базе
+# Загрузка строит пути через url_for, поэтому первый вызов должен происходить внутри запроса
+def get_catalog() -> Catalog:
+    global __catalog, __checked_at
+    now = time.monotonic()
+    if __catalog is not None and now - __checked_at < CHECK_INTERVAL:
+        return __catalog
+    with __lock:
+        if __catalog is not None and now - __checked_at < CHECK_INTERVAL:
+            return __catalog
+        db_sess = db_session.create_session()
+        try:
+            version = db_sess.query(CatalogVersion.version).filter(CatalogVersion.id == 1).scalar() or 0
+            if __catalog is None or __catalog.version != version:
+                __catalog = _load(db_sess, version)
+        finally:
+            db_sess.close()
+        __checked_at = now
+    return __catalog
+
+
+# Сброс снимка, следующий вызов get_catalog загрузит каталог заново
+def invalidate():
+    global __catalog
+    with __lock:
+        __catalog = None
+
+
+# Товары по идентификаторам: из каталога, а отсутствующие в снимке - одним запросом IN (...)
+def resolve_items(db_sess, item_ids):
+    catalog = get_catalog()
+    found = dict()
+    missing = set()
+    for item_id in item_ids:
+        item = catalog.items.get(item_id)
+        if item is None:
+            missing.add(item_id)
+        else:
+            found[item_id] = item
+    if missing:
+        for item in db_sess.query(Item).filter(Item.id.in_(missing)):
+            found[item.id] = _item_record(item)
+    return found
+
+
+# Строки для страниц корзины и заказа и сумма по валютам за один проход по позициям
+def build_line_rows(db_sess, lines):
+    catalog = get_catalog()
+    items = resolve_items(db_sess, {line.item_id for line in lines})
+    rows = []
+    summary = dict()
+    for line in lines:
+        item = items.get(line.item_id)
+        currency = catalog.currencies[line.currency_id]
+        rows.append({'name': item.name if item else '?????????', 'price': line.price, 'discount': line.discount,
+                     'discount_price': line.discount_price, 'currency': currency.logo_url,
+                     'image': item.card_url if item else None, 'id': line.item_id, 'line_id': line.id})
+        if line.currency_id not in summary:
+            summary[line.currency_id] = {'currency': currency.logo_url, 'price': 0}
+        summary[line.currency_id]['price'] += line_cost(line)
+    return rows, summary
@@ -0,0 +1,278 @@
+import os
+import csv
+import sys
+import json
+import time
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+from . import db_session, search_index
+from .category import Category
+from .currency import Currency
+from .item import Item
+from .store import Store
+
+# Число строк в одной транзакции импорта и в одном запросе экспорта
+CHUNK = 5000
+# Названия пачки передаются одним запросом IN, а SQLite принимает не больше 32766 параметров
+MAX_CHUNK = 30000
+FORMATS = ('csv', 'ndjson')
+STATIC_IMAGES = os.path.join('static', 'img')
+# Сколько ошибочных строк выводится в отчёте импорта
+SHOWN_ERRORS = 20
+
+# Таблицы справочника: модель, поля файла, ссылки на другие таблицы по названию и папки изображений в static/img
+# Строки сопоставляются по названию (name): существующие обновляются, новые добавляются
+TABLES = {
+    'categories': {'model': Category, 'fields': ('name',), 'references': {}, 'images': {}},
+    'currencies': {'model': Currency, 'fields': ('name', 'logotype', 'is_integer'), 'references': {},
+                   'images': {'logotype': 'currencies'}},
+    'stores': {'model': Store, 'fields': ('name', 'slogan', 'logotype', 'icon'), 'references': {},
+               'images': {'logotype': 'logotypes', 'icon': 'icons'}},
+    # Товары также есть в полнотекстовом индексе, который при импорте обновляется одним запросом на пачку
+    'items': {'model': Item, 'search_index': True,
+              'fields': ('name', 'category', 'description', 'special_price', 'special_currency', 'photo_name'),
+              'references': {'category': Category, 'special_currency': Currency},
+              'images': {'photo_name': 'items'}}
+}
+INTEGER_FIELDS = ('special_price',)
+BOOLEAN_FIELDS = ('is_integer',)
+
+
+# Ошибка в строке файла импорта
+class RowError(Exception):
+    pass
+
+
+def _names(connection, model):
+    return dict(connection.execute(sa.select(model.id, model.name)).all())
+
+
+def _files(folder):
+    try:
+        return set(os.listdir(os.path.join(STATIC_IMAGES, folder)))
+    except OSError:
+        return set()
+
+
+# Строки таблицы по CHUNK штук в порядке id; ссылки на другие таблицы заменяются их названиями
+def export_rows(table):
+    spec = TABLES[table]
+    model = spec['model']
+    columns = [getattr(model, field) for field in spec['fields']]
+    engine = db_session.get_engine()
+    with engine.connect() as connection:
+        references = {field: _names(connection, target) for field, target in spec['references'].items()}
+        last = 0
+        while True:
+            chunk = connection.execute(sa.select(model.id, *columns).where(model.id > last)
+                                       .order_by(model.id).limit(CHUNK)).all()
+            if not chunk:
+                return
+            for row in chunk:
+                values = dict(zip(spec['fields'], row[1:]))
+                for field, names in references.items():
+                    values[field] = names.get(values[field])
+                yield values
+            last = chunk[-1][0]
+
+
+def write_rows(rows, output, file_format, fields):
+    if file_format == 'csv':
+        writer = csv.DictWriter(output, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    else:
+        for row in rows:
+            output.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def read_rows(source, file_format):
+    if file_format == 'csv':
+        yield from csv.DictReader(source)
+    else:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _integer(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _boolean(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'да', 'yes')
+
+
+# Строка файла в значения столбцов: пустые строки - NULL, ссылки по названию - идентификаторы
+def _convert(spec, row, references, files):
+    if not isinstance(row, dict):
+        raise RowError('строка должна быть объектом')
+    name = row.get('name')
+    if not name:
+        raise RowError('нет названия')
+    values = {'name': name}
+    for field in spec['fields'][1:]:
+        value = row.get(field)
+        if value == '':
+            value = None
+        if field in spec['references'] and value is not None:
+            if value not in references[field]:
+                raise RowError(f'{field}: нет записи «{value}»')
+            value = references[field][value]
+        elif field in INTEGER_FIELDS:
+            try:
+                value = _integer(value)
+            except (TypeError, ValueError):
+                raise RowError(f'{field}: не целое число')
+        elif field in BOOLEAN_FIELDS:
+            value = _boolean(value)
+        if field in spec['images'] and value is not None and value not in files[field]:
+            raise RowError(f'{field}: нет файла static/img/{spec["images"][field]}/{value}')
+        values[field] = value
+    return values
+
+
+# Проверка файлов изображений отключена: подходит любое имя
+class _AnyFile:
+    def __contains__(self, name):
+        return True
+
+
+# Добавление и обновление одной пачки строк
+# Для товаров полнотекстовый индекс обновляется одним запросом до и после изменения строк
+def _upsert(connection, spec, chunk):
+    model = spec['model']
+    table = model.__table__
+    existing = dict(connection.execute(sa.select(model.name, model.id).where(model.name.in_(list(chunk)))).all())
+    inserts = [values for name, values in chunk.items() if name not in existing]
+    updates = [dict(values, _id=existing[name]) for name, values in chunk.items() if name in existing]
+    indexed = spec.get('search_index') and connection.dialect.name == 'sqlite'
+    # Новые строки получают идентификаторы больше наибольшего существующего
+    last = connection.execute(sa.select(sa.func.max(model.id))).scalar() or 0
+    if indexed and updates:
+        search_index.index_items(connection, model.id.in_(list(existing.values())), delete=True)
+    if inserts:
+        connection.execute(table.insert(), inserts)
+    if updates:
+        connection.execute(table.update().where(table.c.id == sa.bindparam('_id')), updates)
+    if indexed:
+        search_index.index_items(connection, model.id.in_(list(existing.values())) | (model.id > last))
+    return len(inserts), len(updates)
+
+
+# Импорт строк rows в таблицу table пачками по chunk строк; в памяти одновременно только одна пачка
+# Ошибочные строки пропускаются и возвращаются списком (номер строки, описание)
+def import_rows(table, rows, chunk_size=CHUNK, check_files=True):
+    spec = TABLES[table]
+    engine = db_session.get_engine()
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+    with engine.connect() as connection:
+        references = {field: {name: i for i, name in _names(connection, target).items()}
+                      for field, target in spec['references'].items()}
+    files = {field: _files(folder) for field, folder in spec['images'].items()} if check_files else \
+        {field: _AnyFile() for field in spec['images']}
+    chunk = dict()
+    for number, row in enumerate(rows, start=1):
+        try:
+            values = _convert(spec, row, references, files)
+        except RowError as error:
+            stats['skipped'] += 1
+            if len(stats['errors']) < SHOWN_ERRORS:
+                stats['errors'].append((number, str(error)))
+            continue
+        # Повтор названия внутри пачки: остаётся последняя строка
+        chunk[values['name']] = values
+        if len(chunk) >= chunk_size:
+            _flush(engine, spec, chunk, stats)
+            chunk = dict()
+    if chunk:
+        _flush(engine, spec, chunk, stats)
+    return stats
+
+
+# Одна пачка - одна транзакция
+# Триггеры таблицы (версия каталога, полнотекстовый индекс) срабатывают на каждую строку и в несколько раз
+# замедляют импорт, поэтому на время пачки удаляются и создаются заново в той же транзакции: другие соединения
+# их отсутствия не видят, а при ошибке откатывается и удаление; версия каталога увеличивается один раз
+def _flush(engine, spec, chunk, stats):
+    with engine.begin() as connection:
+        triggers = []
+        if connection.dialect.name == 'sqlite':
+            triggers = connection.execute(sa.text("SELECT name, sql FROM sqlite_master "
+                                                  "WHERE type = 'trigger' AND tbl_name = :table"),
+                                          {'table': spec['model'].__tablename__}).all()
+        for name, _ in triggers:
+            connection.exec_driver_sql(f'DROP TRIGGER "{name}"')
+        inserted, updated = _upsert(connection, spec, chunk)
+        for _, sql in triggers:
+            connection.exec_driver_sql(sql)
+        if triggers:
+            connection.execute(sa.text("UPDATE catalog_version SET version = version + 1 WHERE id = 1"))
+    stats['inserted'] += inserted
+    stats['updated'] += updated
+
+
+def _format(path, file_format):
+    if file_format:
+        return file_format
+    return 'csv' if path.endswith('.csv') else 'ndjson'
+
+
+catalog_cli = AppGroup('catalog', help='Импорт и экспорт справочника магазина.')
+
+
+@catalog_cli.command('export', help='Выгрузка таблицы в CSV или NDJSON, PATH "-" - стандартный вывод.')
+@click.argument('table', type=click.Choice(list(TABLES)))
+@click.argument('path', default='-')
+@click.option('--format', 'file_format', type=click.Choice(FORMATS), help='по умолчанию по расширению файла')
+def export_command(table, path, file_format):
+    file_format = _format(path, file_format)
+    start = time.perf_counter()
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in export_rows(table):
+            count += 1
+            yield row
+
+    if path == '-':
+        write_rows(counted(), sys.stdout, file_format, TABLES[table]['fields'])
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            write_rows(counted(), output, file_format, TABLES[table]['fields'])
+    elapsed = time.perf_counter() - start
+    click.echo(f'Выгружено строк: {count} за {elapsed:.2f} с ({count / max(elapsed, 1e-9):.0f} строк/с)', err=True)
+
+
+@catalog_cli.command('import', help='Загрузка таблицы из CSV или NDJSON: строки с тем же названием '
+                                     'обновляются, новые добавляются.')
+@click.argument('table', type=click.Choice(list(TABLES)))
+@click.argument('path')
+@click.option('--format', 'file_format', type=click.Choice(FORMATS), help='по умолчанию по расширению файла')
+@click.option('--chunk', 'chunk_size', default=CHUNK, show_default=True, type=click.IntRange(1, MAX_CHUNK),
+              help='строк в одной транзакции')
+@click.option('--no-check-files', is_flag=True, help='не проверять файлы изображений в static/img')
+def import_command(table, path, file_format, chunk_size, no_check_files):
+    file_format = _format(path, file_format)
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8', newline='') as source:
+        stats = import_rows(table, read_rows(source, file_format), chunk_size, not no_check_files)
+    elapsed = time.perf_counter() - start
+    total = stats['inserted'] + stats['updated'] + stats['skipped']
+    click.echo(f"Добавлено {stats['inserted']}, обновлено {stats['updated']}, пропущено {stats['skipped']} "
+               f"за {elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f} строк/с)")
+    for number, message in stats['errors']:
+        click.echo(f'  строка {number}: {message}', err=True)
+    if stats['skipped']:
+        sys.exit(1)
+
+
+def init_app(app):
+    app.cli.add_command(catalog_cli)
@@ -0,0 +1,49 @@
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+
+# Таблицы справочника, изменение которых увеличивает номер версии каталога
+CATALOG_TABLES = ('items', 'currencies', 'categories', 'stores')
+
+
+class CatalogVersion(SqlAlchemyBase):
+    __tablename__ = 'catalog_version'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    version = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+
+
+# Начальная строка версии создаётся вместе с таблицей
+sqlalchemy.event.listen(
+    CatalogVersion.__table__, 'after_create',
+    sqlalchemy.DDL('INSERT INTO catalog_version (id, version) VALUES (1, 0)')
+)
+# Триггеры SQLite создаются после всех таблиц, поэтому правка каталога вручную
+# (например, в DB Browser) тоже меняет версию
+for table in CATALOG_TABLES:
+    for operation in ('INSERT', 'UPDATE', 'DELETE'):
+        sqlalchemy.event.listen(
+            SqlAlchemyBase.metadata, 'after_create',
+            sqlalchemy.DDL(f'CREATE TRIGGER IF NOT EXISTS {table}_{operation.lower()}_version '
+                           f'AFTER {operation} ON {table} '
+                           f'BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END')
+            .execute_if(dialect='sqlite')
+        )
+# В PostgreSQL версию увеличивает триггер на весь запрос (FOR EACH STATEMENT): массовое изменение каталога
+# одним запросом меняет версию один раз
+sqlalchemy.event.listen(
+    SqlAlchemyBase.metadata, 'after_create',
+    sqlalchemy.DDL('CREATE OR REPLACE FUNCTION catalog_version_bump() RETURNS trigger AS $$ '
+                   'BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; RETURN NULL; END '
+                   '$$ LANGUAGE plpgsql')
+    .execute_if(dialect='postgresql')
+)
+for table in CATALOG_TABLES:
+    sqlalchemy.event.listen(
+        SqlAlchemyBase.metadata, 'after_create',
+        sqlalchemy.DDL(f'DROP TRIGGER IF EXISTS {table}_version ON {table}').execute_if(dialect='postgresql')
+    )
+    sqlalchemy.event.listen(
+        SqlAlchemyBase.metadata, 'after_create',
+        sqlalchemy.DDL(f'CREATE TRIGGER {table}_version AFTER INSERT OR UPDATE OR DELETE ON {table} '
+                       f'FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()')
+        .execute_if(dialect='postgresql')
+    )
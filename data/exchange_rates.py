@@ -0,0 +1,94 @@
+import time
+import threading
+import numpy as np
+from .catalog import get_catalog
+
+# Начальное значение генератора курсов и длительность периода в секундах, в течение которого курсы не меняются
+SEED = 20241222
+BUCKET_SECONDS = 600
+# Стоимость единицы валюты в базовых единицах: от 10 ** -RATE_SPREAD до 10 ** RATE_SPREAD
+RATE_SPREAD = 2.0
+
+__table = None
+__lock = threading.Lock()
+
+
+# Курсы всех пар валют одного периода
+# matrix[i, j] - сколько единиц валюты j дают за единицу валюты i; курсы получены из стоимости каждой валюты
+# в базовых единицах, поэтому обмен по цепочке валют не выгоднее прямого обмена
+class RateTable:
+    __slots__ = ('bucket', 'version', 'ids', 'index', 'base', 'matrix', 'integer', 'pairs')
+
+    def __init__(self, bucket, version, ids, base, integer, pairs):
+        self.bucket = bucket
+        self.version = version
+        self.ids = ids
+        self.index = np.full(int(ids.max(initial=0)) + 1, -1, dtype=np.int64)
+        self.index[ids] = np.arange(len(ids))
+        self.base = base
+        self.matrix = base[:, None] / base[None, :]
+        self.integer = integer
+        self.pairs = pairs
+        for array in (self.ids, self.index, self.base, self.matrix, self.integer, self.pairs):
+            array.setflags(write=False)
+
+    def _positions(self, currency_ids):
+        currency_ids = np.asarray(currency_ids, dtype=np.int64)
+        if ((currency_ids < 0) | (currency_ids >= len(self.index))).any():
+            raise KeyError('Неизвестная валюта')
+        positions = self.index[currency_ids]
+        if (positions < 0).any():
+            raise KeyError('Неизвестная валюта')
+        return positions
+
+    def rate(self, first_id, second_id):
+        first, second = self._positions([first_id, second_id])
+        return float(self.matrix[first, second])
+
+    # Пересчёт массива сумм в валютах from_ids в валюту to_id одной векторной операцией
+    # Для целочисленной валюты результат округляется вниз
+    def convert_many(self, amounts, from_ids, to_id):
+        target = self._positions([to_id])[0]
+        converted = np.asarray(amounts, dtype=np.float64) * (self.base[self._positions(from_ids)] / self.base[target])
+        if self.integer[target]:
+            converted = np.floor(converted)
+        return converted
+
+    def convert(self, amount, first_id, second_id):
+        converted = self.convert_many([amount], [first_id], second_id)[0]
+        return int(converted) if self.integer[self._positions([second_id])[0]] else float(converted)
+
+    # Стоимость набора сумм по валютам {currency_id: amount}, например счёта или корзины, в одной валюте
+    def revalue(self, amounts, to_id):
+        if not amounts:
+            return 0
+        total = self.convert_many(list(amounts.values()), list(amounts.keys()), to_id).sum()
+        return int(total) if self.integer[self._positions([to_id])[0]] else float(total)
+
+
+# Курсы периода bucket: стоимость валют в базовых единицах и предлагаемая пара для каждой валюты
+def build_rates(catalog, bucket, seed=SEED):
+    ids = np.array([i.id for i in catalog.currency_list], dtype=np.int64)
+    rng = np.random.default_rng([seed, bucket])
+    base = 10.0 ** rng.uniform(-RATE_SPREAD, RATE_SPREAD, len(ids))
+    integer = np.array([bool(i.is_integer) for i in catalog.currency_list], dtype=bool)
+    # Для каждой валюты - другая валюта со сдвигом от 1 до N - 1 позиций
+    if len(ids) > 1:
+        pairs = ids[(np.arange(len(ids)) + rng.integers(1, len(ids), len(ids))) % len(ids)]
+    else:
+        pairs = ids.copy()
+    return RateTable(bucket, catalog.version, ids, base, integer, pairs)
+
+
+# Курсы текущего периода; пересчитываются в начале нового периода и после изменения справочника валют
+def get_rates() -> RateTable:
+    global __table
+    bucket = int(time.time() // BUCKET_SECONDS)
+    catalog = get_catalog()
+    table = __table
+    if table is not None and table.bucket == bucket and table.version == catalog.version:
+        return table
+    with __lock:
+        if __table is None or __table.bucket != bucket or __table.version != catalog.version:
+            __table = build_rates(catalog, bucket)
+        return __table
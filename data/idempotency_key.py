@@ -0,0 +1,15 @@
+import datetime
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+from sqlalchemy_serializer import SerializerMixin
+
+
+class IdempotencyKey(SerializerMixin, SqlAlchemyBase):
+    __tablename__ = 'idempotency_keys'
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'), primary_key=True)
+    key = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    endpoint = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    request_hash = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    status = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
+    response = sqlalchemy.Column(sqlalchemy.Text, nullable=True)
+    created_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, default=datetime.datetime.now)
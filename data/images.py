@@ -0,0 +1,36 @@
+import os
+import json
+
+# Каталог уменьшенных копий изображений и файл соответствия исходных файлов их копиям
+DERIVED_FOLDER = 'img/derived'
+MANIFEST_PATH = os.path.join('static', DERIVED_FOLDER, 'manifest.json')
+# Размеры копий: наибольшая сторона в пикселях
+VARIANTS = {'thumb': 96, 'card': 480, 'full': 1200}
+
+__manifest = None
+
+
+# Манифест читается один раз; если копии не собраны (python build_images.py), используются исходные файлы
+def get_manifest():
+    global __manifest
+    if __manifest is None:
+        try:
+            with open(MANIFEST_PATH, 'r', encoding='utf-8') as manifest_file:
+                __manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            __manifest = {}
+    return __manifest
+
+
+def reload_manifest():
+    global __manifest
+    __manifest = None
+    return get_manifest()
+
+
+# Путь к файлу внутри static для изображения из img/<folder>/<filename> нужного размера
+def resolve(folder, filename, variant='full'):
+    entry = get_manifest().get(f'{folder}/{filename}')
+    if entry and variant in entry['files']:
+        return entry['files'][variant]
+    return f'img/{folder}/{filename}'
@@ -11,4 +11,11 @@ class Item(SerializerMixin, SqlAlchemyBase):
     description = sqlalchemy.Column(sqlalchemy.String, nullable=True)
     special_price = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
     special_currency = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('currencies.id'), nullable=True)
-    photo_name = sqlalchemy.Column(sqlalchemy.String, nullable=True)
\ No newline at end of file
+    photo_name = sqlalchemy.Column(sqlalchemy.String, nullable=True)
+
+
+# Индекс по названию для поиска строк при импорте каталога (flask catalog import), создаётся и в уже существующей базе
+sqlalchemy.event.listen(
+    SqlAlchemyBase.metadata, 'after_create',
+    sqlalchemy.DDL('CREATE INDEX IF NOT EXISTS ix_items_name ON items (name)')
+)
@@ -0,0 +1,25 @@
+import datetime
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+
+
+# Фоновая задача очереди data/jobs.py
+# status: queued - ждёт выполнения с run_at, running - выполняется до lease_until, done, failed
+class Job(SqlAlchemyBase):
+    __tablename__ = 'jobs'
+    __table_args__ = (sqlalchemy.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    queue = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    task = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    payload = sqlalchemy.Column(sqlalchemy.Text, nullable=False)
+    # Ключ идемпотентности: вторая задача с тем же ключом не добавляется, пока первая хранится в таблице
+    key = sqlalchemy.Column(sqlalchemy.String, nullable=True, unique=True)
+    status = sqlalchemy.Column(sqlalchemy.String, nullable=False, default='queued')
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    max_attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    error = sqlalchemy.Column(sqlalchemy.Text, nullable=True)
+    created_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, default=datetime.datetime.now)
+    run_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, default=datetime.datetime.now)
+    started_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True)
+    lease_until = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True)
+    finished_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True)
@@ -0,0 +1,476 @@
+import os
+import sys
+import json
+import time
+import signal
+import datetime
+import functools
+import contextlib
+import threading
+import traceback
+import multiprocessing
+import click
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from flask.cli import AppGroup
+from . import db_session, metrics
+from .job import Job
+
+# Наибольшее число одновременно выполняемых задач очереди во всех процессах вместе
+# Очереди без записи ограничены DEFAULT_CONCURRENCY
+QUEUES = {'accounts': 4, 'bonus': 2}
+DEFAULT_CONCURRENCY = 2
+# Число попыток по умолчанию; перед повтором задача ждёт RETRY_DELAY * 2 ** (попытка - 1) секунд
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 1.0
+# На это время (в секундах) воркер забирает задачу; если он не успел (например, процесс завершился),
+# задача выдаётся другому воркеру
+LEASE = 60
+# Как часто (в секундах) воркер продлевает аренду выполняемых задач, поэтому долгая задача не выдаётся повторно
+RENEW_INTERVAL = LEASE / 3
+# Как часто (в секундах) воркер без уведомлений проверяет таблицу задач
+POLL_INTERVAL = 1.0
+# Сколько хранятся выполненные задачи, а вместе с ними их ключи идемпотентности
+KEEP_DONE = datetime.timedelta(days=7)
+PURGE_INTERVAL = 3600
+# Число потоков-воркеров в процессе приложения
+THREADS = 2
+# Число последних ошибок в flask jobs status
+SHOWN_FAILURES = 10
+
+# Зарегистрированные задачи: имя - (функция, очередь, число попыток, размер пачки)
+__tasks = dict()
+__worker = None
+__lock = threading.Lock()
+
+
+# Регистрация функции задачи: @jobs.task('accounts.create', queue='accounts')
+# Функция получает сессию и аргументы из payload и не делает коммит: изменения задачи и отметка о выполнении
+# записываются одной транзакцией, поэтому задача, изменяющая только базу, выполняется ровно один раз
+# batch - сколько готовых задач этого имени воркер забирает вместе и выполняет одной транзакцией:
+# для частых коротких записей (например, начисления бонусов) один коммит приходится на всю пачку
+def task(name, queue='default', max_attempts=MAX_ATTEMPTS, batch=1):
+    def register(function):
+        __tasks[name] = (function, queue, max_attempts, batch)
+        return function
+    return register
+
+
+# Вызов callback после коммита сессии, например сброс кэша или уведомление воркеров
+def after_commit(db_sess, callback):
+    sa.event.listen(db_sess, 'after_commit', lambda session: callback(), once=True)
+
+
+# Запрос добавления задачи для диалекта базы: в SQLite и PostgreSQL задача с уже существующим ключом
+# идемпотентности не добавляется (ON CONFLICT DO NOTHING), в остальных базах конфликт ключа перехватывает enqueue
+@functools.lru_cache(maxsize=None)
+def _enqueue_statement(dialect):
+    if dialect == 'sqlite':
+        return sqlite.insert(Job.__table__).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql.insert(Job.__table__).on_conflict_do_nothing()
+    return Job.__table__.insert()
+
+
+# Добавление задачи в транзакции db_sess: задача попадёт в очередь вместе с остальными изменениями при коммите
+# payload - аргументы функции задачи, которые можно записать в JSON; delay - задержка запуска в секундах
+# Возвращает идентификатор задачи или None, если задача с ключом key уже есть
+def enqueue(db_sess, name, payload=None, key=None, delay=0):
+    function, queue, max_attempts, batch = __tasks[name]
+    now = datetime.datetime.now()
+    connection = db_sess.connection()
+    dialect = connection.dialect.name
+    values = {
+        'queue': queue, 'task': name, 'payload': json.dumps(payload or {}, ensure_ascii=False), 'key': key,
+        'status': 'queued', 'attempts': 0, 'max_attempts': max_attempts, 'created_at': now,
+        'run_at': now + datetime.timedelta(seconds=delay)
+    }
+    if dialect in ('sqlite', 'postgresql'):
+        result = connection.execute(_enqueue_statement(dialect), values)
+    else:
+        # Точка сохранения, чтобы конфликт ключа не откатил остальные изменения транзакции
+        try:
+            with db_sess.begin_nested():
+                result = connection.execute(_enqueue_statement(dialect), values)
+        except sa.exc.IntegrityError:
+            return None
+    if not result.rowcount:
+        return None
+    after_commit(db_sess, _wake)
+    return result.inserted_primary_key[0]
+
+
+# Добавление задачи отдельной транзакцией, например из обработчика, который сам ничего не записывает
+def submit(name, payload=None, key=None, delay=0):
+    db_sess = db_session.create_session()
+    try:
+        job_id = enqueue(db_sess, name, payload, key, delay)
+        db_sess.commit()
+        return job_id
+    finally:
+        db_sess.close()
+
+
+# Запрос захвата задачи для набора очередей; строится один раз, время передаётся параметрами now и lease_until
+# Выбор и захват задачи - один запрос UPDATE ... RETURNING, поэтому две задачи не достаются двум воркерам,
+# а число выполняемых задач очереди не превышает предела даже при воркерах в разных процессах:
+# в SQLite записи выполняются по одной, в PostgreSQL захваты упорядочивает рекомендательная блокировка CLAIM_LOCK
+# Готовые задачи выбираются по индексу (status, run_at), выполненные задачи в таблице не просматриваются
+@functools.lru_cache(maxsize=None)
+def _claim_statement(queues):
+    jobs = Job.__table__
+    running = jobs.alias('running')
+    candidate = jobs.alias('candidate')
+    limit = sa.case(QUEUES, value=running.c.queue, else_=DEFAULT_CONCURRENCY)
+    busy = sa.select(running.c.queue).where(running.c.status == 'running',
+                                            running.c.lease_until > sa.bindparam('now')) \
+        .group_by(running.c.queue).having(sa.func.count() >= limit)
+    chosen = sa.select(candidate.c.id).where(candidate.c.status == 'queued', candidate.c.run_at <= sa.bindparam('now'),
+                                             candidate.c.queue.not_in(busy))
+    if queues:
+        chosen = chosen.where(candidate.c.queue.in_(queues))
+    chosen = chosen.order_by(candidate.c.run_at, candidate.c.id).limit(1).scalar_subquery()
+    # Повторная проверка состояния: в PostgreSQL (READ COMMITTED) второй воркер, выбравший ту же задачу,
+    # после коммита первого перепроверяет только условия самого UPDATE и без неё захватил бы задачу снова
+    return jobs.update().where(jobs.c.id == chosen, jobs.c.status == 'queued') \
+        .values(status='running', attempts=jobs.c.attempts + 1, started_at=sa.bindparam('now'),
+                lease_until=sa.bindparam('lease_until')) \
+        .returning(jobs.c.id, jobs.c.queue, jobs.c.task, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts,
+                   jobs.c.run_at)
+
+
+# Захват ещё limit готовых задач с именем task, чтобы выполнить их в одной транзакции с уже захваченной
+# Задачи пачки учитываются в пределе очереди как выполняемые, но пачка занимает один поток воркера
+@functools.lru_cache(maxsize=None)
+def _batch_statement():
+    jobs = Job.__table__
+    chosen = sa.select(jobs.c.id).where(jobs.c.status == 'queued', jobs.c.task == sa.bindparam('task_name'),
+                                        jobs.c.run_at <= sa.bindparam('now')) \
+        .order_by(jobs.c.run_at, jobs.c.id).limit(sa.bindparam('limit'))
+    return jobs.update().where(jobs.c.id.in_(chosen), jobs.c.status == 'queued') \
+        .values(status='running', attempts=jobs.c.attempts + 1, started_at=sa.bindparam('now'),
+                lease_until=sa.bindparam('lease_until')) \
+        .returning(jobs.c.id, jobs.c.queue, jobs.c.task, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts,
+                   jobs.c.run_at)
+
+
+# Номер рекомендательной блокировки PostgreSQL, под которой выполняются захваты задач
+# Без неё два воркера одновременно видят одно и то же число выполняемых задач очереди и вместе превышают предел
+CLAIM_LOCK = 0x6a6f6273
+
+
+# Захват следующей готовой задачи, а для задач с batch больше 1 - и других готовых задач с тем же именем
+# Возвращает список строк (id, queue, task, payload, attempts, max_attempts, run_at), пустой, если задач нет
+def _claim(db_sess, queues=None):
+    if db_sess.get_bind().dialect.name == 'postgresql':
+        # Блокировка снимается коммитом захвата
+        db_sess.execute(sa.select(sa.func.pg_advisory_xact_lock(CLAIM_LOCK)))
+    now = datetime.datetime.now()
+    values = {'now': now, 'lease_until': now + datetime.timedelta(seconds=LEASE)}
+    row = db_sess.execute(_claim_statement(tuple(queues or ())), values).first()
+    rows = [] if row is None else [row]
+    batch = __tasks[row.task][3] if row is not None and row.task in __tasks else 1
+    if batch > 1:
+        rows += db_sess.execute(_batch_statement(), dict(values, task_name=row.task, limit=batch - 1)).all()
+    db_sess.commit()
+    return rows
+
+
+# Изменение захваченной задачи; столбцы SET берутся из ключей values, поэтому запрос строится один раз
+# Каждый захват увеличивает attempts, поэтому по номеру попытки видно, что задача всё ещё у этого воркера,
+# а не возвращена в очередь после истечения аренды и не захвачена заново
+FINISH = Job.__table__.update().where(Job.__table__.c.id == sa.bindparam('job_id'),
+                                      Job.__table__.c.status == 'running',
+                                      Job.__table__.c.attempts == sa.bindparam('attempt'))
+# Продление аренды захваченных задач
+RENEW = Job.__table__.update().where(Job.__table__.c.id.in_(sa.bindparam('job_ids', expanding=True)),
+                                     Job.__table__.c.status == 'running')
+
+
+# Аренда задачи истекла, и задача уже возвращена в очередь: изменения этого выполнения откатываются
+class LeaseExpired(Exception):
+    pass
+
+
+# Возвращает False, если задача больше не принадлежит этому захвату
+def _finish(db_sess, row, **values):
+    return db_sess.connection().execute(FINISH, dict(values, job_id=row.id, attempt=row.attempts)).rowcount == 1
+
+
+def _renew(db_sess, job_ids):
+    now = datetime.datetime.now()
+    db_sess.connection().execute(RENEW, {'job_ids': job_ids, 'lease_until': now + datetime.timedelta(seconds=LEASE)})
+
+
+# Задача с ошибкой возвращается в очередь с задержкой или, если попытки закончились, отмечается как failed
+# Возвращает исход и значения для _finish
+def _failure(row, error):
+    now = datetime.datetime.now()
+    if row.attempts < row.max_attempts:
+        delay = RETRY_DELAY * 2 ** (row.attempts - 1)
+        return 'retry', {'status': 'queued', 'run_at': now + datetime.timedelta(seconds=delay), 'lease_until': None,
+                         'error': error}
+    return 'failed', {'status': 'failed', 'finished_at': now, 'lease_until': None, 'error': error}
+
+
+# Выполнение одной задачи; задача пачки выполняется в своей точке сохранения, и её ошибка откатывает
+# только её изменения, а ошибка одиночной задачи откатывает всю транзакцию
+# Отметка о выполнении пишется вместе с изменениями задачи; если аренда уже истекла, откатываются и они
+# Возвращает исход и время выполнения
+def _run_task(db_sess, row, savepoint):
+    metrics.job_wait.observe(max((datetime.datetime.now() - row.run_at).total_seconds(), 0), queue=row.queue)
+    start = time.perf_counter()
+    try:
+        entry = __tasks.get(row.task)
+        if entry is None:
+            raise LookupError(f'задача {row.task} не зарегистрирована в этом процессе')
+        with db_sess.begin_nested() if savepoint else contextlib.nullcontext():
+            entry[0](db_sess, **json.loads(row.payload))
+            if not _finish(db_sess, row, status='done', finished_at=datetime.datetime.now(), lease_until=None,
+                           error=None):
+                raise LeaseExpired(f'аренда задачи {row.id} истекла до окончания выполнения')
+        outcome = 'done'
+    except LeaseExpired:
+        if not savepoint:
+            db_sess.rollback()
+        outcome = 'expired'
+    except Exception:
+        if not savepoint:
+            db_sess.rollback()
+        outcome, values = _failure(row, traceback.format_exc())
+        if not _finish(db_sess, row, **values):
+            outcome = 'expired'
+    return outcome, time.perf_counter() - start
+
+
+# Выполнение захваченных задач одной транзакцией: изменения всех задач пачки и отметки о выполнении
+# записываются одним коммитом; если не удался сам коммит, все задачи пачки считаются завершившимися ошибкой
+def _execute(rows):
+    db_sess = db_session.create_session()
+    try:
+        try:
+            savepoint = len(rows) > 1
+            if savepoint:
+                # Первая запись транзакции пачки - продление аренды: в SQLite точки сохранения задач тогда
+                # вкладываются в уже начатую транзакцию, а не начинают и не фиксируют собственную.
+                # Одиночная задача ничего не записывает заранее, чтобы не держать блокировку записи SQLite
+                # всё время своего выполнения
+                _renew(db_sess, [row.id for row in rows])
+            results = [_run_task(db_sess, row, savepoint) for row in rows]
+            db_sess.commit()
+        except Exception:
+            db_sess.rollback()
+            error = traceback.format_exc()
+            results = []
+            for row in rows:
+                outcome, values = _failure(row, error)
+                results.append((outcome if _finish(db_sess, row, **values) else 'expired', 0.0))
+            db_sess.commit()
+    finally:
+        db_sess.close()
+    for row, (outcome, elapsed) in zip(rows, results):
+        metrics.job_duration.observe(elapsed, queue=row.queue, task=row.task, outcome=outcome)
+    return [outcome for outcome, elapsed in results]
+
+
+# Задачи, аренда которых истекла (воркер завершился, не закончив), возвращаются в очередь,
+# а если попытки закончились - отмечаются как failed
+def recover(db_sess):
+    now = datetime.datetime.now()
+    expired = sa.and_(Job.status == 'running', Job.lease_until <= now)
+    db_sess.execute(sa.update(Job).where(expired, Job.attempts >= Job.max_attempts)
+                    .values(status='failed', finished_at=now, lease_until=None, error='истекло время выполнения'))
+    db_sess.execute(sa.update(Job).where(expired).values(status='queued', run_at=now, lease_until=None,
+                                                         error='истекло время выполнения'))
+    db_sess.commit()
+
+
+# Удаление выполненных задач старше KEEP_DONE
+def purge(db_sess):
+    now = datetime.datetime.now()
+    db_sess.execute(sa.delete(Job).where(Job.status == 'done', Job.finished_at < now - KEEP_DONE))
+    db_sess.commit()
+
+
+# Потоки, которые забирают и выполняют задачи очередей queues (None - всех)
+# Новые задачи этого процесса будят потоки сразу, задачи других процессов находятся опросом раз в POLL_INTERVAL
+class Worker:
+    def __init__(self, threads=THREADS, queues=None):
+        self.queues = queues
+        self.event = threading.Event()
+        self.stopping = False
+        self.halted = threading.Event()
+        self.recovered_at = 0.0
+        self.purged_at = 0.0
+        self.pid = os.getpid()
+        # Идентификаторы выполняемых задач, аренду которых продлевает поток jobs-lease
+        self.running = set()
+        self.running_lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, name=f'jobs-{number}', daemon=True)
+                        for number in range(threads)]
+        self.threads.append(threading.Thread(target=self._renew_leases, name='jobs-lease', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def wake(self):
+        self.event.set()
+
+    # Остановка после завершения текущих задач
+    def stop(self):
+        self.stopping = True
+        self.event.set()
+        self.halted.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self):
+        while not self.stopping:
+            self.event.clear()
+            db_sess = db_session.create_session()
+            try:
+                now = time.monotonic()
+                if now - self.recovered_at > LEASE:
+                    self.recovered_at = now
+                    recover(db_sess)
+                if now - self.purged_at > PURGE_INTERVAL:
+                    self.purged_at = now
+                    purge(db_sess)
+                rows = _claim(db_sess, self.queues)
+            except sa.exc.OperationalError:
+                # База занята дольше busy_timeout: попытка повторяется при следующем опросе
+                db_sess.rollback()
+                rows = []
+            finally:
+                db_sess.close()
+            if rows:
+                job_ids = {row.id for row in rows}
+                with self.running_lock:
+                    self.running |= job_ids
+                try:
+                    _execute(rows)
+                finally:
+                    with self.running_lock:
+                        self.running -= job_ids
+            else:
+                self.event.wait(POLL_INTERVAL)
+
+    # Продление аренды задач, которые выполняют потоки этого воркера, раз в RENEW_INTERVAL
+    def _renew_leases(self):
+        while not self.halted.wait(RENEW_INTERVAL):
+            with self.running_lock:
+                job_ids = list(self.running)
+            if not job_ids:
+                continue
+            db_sess = db_session.create_session()
+            try:
+                _renew(db_sess, job_ids)
+                db_sess.commit()
+            except sa.exc.OperationalError:
+                # База занята (например, записью самой задачи): аренда продлевается при следующей попытке
+                db_sess.rollback()
+            finally:
+                db_sess.close()
+
+
+# Воркер текущего процесса; после fork создаётся заново, потому что потоки не наследуются
+def get_worker(threads=THREADS) -> Worker:
+    global __worker
+    with __lock:
+        if __worker is None or __worker.pid != os.getpid():
+            __worker = Worker(threads)
+    return __worker
+
+
+def _wake():
+    worker = __worker
+    if worker is not None and worker.pid == os.getpid():
+        worker.wake()
+
+
+# Число задач по очередям и состояниям и возраст самой старой ожидающей задачи каждой очереди в секундах
+def stats():
+    now = datetime.datetime.now()
+    with db_session.get_engine().connect() as connection:
+        counts = connection.execute(
+            sa.select(Job.queue, Job.status, sa.func.count())
+            .where(Job.status.in_(('queued', 'running', 'failed'))).group_by(Job.queue, Job.status)
+        ).all()
+        oldest = connection.execute(
+            sa.select(Job.queue, sa.func.min(Job.run_at))
+            .where(Job.status == 'queued', Job.run_at <= now).group_by(Job.queue)
+        ).all()
+    return {'depth': {(queue, status): count for queue, status, count in counts},
+            'oldest': {queue: (now - run_at).total_seconds() for queue, run_at in oldest}}
+
+
+# Выполнение задач до Ctrl+C или SIGTERM (docker stop); текущие задачи перед выходом завершаются
+def _work(threads, queues):
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    worker = Worker(threads, queues)
+    try:
+        while not stopping.wait(POLL_INTERVAL):
+            pass
+    except KeyboardInterrupt:
+        pass
+    worker.stop()
+
+
+jobs_cli = AppGroup('jobs', help='Фоновые задачи.')
+
+
+@jobs_cli.command('work', help='Выполнение задач в отдельных процессах до Ctrl+C.')
+@click.option('--processes', default=1, show_default=True, type=click.IntRange(1), help='число процессов')
+@click.option('--threads', default=THREADS, show_default=True, type=click.IntRange(1),
+              help='число потоков в каждом процессе')
+@click.option('--queue', 'queues', multiple=True, help='очередь, по умолчанию все; можно указать несколько раз')
+def work_command(processes, threads, queues):
+    queues = list(queues) or None
+    click.echo(f'Воркеры: процессов {processes}, потоков {threads}, очереди {", ".join(queues or ["все"])}',
+               err=True)
+    if processes == 1:
+        _work(threads, queues)
+        return
+    children = [multiprocessing.Process(target=_work, args=(threads, queues)) for _ in range(processes)]
+    for child in children:
+        child.start()
+    # SIGTERM передаётся дочерним процессам, Ctrl+C они получают сами как процессы той же группы
+    signal.signal(signal.SIGTERM, lambda *args: [child.terminate() for child in children])
+    for child in children:
+        while child.is_alive():
+            try:
+                child.join()
+            except KeyboardInterrupt:
+                pass
+
+
+@jobs_cli.command('status', help='Число задач в очередях и последние ошибки.')
+def status_command():
+    values = stats()
+    for (queue, status), count in sorted(values['depth'].items()):
+        click.echo(f'{queue:<16}{status:<10}{count:>8}')
+    for queue, age in sorted(values['oldest'].items()):
+        click.echo(f'{queue:<16}ожидает {age:.1f} с')
+    db_sess = db_session.create_session()
+    try:
+        for job in db_sess.query(Job).filter(Job.status == 'failed').order_by(Job.finished_at.desc()) \
+                .limit(SHOWN_FAILURES):
+            last = (job.error or '').strip().splitlines()[-1:] or ['']
+            click.echo(f'#{job.id} {job.task} ({job.attempts} попыток, {job.finished_at:%Y-%m-%d %H:%M:%S}): '
+                       f'{last[0]}', err=True)
+    finally:
+        db_sess.close()
+    if any(status == 'failed' for _, status in values['depth']):
+        sys.exit(1)
+
+
+# JOB_WORKERS - число потоков-воркеров в каждом процессе приложения; они запускаются с первым запросом,
+# чтобы после fork воркеров gunicorn у каждого процесса были свои потоки
+# При 0 задачи только добавляются, а выполняют их отдельные процессы flask jobs work
+def init_app(app):
+    threads = app.config.get('JOB_WORKERS', THREADS)
+    app.cli.add_command(jobs_cli)
+    if threads:
+        @app.before_request
+        def start_worker():
+            get_worker(threads)
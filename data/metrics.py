@@ -0,0 +1,324 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter as StackCounter
+
+# Границы корзин гистограмм длительности в секундах
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Интервал опроса стеков потоков профилировщиком в секундах
+PROFILE_INTERVAL = 0.005
+
+__registry = []
+__local = threading.local()
+
+
+def _register(metric):
+    __registry.append(metric)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for name, value in zip(names, values))
+    return '{' + ','.join(pairs) + '}'
+
+
+# Счётчик с метками; значения хранятся в памяти процесса
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = dict()
+        self.lock = threading.Lock()
+        _register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, self.labels, key, value) for key, value in self.values.items()]
+
+
+# Гистограмма с метками: число наблюдений в каждой корзине, сумма и количество
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = dict()
+        self.lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][position] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        result = []
+        names = self.labels + ('le',)
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    result.append((f'{self.name}_bucket', names, key + (repr(bound),), cumulative))
+                result.append((f'{self.name}_bucket', names, key + ('+Inf',), count))
+                result.append((f'{self.name}_sum', self.labels, key, total))
+                result.append((f'{self.name}_count', self.labels, key, count))
+        return result
+
+
+# Показатель, значения которого возвращает функция при каждом запросе /metrics
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, description, labels, collect):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.collect = collect
+        _register(self)
+
+    def samples(self):
+        return [(self.name, self.labels, key, value) for key, value in self.collect().items()]
+
+
+# Счётчик, который ведёт другой модуль: как и Gauge, значения возвращает функция, но тип в /metrics - counter,
+# чтобы rate() и increase() учитывали сброс при перезапуске процесса
+class CollectedCounter(Gauge):
+    kind = 'counter'
+
+
+# Текст в формате Prometheus для всех показателей процесса
+def render():
+    lines = []
+    for metric in __registry:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, label_names, label_values, value in metric.samples():
+            lines.append(f'{name}{_format_labels(label_names, label_values)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+request_duration = Histogram('http_request_duration_seconds', 'Длительность обработки запроса', ('route', 'method'))
+requests_total = Counter('http_requests_total', 'Число запросов', ('route', 'method', 'status'))
+db_queries = Counter('db_queries_total', 'Число SQL-запросов', ('route',))
+db_query_seconds = Counter('db_query_seconds_total', 'Суммарное время SQL-запросов', ('route',))
+template_duration = Histogram('template_render_duration_seconds', 'Время отрисовки шаблона', ('template',))
+file_io_duration = Histogram('file_cache_io_duration_seconds', 'Время чтения и записи файлового кэша',
+                             ('operation',))
+password_duration = Histogram('password_hash_duration_seconds', 'Время хэширования и проверки пароля',
+                              ('operation',))
+job_wait = Histogram('job_wait_seconds', 'Время от готовности фоновой задачи до начала её выполнения', ('queue',))
+job_duration = Histogram('job_duration_seconds', 'Время выполнения фоновой задачи', ('queue', 'task', 'outcome'))
+slow_profiles = Counter('slow_request_profiles_total', 'Число сохранённых профилей медленных запросов',
+                        ('route',))
+
+
+# Показатели других модулей, которые уже считаются в их stats()
+def _page_cache_hits():
+    from . import page_cache
+    return {(name,): stats['hit_rate'] for name, stats in page_cache.stats().items()}
+
+
+def _user_cache_hits():
+    from . import user_cache
+    return {(): user_cache.stats()['hit_rate']}
+
+
+def _db_connections():
+    from . import db_session
+    return {(name,): value for name, value in db_session.stats().items()}
+
+
+def _rejected_logins():
+    from . import passwords
+    return {(): passwords.stats()['rejected_logins']}
+
+
+# Очередь фоновых задач общая для процессов, поэтому её размер берётся из базы
+def _job_depth():
+    from . import jobs
+    return jobs.stats()['depth']
+
+
+def _job_oldest():
+    from . import jobs
+    return {(queue,): age for queue, age in jobs.stats()['oldest'].items()}
+
+
+Gauge('page_cache_hit_ratio', 'Доля попаданий в кэш страниц и карточек', ('cache',), _page_cache_hits)
+Gauge('user_cache_hit_ratio', 'Доля попаданий в кэш пользователей', (), _user_cache_hits)
+Gauge('db_connections', 'Открытые сессии и выданные пулом соединения', ('kind',), _db_connections)
+CollectedCounter('login_rejected_total', 'Число входов, отклонённых из-за очереди проверки паролей', (), _rejected_logins)
+Gauge('job_queue_depth', 'Фоновые задачи по очередям: ожидающие, выполняемые и с ошибкой', ('queue', 'state'),
+      _job_depth)
+Gauge('job_queue_oldest_seconds', 'Сколько ждёт самая старая готовая задача очереди', ('queue',), _job_oldest)
+
+
+# Текущий маршрут потока: запросы к базе вне обработки запроса (фоновые задачи, скрипты) относятся к background
+def current_route():
+    return getattr(__local, 'route', 'background')
+
+
+# Измерение длительности блока: with metrics.timed(metrics.file_io_duration, operation='get')
+class timed:
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+# Профилировщик: отдельный поток опрашивает стеки потоков, которые обрабатывают запросы
+# Стеки записываются в свёрнутом формате flamegraph.pl и speedscope: "функция;функция;... число"
+class Sampler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.threads = dict()
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, name='metrics-sampler', daemon=True)
+        self.thread.start()
+
+    def start(self, thread_id):
+        with self.lock:
+            self.threads[thread_id] = StackCounter()
+
+    def stop(self, thread_id):
+        with self.lock:
+            return self.threads.pop(thread_id, StackCounter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.threads:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self.threads.items():
+                    frame = frames.get(thread_id)
+                    names = []
+                    while frame is not None:
+                        code = frame.f_code
+                        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                        frame = frame.f_back
+                    if names:
+                        stacks[';'.join(reversed(names))] += 1
+
+
+__sampler = None
+__sampler_lock = threading.Lock()
+
+
+# Профилировщик текущего процесса; после fork создаётся заново, потому что поток не наследуется
+def get_sampler() -> Sampler:
+    global __sampler
+    with __sampler_lock:
+        if __sampler is None or __sampler.pid != os.getpid():
+            __sampler = Sampler()
+    return __sampler
+
+
+def _write_profile(directory, route, duration, stacks):
+    os.makedirs(directory, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{route.replace(".", "_")}-{int(duration * 1000)}ms-{os.getpid()}.folded'
+    with open(os.path.join(directory, name), 'w', encoding='utf-8') as profile:
+        for stack, count in stacks.most_common():
+            profile.write(f'{stack} {count}\n')
+
+
+def _on_query_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _on_query_end(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    route = current_route()
+    db_queries.inc(route=route)
+    db_query_seconds.inc(elapsed, route=route)
+    if hasattr(__local, 'queries'):
+        __local.queries += 1
+
+
+def _on_template_start(sender, template, context, **extra):
+    __local.__dict__.setdefault('templates', []).append(time.perf_counter())
+
+
+def _on_template_end(sender, template, context, **extra):
+    starts = getattr(__local, 'templates', None)
+    if starts:
+        template_duration.observe(time.perf_counter() - starts.pop(), template=template.name or '?')
+
+
+# Подключение к приложению: время запросов, SQL-запросы на движке из db_session.global_init,
+# время отрисовки шаблонов и адрес /metrics
+# PROFILE_SLOW_REQUESTS (секунды) включает профилирование: стеки запросов дольше порога сохраняются в PROFILE_DIR
+def init_app(app):
+    import sqlalchemy as sa
+    from flask import Response, before_render_template, g, request, template_rendered
+    from . import db_session
+
+    threshold = app.config.get('PROFILE_SLOW_REQUESTS')
+    directory = app.config.get('PROFILE_DIR', 'profiles')
+    engine = db_session.get_engine()
+    sa.event.listen(engine, 'before_cursor_execute', _on_query_start)
+    sa.event.listen(engine, 'after_cursor_execute', _on_query_end)
+    before_render_template.connect(_on_template_start, app)
+    template_rendered.connect(_on_template_end, app)
+
+    @app.before_request
+    def start_request():
+        __local.route = request.endpoint or 'unknown'
+        __local.queries = 0
+        g.metrics_start = time.perf_counter()
+        if threshold is not None:
+            get_sampler().start(threading.get_ident())
+
+    @app.after_request
+    def finish_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        route = request.endpoint or 'unknown'
+        request_duration.observe(duration, route=route, method=request.method)
+        requests_total.inc(route=route, method=request.method, status=response.status_code)
+        response.headers['Server-Timing'] = f'app;dur={duration * 1000:.1f}, db;desc="{__local.queries} queries"'
+        if threshold is not None:
+            stacks = get_sampler().stop(threading.get_ident())
+            if duration >= threshold and stacks:
+                _write_profile(directory, route, duration, stacks)
+                slow_profiles.inc(route=route)
+        __local.route = 'background'
+        return response
+
+    def metrics_view():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,11 @@
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+from sqlalchemy_serializer import SerializerMixin
+
+
+class Order(SerializerMixin, SqlAlchemyBase):
+    __tablename__ = 'orders'
+    # Номера заказов только растут и не используются повторно после удаления последнего заказа
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'), index=True, nullable=False)
@@ -0,0 +1,14 @@
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+from sqlalchemy_serializer import SerializerMixin
+
+
+class OrderLine(SerializerMixin, SqlAlchemyBase):
+    __tablename__ = 'order_lines'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    order_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('orders.id'), index=True, nullable=False)
+    item_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('items.id'), nullable=False)
+    currency_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('currencies.id'), nullable=False)
+    price = sqlalchemy.Column(sqlalchemy.Float, nullable=False)
+    discount = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
+    discount_price = sqlalchemy.Column(sqlalchemy.Float, nullable=True)
@@ -0,0 +1,25 @@
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+from sqlalchemy_serializer import SerializerMixin
+
+
+# Сумма заказа по каждой валюте, записывается при оформлении заказа
+class OrderTotal(SerializerMixin, SqlAlchemyBase):
+    __tablename__ = 'order_totals'
+    order_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('orders.id'), primary_key=True)
+    currency_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('currencies.id'), primary_key=True)
+    amount = sqlalchemy.Column(sqlalchemy.Float, nullable=False)
+
+
+# Суммы заказов, оформленных до появления таблицы, считаются один раз при её создании
+# Запрос выполняется после создания всех таблиц, потому что order_lines может создаваться позже order_totals
+def _fill_totals(target, connection, tables=(), **kw):
+    if OrderTotal.__table__ in tables:
+        connection.execute(sqlalchemy.text(
+            "INSERT INTO order_totals (order_id, currency_id, amount) "
+            "SELECT order_id, currency_id, SUM(COALESCE(discount_price, price)) FROM order_lines "
+            "GROUP BY order_id, currency_id"
+        ))
+
+
+sqlalchemy.event.listen(SqlAlchemyBase.metadata, 'after_create', _fill_totals)
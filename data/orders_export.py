@@ -0,0 +1,42 @@
+import io
+import csv
+import json
+from . import account_store
+from .catalog import get_catalog
+
+CSV_COLUMNS = ('order_id', 'item_id', 'item_name', 'currency_id', 'price', 'discount', 'discount_price')
+
+
+# Строки CSV: заголовок и по строке на каждую позицию заказа
+def csv_rows(db_sess, user_id):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    items = get_catalog().items
+    for order_id, lines, totals in account_store.iter_orders(db_sess, user_id):
+        for line in lines:
+            item = items.get(line.item_id)
+            writer.writerow((order_id, line.item_id, item.name if item else '', line.currency_id, line.price,
+                             '' if line.discount is None else line.discount,
+                             '' if line.discount_price is None else line.discount_price))
+        yield flush()
+
+
+# Строки NDJSON: по объекту JSON на каждый заказ с позициями и суммой по валютам
+def ndjson_rows(db_sess, user_id):
+    for order_id, lines, totals in account_store.iter_orders(db_sess, user_id):
+        order = {'id': order_id,
+                 'totals': [{'currency_id': currency_id, 'amount': amount} for currency_id, amount in totals.items()],
+                 'lines': [{field: getattr(line, field) for field in account_store.LINE_FIELDS} for line in lines]}
+        yield json.dumps(order, ensure_ascii=False) + '\n'
+
+
+FORMATS = {'csv': csv_rows, 'ndjson': ndjson_rows}
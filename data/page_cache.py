@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from flask import request, make_response, render_template
+from flask_login import current_user
+from markupsafe import Markup
+from . import metrics
+from .catalog import get_catalog
+from .store_context import current_store_id
+
+# Размер кэша в памяти (число записей) и время жизни записи в секундах
+MAX_SIZE = 512
+TTL = 300
+
+
+# Записи в файлах общего каталога, чтобы кэш был общим для всех процессов-воркеров
+class FileCache:
+    def __init__(self, directory, ttl=TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        with metrics.timed(metrics.file_io_duration, operation='read'):
+            try:
+                if time.time() - os.path.getmtime(path) > self.ttl:
+                    return None
+                with open(path, 'r', encoding='utf-8') as cachefile:
+                    return json.load(cachefile)
+            except (OSError, ValueError):
+                return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        # Запись во временный файл и переименование, чтобы другие процессы не прочитали файл наполовину
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        with metrics.timed(metrics.file_io_duration, operation='write'):
+            with open(temporary, 'w', encoding='utf-8') as cachefile:
+                json.dump(value, cachefile)
+            os.replace(temporary, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+# Ограниченный LRU-кэш с временем жизни записей и необязательным файловым кэшем за ним
+class LRUCache:
+    def __init__(self, max_size=MAX_SIZE, ttl=TTL, backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _set_local(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        value = self._get_local(key)
+        if value is None and self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.backend_hits += 1
+                self._set_local(key, value)
+                return value
+        if value is None:
+            self.misses += 1
+        return value
+
+    def set(self, key, value):
+        self._set_local(key, value)
+        if self.backend is not None:
+            self.backend.set(key, value)
+
+    def get_or_render(self, key, render):
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.set(key, value)
+        return value
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        requests = self.hits + self.backend_hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'backend_hits': self.backend_hits,
+                'misses': self.misses, 'hit_rate': (self.hits + self.backend_hits) / requests if requests else 0.0}
+
+
+# Кэш целых страниц и кэш фрагментов (карточек товаров)
+pages = LRUCache()
+fragments = LRUCache(max_size=4096)
+
+
+# Подключение файлового кэша, если в настройках приложения указан каталог PAGE_CACHE_DIR
+def init_app(app):
+    directory = app.config.get('PAGE_CACHE_DIR')
+    if directory:
+        pages.backend = FileCache(os.path.join(directory, 'pages'), pages.ttl)
+        fragments.backend = FileCache(os.path.join(directory, 'fragments'), fragments.ttl)
+    app.jinja_env.globals['item_card'] = item_card
+
+
+# Кэширование страницы для анонимных посетителей отдельно для каждого магазина
+# Ответ получает ETag, поэтому повторный запрос с If-None-Match получает 304 без тела
+def cached_page(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_user.is_authenticated:
+            return view(*args, **kwargs)
+        key = ('page', request.path, current_store_id(), get_catalog().version)
+
+        def render():
+            body = view(*args, **kwargs)
+            return [hashlib.sha1(body.encode('utf-8')).hexdigest(), body]
+
+        etag, body = pages.get_or_render(key, render)
+        response = make_response(body)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    return wrapper
+
+
+# Страница, которая не зависит от магазина и пользователя (страницы ошибок)
+def cached_template(template_name):
+    return pages.get_or_render(('template', template_name), lambda: render_template(template_name))
+
+
+# Карточка товара для main_page.html и search.html
+def item_card(item):
+    key = ('card', item.id, current_store_id(), get_catalog().version)
+    return Markup(fragments.get_or_render(key, lambda: render_template('item_card.html', item=item)))
+
+
+def stats():
+    return {'pages': pages.stats(), 'fragments': fragments.stats()}
@@ -0,0 +1,106 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from werkzeug.security import generate_password_hash, check_password_hash
+from . import metrics
+
+# Параметры хэширования в формате werkzeug: scrypt:N:r:p или pbkdf2:sha256:<итерации>
+METHOD = 'scrypt:32768:8:1'
+# Число потоков хэширования; hashlib отпускает GIL, поэтому потоки выполняют хэширование параллельно
+POOL_SIZE = 4
+# Сколько проверок пароля при входе может ждать своей очереди и сколько секунд ждать свободного места
+LOGIN_CONCURRENCY = 16
+LOGIN_WAIT = 5
+
+__method = METHOD
+# Префикс хэша для __method в том виде, в котором его записывает werkzeug
+__prefix = None
+__pool_size = POOL_SIZE
+__pool = None
+__pid = None
+__lock = threading.Lock()
+__login_slots = threading.BoundedSemaphore(LOGIN_CONCURRENCY)
+__rejected = 0
+
+
+# Очередь проверок при входе заполнена
+class Busy(Exception):
+    pass
+
+
+# Параметры из настроек приложения PASSWORD_HASH_METHOD, PASSWORD_POOL_SIZE и LOGIN_CONCURRENCY
+def init_app(app):
+    global __method, __prefix, __pool_size, __login_slots, __pool
+    with __lock:
+        __method = app.config.get('PASSWORD_HASH_METHOD', METHOD)
+        __prefix = None
+        __pool_size = app.config.get('PASSWORD_POOL_SIZE', POOL_SIZE)
+        __login_slots = threading.BoundedSemaphore(app.config.get('LOGIN_CONCURRENCY', LOGIN_CONCURRENCY))
+        if __pool is not None:
+            __pool.shutdown(wait=False)
+            __pool = None
+
+
+# Пул текущего процесса; после fork создаётся заново, потому что потоки не наследуются
+def _get_pool():
+    global __pool, __pid
+    with __lock:
+        if __pool is None or __pid != os.getpid():
+            __pool = ThreadPoolExecutor(max_workers=__pool_size, thread_name_prefix='password-hash')
+            __pid = os.getpid()
+    return __pool
+
+
+# Префикс, который werkzeug записывает для текущих параметров: метод без параметров (scrypt, pbkdf2:sha256)
+# хранится в хэше с подставленными значениями по умолчанию (scrypt:32768:8:1), поэтому префикс берётся
+# из хэша пробного пароля; он считается один раз на процесс
+def _method_prefix():
+    global __prefix
+    prefix = __prefix
+    if prefix is None:
+        prefix = __prefix = generate_password_hash('', method=__method).split('$', 1)[0]
+    return prefix
+
+
+# Хэш создан с другими параметрами, чем текущие
+def needs_rehash(hashed):
+    return hashed.split('$', 1)[0] != _method_prefix()
+
+
+def _check(hashed, password):
+    if not hashed or not check_password_hash(hashed, password):
+        return False, None
+    if needs_rehash(hashed):
+        return True, generate_password_hash(password, method=__method)
+    return True, None
+
+
+def hash_password(password):
+    with metrics.timed(metrics.password_duration, operation='hash'):
+        return _get_pool().submit(generate_password_hash, password, __method).result()
+
+
+# Проверка пароля в пуле хэширования
+# Возвращает результат проверки и новый хэш, если пароль верен, а параметры хэширования изменились
+def check_password(hashed, password):
+    with metrics.timed(metrics.password_duration, operation='check'):
+        return _get_pool().submit(_check, hashed, password).result()
+
+
+# Место в очереди проверок пароля при входе; если мест нет дольше timeout секунд, возникает Busy
+@contextmanager
+def login_slot(timeout=LOGIN_WAIT):
+    global __rejected
+    slots = __login_slots
+    if not slots.acquire(timeout=timeout):
+        __rejected += 1
+        raise Busy()
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def stats():
+    return {'method': __method, 'pool_size': __pool_size, 'rejected_logins': __rejected}
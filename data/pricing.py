@@ -0,0 +1,142 @@
+import time
+import threading
+import numpy as np
+from .catalog import get_catalog
+
+# Начальное значение генератора цен и длительность периода в секундах, в течение которого цены не меняются
+SEED = 20241221
+BUCKET_SECONDS = 3600
+# Наибольшая случайная цена, скидка выпадает одному товару из DISCOUNT_CHANCE, размер скидки до MAX_DISCOUNT %
+MAX_PRICE = 99999999
+DISCOUNT_CHANCE = 10
+MAX_DISCOUNT = 400
+
+__table = None
+__previous = None
+__lock = threading.Lock()
+
+
+# Цена товара: валюта, цена, скидка в процентах и цена со скидкой (None, если скидки нет)
+class Quote:
+    __slots__ = ('item_id', 'currency_id', 'price', 'discount', 'discount_price')
+
+    def __init__(self, item_id, currency_id, price, discount, discount_price):
+        for name, value in zip(self.__slots__, (item_id, currency_id, price, discount, discount_price)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} доступен только для чтения')
+
+    def __repr__(self):
+        return f'{type(self).__name__}(item_id={self.item_id!r}, price={self.price!r})'
+
+    # Совпадение с ценой из запроса; отсутствие скидки в запросе передаётся как None
+    def matches(self, currency_id, price, discount, discount_price):
+        return (currency_id == self.currency_id and price == self.price and discount == self.discount
+                and discount_price == self.discount_price)
+
+
+# Цены всех товаров одного периода в массивах, индекс массива - идентификатор товара
+# Массивы только для чтения, поэтому таблица общая для всех потоков процесса
+class PriceTable:
+    __slots__ = ('bucket', 'version', 'price', 'currency', 'discount', 'discount_price', 'whole_price',
+                 'whole_discount')
+
+    def __init__(self, bucket, version, **arrays):
+        self.bucket = bucket
+        self.version = version
+        for name, array in arrays.items():
+            array.setflags(write=False)
+            setattr(self, name, array)
+
+    def quote(self, item_id):
+        if item_id is None or not 0 <= item_id < len(self.price) or np.isnan(self.price[item_id]):
+            return None
+        price = self.price[item_id].item()
+        discount = int(self.discount[item_id]) or None
+        discount_price = self.discount_price[item_id].item() if discount else None
+        if self.whole_price[item_id]:
+            price = int(price)
+        if discount and self.whole_discount[item_id]:
+            discount_price = int(discount_price)
+        return Quote(item_id, int(self.currency[item_id]), price, discount, discount_price)
+
+
+# Пересчёт цен всего каталога для периода bucket одним набором векторных операций
+# Цена зависит только от SEED, периода и идентификатора товара, поэтому все процессы получают одинаковые цены
+def reprice(catalog, bucket, seed=SEED):
+    size = max(catalog.items, default=0) + 1
+    rng = np.random.default_rng([seed, bucket])
+    # Случайное целое число, делённое на 10 в степени от 0 до числа его цифр
+    raw = rng.integers(0, MAX_PRICE, size, endpoint=True)
+    digits = np.floor(np.log10(np.maximum(raw, 1))).astype(np.int64) + 1
+    price = raw / 10.0 ** rng.integers(0, digits, endpoint=True)
+    currency_ids = np.array([i.id for i in catalog.currency_list], dtype=np.int32)
+    currency = currency_ids[rng.integers(0, len(currency_ids), size)]
+    whole_price = np.zeros(size, dtype=bool)
+    # Особая цена и валюта товара заменяют случайные
+    special = [(i.id, i.special_price, i.special_currency) for i in catalog.item_list if i.special_price]
+    if special:
+        ids, prices, currencies = map(list, zip(*special))
+        price[ids] = prices
+        currency[ids] = currencies
+        whole_price[ids] = True
+    discounted = rng.integers(1, DISCOUNT_CHANCE, size, endpoint=True) == DISCOUNT_CHANCE
+    discount = np.where(discounted, rng.integers(1, MAX_DISCOUNT, size, endpoint=True), 0).astype(np.int16)
+    discount_price = np.where(discounted, price - price * discount / 100, np.nan)
+    # Для целочисленных валют цены со скидкой округляются к нулю
+    integer = np.zeros(int(currency_ids.max(initial=0)) + 1, dtype=bool)
+    integer[[i.id for i in catalog.currency_list if i.is_integer]] = True
+    whole_discount = discounted & integer[currency]
+    price = np.where(whole_discount, np.trunc(price), price)
+    discount_price = np.where(whole_discount, np.trunc(discount_price), discount_price)
+    whole_price |= whole_discount
+    # Идентификаторы без товара
+    missing = np.ones(size, dtype=bool)
+    missing[list(catalog.items)] = False
+    price[missing] = np.nan
+    return PriceTable(bucket, catalog.version, price=price, currency=currency, discount=discount,
+                      discount_price=discount_price, whole_price=whole_price, whole_discount=whole_discount)
+
+
+def current_bucket(now=None):
+    return int((time.time() if now is None else now) // BUCKET_SECONDS)
+
+
+# Таблица цен текущего периода; пересчитывается в начале нового периода и после изменения каталога
+def get_prices() -> PriceTable:
+    global __table, __previous
+    bucket = current_bucket()
+    catalog = get_catalog()
+    table = __table
+    if table is not None and table.bucket == bucket and table.version == catalog.version:
+        return table
+    with __lock:
+        if __table is None or __table.bucket != bucket or __table.version != catalog.version:
+            if __table is not None and __table.bucket == bucket - 1 and __table.version == catalog.version:
+                __previous = __table
+            __table = reprice(catalog, bucket)
+        return __table
+
+
+# Таблица предыдущего периода, чтобы страница, открытая перед сменой цен, ещё могла добавить товар в корзину
+def _previous_prices(table):
+    global __previous
+    with __lock:
+        if __previous is None or __previous.bucket != table.bucket - 1 or __previous.version != table.version:
+            __previous = reprice(get_catalog(), table.bucket - 1)
+        return __previous
+
+
+# Цена товара, если цена из запроса совпадает с ценой текущего или предыдущего периода, иначе None
+def validate(item_id, currency_id, price, discount=None, discount_price=None):
+    table = get_prices()
+    quote = table.quote(item_id)
+    if quote is None:
+        return None
+    if quote.matches(currency_id, price, discount, discount_price):
+        return quote
+    quote = _previous_prices(table).quote(item_id)
+    if quote is not None and quote.matches(currency_id, price, discount, discount_price):
+        return quote
+    return None
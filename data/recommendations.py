@@ -0,0 +1,293 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import threading
+import numpy as np
+from .suggest import fold
+
+# Каталог с таблицей похожих товаров, которую собирает python build_recommendations.py
+DIRECTORY = os.path.join('db', 'recommendations')
+# Число похожих товаров, которое хранится для каждого товара
+TOP_N = 8
+# Слова свойств короче этой длины (предлоги, единицы измерения) не учитываются
+MIN_WORD = 3
+# Слова, которые встречаются больше чем у MAX_DF товаров, плохо отличают товары друг от друга и не учитываются
+# Время расчёта растёт как сумма квадратов числа товаров с каждым словом, поэтому порог ограничивает и его
+MAX_DF = 500
+# Прибавка к сходству товаров из одной категории
+CATEGORY_BONUS = 0.1
+# Число товаров, сходство которых считается за один шаг; ограничивает память пакетного расчёта
+BLOCK = 2048
+# Если изменилось больше этой доли товаров, таблица пересчитывается целиком
+FULL_REBUILD_SHARE = 0.2
+# Как часто (в секундах) проверять, не собрана ли новая таблица
+CHECK_INTERVAL = 5
+
+WORD = re.compile(rf'\w{{{MIN_WORD},}}')
+
+__table = None
+__checked_at = 0.0
+__lock = threading.Lock()
+
+
+# Файл в DIRECTORY с именем каталога текущей таблицы: таблица записывается в новый каталог,
+# а затем этот файл заменяется одним os.replace, поэтому читатель не получит файлы разных расчётов
+CURRENT = 'current'
+
+
+def _paths(directory, generation):
+    return {name: os.path.join(directory, generation, f'{name}.npy') for name in Table.__slots__}
+
+
+def _current(directory):
+    with open(os.path.join(directory, CURRENT), 'r', encoding='utf-8') as file:
+        return file.read().strip()
+
+
+# Слова всех свойств товара без учёта регистра
+def tokenize(description):
+    return {word for prop in (description or '').split(';') for word in WORD.findall(fold(prop))}
+
+
+# Отпечаток признаков товара: по нему пакетный расчёт находит изменившиеся товары
+def signature(category, tokens):
+    data = repr((category, sorted(tokens))).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little') or 1
+
+
+# Объединение диапазонов [start, start + length) в один массив позиций
+def _ranges(starts, lengths):
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+# Разреженные векторы TF-IDF товаров: строки (товары) с весами слов и списки товаров для каждого слова
+class Features:
+    def __init__(self, rows):
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.category = np.array([row[1] or 0 for row in rows], dtype=np.int64)
+        tokens = [row[2] for row in rows]
+        vocabulary = dict()
+        entry_row = []
+        entry_token = []
+        for position, words in enumerate(tokens):
+            for word in words:
+                entry_row.append(position)
+                entry_token.append(vocabulary.setdefault(word, len(vocabulary)))
+        entry_row = np.array(entry_row, dtype=np.int64)
+        entry_token = np.array(entry_token, dtype=np.int64)
+        count = len(rows)
+        df = np.bincount(entry_token, minlength=len(vocabulary))
+        idf = np.log(max(count, 1) / np.maximum(df, 1))
+        # Слишком частые слова отбрасываются совсем, слова одного товара остаются только в норме вектора
+        common = df > MAX_DF
+        keep = ~common[entry_token]
+        entry_row, entry_token = entry_row[keep], entry_token[keep]
+        weight = idf[entry_token]
+        norm = np.sqrt(np.bincount(entry_row, weights=weight ** 2, minlength=count))
+        weight = weight / np.where(norm > 0, norm, 1)[entry_row]
+        order = np.argsort(entry_row, kind='stable')
+        self.row_token = entry_token[order]
+        self.row_weight = weight[order]
+        self.row_start = np.concatenate(([0], np.cumsum(np.bincount(entry_row, minlength=count))))
+        shared = df[entry_token] > 1
+        order = np.argsort(entry_token[shared], kind='stable')
+        self.post_row = entry_row[shared][order]
+        self.post_weight = weight[shared][order]
+        self.post_start = np.concatenate(([0], np.cumsum(np.bincount(entry_token[shared],
+                                                                        minlength=len(vocabulary)))))
+        self.signatures = np.array([signature(row[1], words) for row, words in zip(rows, tokens)],
+                                   dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Косинусное сходство строк positions со всеми товарами, у которых есть общие слова
+    # Возвращает пары (строка, другая строка, сходство)
+    def scores(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        lengths = self.row_start[positions + 1] - self.row_start[positions]
+        entries = _ranges(self.row_start[positions], lengths)
+        left = np.repeat(positions, lengths)
+        tokens = self.row_token[entries]
+        post_lengths = self.post_start[tokens + 1] - self.post_start[tokens]
+        posts = _ranges(self.post_start[tokens], post_lengths)
+        right = self.post_row[posts]
+        left = np.repeat(left, post_lengths)
+        values = np.repeat(self.row_weight[entries], post_lengths) * self.post_weight[posts]
+        other = left != right
+        keys, inverse = np.unique(left[other] * len(self) + right[other], return_inverse=True)
+        values = np.bincount(inverse, weights=values[other])
+        left, right = keys // len(self), keys % len(self)
+        return left, right, values + CATEGORY_BONUS * (self.category[left] == self.category[right])
+
+
+# Лучшие TOP_N пар для каждой строки: массивы строк, соседей и сходства, отсортированные по строке и сходству
+# Сходство не больше 1 + CATEGORY_BONUS, поэтому строка и сходство сводятся в один ключ сортировки;
+# устойчивая сортировка сохраняет порядок соседей с равным сходством
+def _top(left, right, values):
+    order = np.argsort(left * (2.0 + CATEGORY_BONUS) - values, kind='stable')
+    left, right, values = left[order], right[order], values[order]
+    rank = np.arange(len(left)) - np.searchsorted(left, left)
+    best = rank < TOP_N
+    return left[best], right[best], values[best]
+
+
+# Неизменяемая таблица: строка с номером id товара - идентификаторы похожих товаров (-1 - пусто) и их сходство
+class Table:
+    __slots__ = ('similar', 'scores', 'signatures')
+
+    def __init__(self, similar, scores, signatures):
+        self.similar = similar
+        self.scores = scores
+        self.signatures = signatures
+
+    def lookup(self, item_id):
+        if not 0 <= item_id < len(self.similar):
+            return ()
+        return [int(i) for i in self.similar[item_id] if i >= 0]
+
+
+# Пересчёт таблицы по строкам каталога (id, category, description)
+# С прошлой таблицей previous пересчитываются только строки изменившихся товаров и товаров, у которых
+# они были среди похожих; остальным добавляются изменившиеся товары, если те оказались ближе
+# Такой пересчёт приближённый: IDF общий для каталога, поэтому изменение описаний меняет веса слов и у строк,
+# которые не пересчитываются, и их сходство остаётся посчитанным по прежним весам. Полный пересчёт
+# (previous=None) нужно периодически запускать, чтобы отклонение не накапливалось
+# Возвращает таблицу и число пересчитанных строк
+def build(rows, previous=None):
+    rows = [(item_id, category, tokenize(description)) for item_id, category, description in rows]
+    features = Features(rows)
+    count = len(features)
+    size = int(features.ids.max(initial=-1)) + 1
+    position_of = np.full(max(size, 1), -1, dtype=np.int64)
+    position_of[features.ids] = np.arange(count)
+    recompute = np.arange(count)
+    merge = np.array([], dtype=np.int64)
+    if previous is not None and previous.similar.shape[1] == TOP_N:
+        old_signatures = np.zeros(size, dtype=np.uint64)
+        known = min(size, len(previous.signatures))
+        old_signatures[:known] = previous.signatures[:known]
+        changed = np.flatnonzero(old_signatures[features.ids] != features.signatures)
+        old_ids = np.flatnonzero(previous.signatures != 0)
+        removed = old_ids[~np.isin(old_ids, features.ids)]
+        dirty = np.concatenate((features.ids[changed], removed))
+        if len(dirty) <= count * FULL_REBUILD_SHARE:
+            old_similar = np.full((count, TOP_N), -1, dtype=np.int64)
+            inside = features.ids < len(previous.similar)
+            old_similar[inside] = previous.similar[features.ids[inside]]
+            affected = np.isin(old_similar, dirty).any(axis=1)
+            affected[changed] = True
+            recompute = np.flatnonzero(affected)
+            merge = np.flatnonzero(~affected)
+    similar = np.full((size, TOP_N), -1, dtype=np.int32)
+    scores = np.zeros((size, TOP_N), dtype=np.float32)
+    parts = []
+    for start in range(0, len(recompute), BLOCK):
+        parts.append(_top(*features.scores(recompute[start:start + BLOCK])))
+    if len(merge):
+        # Сходство симметрично: пары изменившихся товаров переворачиваются и добавляются к прежним соседям
+        left, right, values = features.scores(changed)
+        flip = np.isin(right, merge)
+        old_left = np.repeat(merge, TOP_N)
+        old_ids = previous.similar[features.ids[merge]].reshape(-1).astype(np.int64)
+        old_values = previous.scores[features.ids[merge]].reshape(-1).astype(np.float64)
+        # Дополненные из категории соседи (сходство 0) заново подбираются в _fill_from_category
+        present = (old_ids >= 0) & (old_values > 0)
+        rows = np.concatenate((right[flip], old_left[present]))
+        neighbours = np.concatenate((left[flip], position_of[old_ids[present]]))
+        values = np.concatenate((values[flip], old_values[present]))
+        order = np.lexsort((neighbours, rows))
+        parts.append(_top(rows[order], neighbours[order], values[order]))
+    for left, right, values in parts:
+        rank = np.arange(len(left)) - np.searchsorted(left, left)
+        similar[features.ids[left], rank] = features.ids[right]
+        scores[features.ids[left], rank] = values
+    _fill_from_category(features, similar)
+    signatures = np.zeros(size, dtype=np.uint64)
+    signatures[features.ids] = features.signatures
+    return Table(similar, scores, signatures), len(recompute)
+
+
+# Товары без общих слов с другими дополняются товарами той же категории, следующими по номеру
+def _fill_from_category(features, similar):
+    missing = np.flatnonzero(similar[features.ids, -1] < 0)
+    if not len(missing):
+        return
+    order = np.lexsort((features.ids, features.category))
+    members = dict()
+    for position in order:
+        members.setdefault(int(features.category[position]), []).append(int(features.ids[position]))
+    place = {item_id: number for group in members.values() for number, item_id in enumerate(group)}
+    for position in missing:
+        item_id = int(features.ids[position])
+        group = members[int(features.category[position])]
+        row = similar[item_id]
+        present = set(row[row >= 0].tolist())
+        free = np.flatnonzero(row < 0)
+        candidates = (group[(place[item_id] + shift) % len(group)] for shift in range(1, len(group)))
+        for slot, candidate in zip(free, (i for i in candidates if i not in present)):
+            row[slot] = candidate
+
+
+# Запись таблицы: массивы пишутся в новый каталог, затем на него переключается файл CURRENT
+# Каталог предыдущей таблицы остаётся, чтобы процесс, который уже прочитал CURRENT, успел её загрузить;
+# более старые каталоги удаляются
+def save(table, directory=DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    try:
+        previous = _current(directory)
+    except OSError:
+        previous = None
+    generation = f'table-{time.time_ns()}-{os.getpid()}'
+    os.makedirs(os.path.join(directory, generation))
+    for name, path in _paths(directory, generation).items():
+        np.save(path, getattr(table, name))
+    temporary = os.path.join(directory, f'{CURRENT}.{os.getpid()}.tmp')
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write(generation)
+    os.replace(temporary, os.path.join(directory, CURRENT))
+    for name in os.listdir(directory):
+        if name.startswith('table-') and name not in (generation, previous):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        elif name.endswith('.npy'):
+            # Файлы прежнего формата, в котором массивы лежали прямо в DIRECTORY
+            os.remove(os.path.join(directory, name))
+
+
+# Таблица из файлов; similar отображается в память, поэтому процессы-воркеры делят одну копию
+def load(directory=DIRECTORY, mmap_mode='r'):
+    try:
+        paths = _paths(directory, _current(directory))
+        return Table(*(np.load(paths[name], mmap_mode=mmap_mode) for name in Table.__slots__))
+    except (OSError, ValueError):
+        return None
+
+
+# Текущая таблица; время изменения файла CURRENT проверяется не чаще раза в CHECK_INTERVAL секунд
+def get_table():
+    global __table, __checked_at
+    now = time.monotonic()
+    if now - __checked_at < CHECK_INTERVAL:
+        return __table[1] if __table else None
+    with __lock:
+        if now - __checked_at >= CHECK_INTERVAL:
+            try:
+                mtime = os.path.getmtime(os.path.join(DIRECTORY, CURRENT))
+            except OSError:
+                mtime = None
+            if __table is None or __table[0] != mtime:
+                __table = (mtime, load() if mtime is not None else None)
+            __checked_at = now
+    return __table[1]
+
+
+# Похожие товары для страницы товара: одна строка таблицы, товары, удалённые из каталога, пропускаются
+def similar_items(catalog, item_id, limit=4):
+    table = get_table()
+    if table is None:
+        return []
+    found = (catalog.items.get(i) for i in table.lookup(item_id))
+    return [item for item in found if item is not None][:limit]
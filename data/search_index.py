@@ -0,0 +1,100 @@
+import re
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from .db_session import SqlAlchemyBase
+from .item import Item
+
+# Число товаров на странице результатов поиска
+PER_PAGE = 30
+# Вес совпадений в названии, описании и категории при ранжировании
+RANK_WEIGHTS = (10.0, 1.0, 0.0)
+
+# Полнотекстовый индекс FTS5 по названию и свойствам товара из таблицы items
+# unicode61 приводит кириллицу к нижнему регистру, а ';' между свойствами считает разделителем слов
+CREATE_INDEX = ("CREATE VIRTUAL TABLE items_fts USING fts5(name, description, category, "
+                "content='items', content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+# Триггеры поддерживают индекс в актуальном состоянии при изменении товаров
+TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN "
+    "INSERT INTO items_fts (rowid, name, description, category) "
+    "VALUES (new.id, new.name, new.description, new.category); END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN "
+    "INSERT INTO items_fts (items_fts, rowid, name, description, category) "
+    "VALUES ('delete', old.id, old.name, old.description, old.category); END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE ON items BEGIN "
+    "INSERT INTO items_fts (items_fts, rowid, name, description, category) "
+    "VALUES ('delete', old.id, old.name, old.description, old.category); "
+    "INSERT INTO items_fts (rowid, name, description, category) "
+    "VALUES (new.id, new.name, new.description, new.category); END"
+)
+
+
+# Создание индекса при первом запуске и заполнение его уже существующими товарами
+def _install(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    if not connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'items_fts'").first():
+        connection.exec_driver_sql(CREATE_INDEX)
+        connection.exec_driver_sql("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+    for trigger in TRIGGERS:
+        connection.exec_driver_sql(trigger)
+
+
+sa.event.listen(SqlAlchemyBase.metadata, 'after_create', _install)
+
+
+# Полная перестройка индекса, например после массового изменения таблицы items в обход триггеров
+def reindex(db_sess: Session):
+    db_sess.execute(sa.text("INSERT INTO items_fts (items_fts) VALUES ('rebuild')"))
+    db_sess.commit()
+
+
+# Добавление в индекс (или удаление из него при delete=True) товаров, выбранных условием condition, одним запросом
+# Нужно при массовом изменении таблицы items с отключёнными триггерами, как в flask catalog import;
+# удалять нужно до изменения товаров, потому что FTS5 с content='items' ищет удаляемые слова по старым значениям
+def index_items(connection, condition, delete=False):
+    columns = ['rowid', 'name', 'description', 'category']
+    values = [Item.id, Item.name, Item.description, Item.category]
+    if delete:
+        columns.insert(0, 'items_fts')
+        values.insert(0, sa.literal('delete'))
+    fts = sa.table('items_fts', *(sa.column(name) for name in columns))
+    connection.execute(fts.insert().from_select(columns, sa.select(*values).where(condition)))
+
+
+# Запрос FTS5: каждое слово ищется как префикс в названии или описании
+def _match_expression(text, category_id):
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    expression = '{name description}: (' + ' '.join(f'"{word}"*' for word in words) + ')'
+    if category_id is not None:
+        expression += f' AND category: "{int(category_id)}"'
+    return expression
+
+
+# Поиск без FTS5 для других СУБД
+def _like_search(db_sess: Session, text, category_id, page, per_page):
+    query = db_sess.query(Item.id).filter(Item.name.like(f"%{text}%"))
+    if category_id is not None:
+        query = query.filter(Item.category == category_id)
+    total = query.count()
+    ids = [i for i, in query.order_by(Item.id).limit(per_page).offset((page - 1) * per_page)]
+    return ids, total
+
+
+# Идентификаторы найденных товаров в порядке релевантности для страницы page и общее число результатов
+def search(db_sess: Session, text, category_id=None, page=1, per_page=PER_PAGE):
+    page = max(page, 1)
+    if db_sess.get_bind().dialect.name != 'sqlite':
+        return _like_search(db_sess, text, category_id, page, per_page)
+    expression = _match_expression(text, category_id)
+    if expression is None:
+        return [], 0
+    total = db_sess.execute(sa.text("SELECT count(*) FROM items_fts WHERE items_fts MATCH :expression"),
+                            {'expression': expression}).scalar()
+    ids = [i for i, in db_sess.execute(
+        sa.text("SELECT rowid FROM items_fts WHERE items_fts MATCH :expression "
+                f"ORDER BY bm25(items_fts, {', '.join(map(str, RANK_WEIGHTS))}) LIMIT :limit OFFSET :offset"),
+        {'expression': expression, 'limit': per_page, 'offset': (page - 1) * per_page})]
+    return ids, total
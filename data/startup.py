@@ -0,0 +1,72 @@
+import os
+import time
+import jinja2
+import sqlalchemy as sa
+from flask import current_app, jsonify
+from . import db_session, suggest, pricing, exchange_rates, recommendations
+from .catalog import get_catalog
+from .store_context import get_store_settings
+
+# Каталог общего для процессов кэша скомпилированных шаблонов
+TEMPLATE_CACHE_DIR = os.path.join('cache', 'templates')
+
+
+# Компиляция всех шаблонов из templates/
+# Скомпилированный код записывается в кэш байт-кода, поэтому следующие процессы и перезапуски с теми же
+# шаблонами загружают готовый код вместо компиляции; при изменении шаблона запись кэша не совпадёт и обновится
+def compile_templates(app):
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+# Прогрев процесса до приёма запросов: шаблоны, снимок каталога, настройки магазинов, индекс подсказок,
+# таблицы цен и курсов и таблица похожих товаров
+# При preload_app в gunicorn прогрев выполняется один раз в главном процессе, и воркеры получают всё готовым после fork
+# Возвращает время каждого шага в секундах
+def warm(app):
+    steps = (
+        ('templates', lambda: compile_templates(app)),
+        ('catalog', get_catalog),
+        ('store_settings', get_store_settings),
+        ('suggest', suggest.get_index),
+        ('prices', pricing.get_prices),
+        ('exchange_rates', exchange_rates.get_rates),
+        ('recommendations', recommendations.get_table)
+    )
+    timings = dict()
+    # Снимок каталога строит адреса через url_for, поэтому прогрев выполняется в контексте запроса
+    with app.test_request_context('/'):
+        for name, step in steps:
+            start = time.perf_counter()
+            step()
+            timings[name] = round(time.perf_counter() - start, 4)
+    app.extensions['startup'] = {'ready': True, 'warmup': timings}
+    return timings
+
+
+# Проверка готовности для балансировщика и оркестратора: 200 после прогрева, если база отвечает, иначе 503
+def healthz():
+    state = current_app.extensions.get('startup', {'ready': False})
+    body = {'ready': state['ready'], 'warmup': state.get('warmup')}
+    try:
+        with db_session.get_engine().connect() as connection:
+            connection.execute(sa.text('SELECT 1'))
+        body['database'] = 'ok'
+    except sa.exc.SQLAlchemyError as error:
+        body['database'] = type(error).__name__
+    ready = body['ready'] and body['database'] == 'ok'
+    response = jsonify(body)
+    response.status_code = 200 if ready else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# Кэш байт-кода шаблонов в TEMPLATE_CACHE_DIR и адрес /healthz
+# Сам прогрев запускает точка входа сервера (wsgi.py), а не create_app, чтобы скрипты и команды flask
+# не тратили на него время
+def init_app(app):
+    directory = app.config.get('TEMPLATE_CACHE_DIR', TEMPLATE_CACHE_DIR)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = jinja2.FileSystemBytecodeCache(directory)
+    app.add_url_rule('/healthz', 'healthz', healthz)
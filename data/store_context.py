@@ -0,0 +1,47 @@
+import random
+from types import MappingProxyType
+from flask import session
+from .catalog import get_catalog
+
+# Ключ подписанной cookie-сессии Flask, в котором хранится выбранный магазин посетителя
+SESSION_KEY = 'store_id'
+
+# Готовые настройки всех магазинов для текущей версии каталога: (версия, {id магазина: настройки})
+__settings = (None, {})
+
+
+# Настройки страниц для каждого магазина считаются один раз на версию каталога
+def _all_settings(catalog):
+    global __settings
+    version, settings = __settings
+    if version != catalog.version:
+        settings = {i.id: MappingProxyType({'title': i.name, 'slogan': i.slogan,
+                                            'logotype': i.logotype_url, 'icon': i.icon_url})
+                    for i in catalog.store_list}
+        # Замена кортежа целиком атомарна, поэтому потоки не видят частично собранный словарь
+        __settings = (catalog.version, settings)
+    return settings
+
+
+# Магазин текущего посетителя; при первом визите выбирается случайный
+# Выбор хранится в cookie, поэтому одинаково виден всем процессам и потокам сервера
+def current_store_id():
+    catalog = get_catalog()
+    store_id = session.get(SESSION_KEY)
+    if store_id not in catalog.stores:
+        store_id = random.choice(catalog.store_list).id
+        session[SESSION_KEY] = store_id
+    return store_id
+
+
+# Переход в другой случайный магазин
+def switch_store():
+    catalog = get_catalog()
+    current = session.get(SESSION_KEY)
+    choices = [i.id for i in catalog.store_list if i.id != current] or [current]
+    session[SESSION_KEY] = random.choice(choices)
+
+
+# Копия настроек текущего магазина, которую страница может изменить (например, заголовок)
+def get_store_settings():
+    return dict(_all_settings(get_catalog())[current_store_id()])
@@ -0,0 +1,42 @@
+import random
+from array import array
+from sqlalchemy.orm import Session
+from .catalog import get_catalog, resolve_items
+
+# Наибольшее число товаров на главной странице вместе с особым предложением
+MAX_ITEMS = 30
+
+# Массив идентификаторов товаров для текущей версии каталога: (версия, массив)
+__ids = (None, array('l'))
+
+
+# На главной странице показывается четверть каталога, но не больше MAX_ITEMS товаров
+def storefront_size(total):
+    return min(total // 4, MAX_ITEMS)
+
+
+def _item_ids(catalog):
+    global __ids
+    version, ids = __ids
+    if version != catalog.version:
+        ids = array('l', catalog.items.keys())
+        __ids = (catalog.version, ids)
+    return ids
+
+
+# k случайных идентификаторов из массива за O(k): выбираются позиции, а не копируется весь массив
+def sample_from_array(ids, k):
+    return [ids[i] for i in random.sample(range(len(ids)), min(k, len(ids)))]
+
+
+# Товары для главной страницы и особое предложение
+# Снимок каталога уже держит все товары в памяти, поэтому идентификаторы выбираются из массива при любом его размере,
+# а не запросом ORDER BY RANDOM(), который просматривает всю таблицу
+# Краткое описание особого предложения (первое свойство) уже посчитано в записи каталога
+def pick_storefront(db_sess: Session):
+    catalog = get_catalog()
+    ids = sample_from_array(_item_ids(catalog), storefront_size(len(catalog.items)))
+    found = resolve_items(db_sess, ids)
+    items = [found[i] for i in ids if i in found]
+    special_offer = items.pop() if items else None
+    return items, special_offer
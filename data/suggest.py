@@ -0,0 +1,110 @@
+import os
+import re
+import bisect
+import threading
+from array import array
+from .catalog import get_catalog
+
+# Число подсказок по умолчанию и наибольшее число подсказок в одном ответе
+LIMIT = 8
+MAX_LIMIT = 20
+# Начала слов в названии: подсказка находит товар по началу любого слова, а не только первого
+WORD_START = re.compile(r'\b\w', re.UNICODE)
+
+__index = None
+# Процесс, в котором строится новый индекс; одновременно строится не больше одного индекса
+__building = None
+__lock = threading.Lock()
+
+
+# Приведение к одному регистру; «ё» заменяется на «е», как в полнотекстовом индексе (remove_diacritics)
+def fold(text):
+    return (text or '').casefold().replace('ё', 'е')
+
+
+# Отсортированный массив ключей с идентификаторами: поиск по префиксу - bisect и просмотр до первого
+# несовпадающего ключа, поэтому время не зависит от размера каталога
+# Ключ - название без регистра, начиная с каждого слова: «Большой стол» даёт ключи «большой стол» и «стол»
+class PrefixIndex:
+    __slots__ = ('keys', 'ids')
+
+    def __init__(self, entries):
+        keys = []
+        ids = array('l')
+        for record_id, name in entries:
+            folded = fold(name).strip()
+            for start in WORD_START.finditer(folded):
+                keys.append(folded[start.start():])
+                ids.append(record_id)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.ids = array('l', (ids[i] for i in order))
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Первые limit разных идентификаторов, у которых ключ начинается с prefix (уже приведённого через fold)
+    def search(self, prefix, limit):
+        found = []
+        seen = set()
+        position = bisect.bisect_left(self.keys, prefix)
+        keys = self.keys
+        while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+            record_id = self.ids[position]
+            if record_id not in seen:
+                seen.add(record_id)
+                found.append(record_id)
+            position += 1
+        return found
+
+
+# Индексы названий товаров и категорий одной версии каталога
+class SuggestIndex:
+    __slots__ = ('version', 'items', 'categories')
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        self.items = PrefixIndex((i.id, i.name) for i in catalog.item_list)
+        self.categories = PrefixIndex((i.id, i.name) for i in catalog.category_list)
+
+
+# Построение индекса новой версии каталога в фоновом потоке и атомарная замена ссылки на индекс
+def _rebuild(catalog):
+    global __index, __building
+    try:
+        __index = SuggestIndex(catalog)
+    finally:
+        __building = None
+
+
+# Индекс текущей версии каталога
+# Первый индекс процесса (обычно при прогреве) строится сразу. После изменения товаров или категорий
+# новый индекс строится в фоновом потоке, а запросы до его готовности получают индекс предыдущей версии;
+# если за время построения каталог снова изменился, следующий запрос запустит ещё одно построение
+def get_index(catalog=None) -> SuggestIndex:
+    global __index, __building
+    catalog = catalog or get_catalog()
+    index = __index
+    if index is not None and index.version == catalog.version:
+        return index
+    with __lock:
+        if __index is None:
+            __index = SuggestIndex(catalog)
+        elif __index.version != catalog.version and __building != os.getpid():
+            __building = os.getpid()
+            threading.Thread(target=_rebuild, args=(catalog,), name='suggest-index', daemon=True).start()
+        return __index
+
+
+# Подсказки для начала ввода: категории и товары, название которых содержит слово, начинающееся с text
+def suggest(text, limit=LIMIT):
+    prefix = fold(text).strip()
+    if not prefix:
+        return {'categories': [], 'items': []}
+    catalog = get_catalog()
+    index = get_index(catalog)
+    # Индекс предыдущей версии может содержать уже удалённые записи, они пропускаются
+    categories = [catalog.categories[i] for i in index.categories.search(prefix, limit) if i in catalog.categories]
+    items = [catalog.items[i] for i in index.items.search(prefix, limit) if i in catalog.items]
+    return {'categories': [{'id': i.id, 'name': i.name} for i in categories],
+            'items': [{'id': i.id, 'name': i.name, 'url': f'/item/{i.id}'} for i in items]}
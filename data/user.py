@@ -1,6 +1,6 @@
 import sqlalchemy
 from .db_session import SqlAlchemyBase
-from werkzeug.security import generate_password_hash, check_password_hash
+from . import passwords
 from flask_login import UserMixin
 
 
@@ -16,7 +16,11 @@ class User(SqlAlchemyBase, UserMixin):
     got_bonus = sqlalchemy.Column(sqlalchemy.Boolean, nullable=True)
 
     def set_password(self, password):
-        self.hashed_password = generate_password_hash(password)
+        self.hashed_password = passwords.hash_password(password)
 
+    # Если хэш создан с прежними параметрами, при верном пароле он заменяется новым, сохраняет его вызывающий код
     def check_password(self, password):
-        return check_password_hash(self.hashed_password, password)
\ No newline at end of file
+        valid, new_hash = passwords.check_password(self.hashed_password, password)
+        if new_hash:
+            self.hashed_password = new_hash
+        return valid
\ No newline at end of file
@@ -0,0 +1,53 @@
+from .page_cache import LRUCache
+from .user import User
+
+# Число пользователей в кэше процесса и время жизни записи в секундах
+# Другие процессы-воркеры узнают об изменении пользователя не позже чем через TTL секунд
+MAX_SIZE = 10000
+TTL = 30
+
+
+# Неизменяемая запись пользователя для Flask-Login, общая для потоков процесса
+class UserRecord:
+    __slots__ = ('id', 'email', 'name', 'surname', 'age', 'address', 'got_bonus')
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, user):
+        for name in self.__slots__:
+            object.__setattr__(self, name, getattr(user, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} доступен только для чтения')
+
+    def __repr__(self):
+        return f'{type(self).__name__}(id={self.id!r})'
+
+    def get_id(self):
+        return str(self.id)
+
+
+users = LRUCache(max_size=MAX_SIZE, ttl=TTL)
+
+
+# Пользователь по идентификатору из кэша, при промахе - один запрос к таблице users
+def get_user(db_sess, user_id):
+    user_id = int(user_id)
+    record = users.get(user_id)
+    if record is None:
+        user = db_sess.get(User, user_id)
+        if user is None:
+            return None
+        record = UserRecord(user)
+        users.set(user_id, record)
+    return record
+
+
+# Сброс записи после изменения пользователя в этом процессе
+def invalidate(user_id):
+    users.delete(int(user_id))
+
+
+def stats():
+    return users.stats()
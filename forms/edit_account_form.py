@@ -0,0 +1,8 @@
+from wtforms import PasswordField
+from wtforms.validators import Optional
+from forms.register_form import RegisterForm
+
+
+class EditAccountForm(RegisterForm):
+    password = PasswordField('Новый пароль', validators=[Optional()])
+    password_again = PasswordField('Повторите пароль', validators=[Optional()])
@@ -0,0 +1,14 @@
+import os
+import multiprocessing
+
+# Настройки gunicorn, адрес, число процессов и потоков задаются переменными окружения
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = 30
+# Приложение и схема базы создаются один раз в главном процессе,
+# пул соединений каждый воркер пересоздаёт после fork (см. data/db_session.py)
+preload_app = True
+# Файлы из /assets/ передаются системным вызовом sendfile без копирования в память процесса
+sendfile = True
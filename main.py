@@ -1,53 +1,88 @@
-from flask import Flask, url_for, redirect, render_template, request, abort
+from flask import Flask, Blueprint, Response, redirect, render_template, request, abort, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from data import db_session
-from data.store import Store
-from data.category import Category
-from data.item import Item
-from data.currency import Currency
+from data import db_session, account_store, search_index, page_cache, assets, passwords, user_cache, pricing, \
+    exchange_rates, orders_export, metrics, recommendations, catalog_io, jobs, account_jobs, startup
+from data.catalog import get_catalog, build_line_rows, resolve_items
+import api
+from data.store_context import get_store_settings, switch_store
+from data.storefront import pick_storefront
 from data.user import User
 from forms.register_form import RegisterForm
+from forms.edit_account_form import EditAccountForm
 from forms.login_form import LoginForm
 from forms.search_form import SearchForm
 import random
-import json
-
-
-# Запуск приложения через flask
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'yandexlyceum_store_secret_key'
+import math
+import os
+
+
+# Настройки приложения по умолчанию
+# Адрес базы данных можно переопределить переменной окружения DATABASE_URL
+DEFAULT_CONFIG = {
+    'SECRET_KEY': 'yandexlyceum_store_secret_key',
+    'DATABASE_URL': 'db/store_database.db',
+    # Каталог общего для процессов кэша страниц, по умолчанию кэш хранится только в памяти процесса
+    'PAGE_CACHE_DIR': os.environ.get('PAGE_CACHE_DIR'),
+    # Порог в секундах, после которого стеки запроса сохраняются в PROFILE_DIR; по умолчанию профилирование выключено
+    'PROFILE_SLOW_REQUESTS': float(os.environ['PROFILE_SLOW_REQUESTS']) if os.environ.get('PROFILE_SLOW_REQUESTS')
+    else None,
+    'PROFILE_DIR': os.environ.get('PROFILE_DIR', 'profiles'),
+    # Потоки фоновых задач в каждом процессе; при 0 задачи выполняют только процессы flask jobs work
+    'JOB_WORKERS': int(os.environ.get('JOB_WORKERS', jobs.THREADS)),
+    # Общий для процессов кэш скомпилированных шаблонов, пустая строка отключает его
+    'TEMPLATE_CACHE_DIR': os.environ.get('TEMPLATE_CACHE_DIR', startup.TEMPLATE_CACHE_DIR)
+}
+
+# Число похожих товаров на странице товара
+SIMILAR_ITEMS = 3
+
+# Страницы магазина регистрируются в приложении в create_app
+blueprint = Blueprint('main', __name__)
 # Создание менеджера логинов
 login_manager = LoginManager()
-login_manager.init_app(app)
-# Подключение к базе данных
-db_session.global_init("db/store_database.db")
-# Создание магазина - заглушки
-store = Store()
-
-
-# Функция выбирает случайный магазин из базы данных
-def set_current_store():
-    global store
-    session = db_session.create_session()
-    stores = session.query(Store).all()
-    store = random.choice(stores)
 
 
-# Получение данных от текущего магазина
-# Это нужно, чтобы легко менять название страниц
-def get_store_settings():
-    store_settings = dict()
-    store_settings['title'] = store.name
-    store_settings['slogan'] = store.slogan
-    store_settings['logotype'] = url_for('static', filename=f'img/logotypes/{store.logotype}')
-    store_settings['icon'] = url_for('static', filename=f'img/icons/{store.icon}')
-    return store_settings
-
-
-# Запуск сервера и выбор случайного магазина
+# Создание приложения: config дополняет и переопределяет DEFAULT_CONFIG
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config['DATABASE_URL'] = os.environ.get('DATABASE_URL', app.config['DATABASE_URL'])
+    if config:
+        app.config.update(config)
+    login_manager.init_app(app)
+    # Подключение к базе данных
+    db_session.global_init(app.config['DATABASE_URL'])
+    app.register_blueprint(blueprint)
+    app.teardown_appcontext(shutdown_session)
+    # Кэш страниц и карточек товаров, PAGE_CACHE_DIR включает общий для процессов файловый кэш
+    page_cache.init_app(app)
+    # Статические файлы с хэшем в имени по адресу /assets/ с кэшированием без повторных проверок
+    assets.init_app(app)
+    # Пул хэширования паролей и ограничение числа одновременных проверок при входе
+    passwords.init_app(app)
+    # JSON API корзины и заказов
+    api.init_app(app)
+    # Время запросов, SQL-запросов и шаблонов по адресу /metrics
+    metrics.init_app(app)
+    # Команды flask catalog import/export
+    catalog_io.init_app(app)
+    # Фоновые задачи и команды flask jobs
+    jobs.init_app(app)
+    # Кэш байт-кода шаблонов и проверка готовности /healthz
+    startup.init_app(app)
+    return app
+
+
+# Закрытие сессии базы данных в конце каждого запроса
+def shutdown_session(exception=None):
+    db_session.remove_session()
+
+
+# Запуск сервера разработки, для работы с несколькими процессами используется wsgi.py
 def main():
-    set_current_store()
-    app.run(host='0.0.0.0')
+    app = create_app()
+    startup.warm(app)
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
 
 
 def check_password(password):
@@ -66,21 +101,12 @@ def check_password(password):
 
 
 # Главная страница
-@app.route('/')
+@blueprint.route('/')
 def main_page():
-    # Создание сессии
-    session = db_session.create_session()
     # Получение данных текущего магазина
     store_settings = get_store_settings()
-    items = session.query(Item).all()
-    # Перестановка товаров в случайном порядке
-    random.shuffle(items)
-    items = items[:len(items) // 4]
-    # Выбор товара для особого предложения
-    special_offer = items.pop()
-    # Установка фото и описания для особого предложения
-    special_offer.photo_name = url_for('static', filename=f'img/items/{special_offer.photo_name}')
-    special_offer.description = special_offer.description.split(';')[0]
+    # Выбор случайных товаров и товара для особого предложения, его фото и краткое описание уже есть в каталоге
+    items, special_offer = pick_storefront(db_session.current_session())
     # Создание словаря для товаров на главной странице
     items = {
         'items': items,
@@ -91,12 +117,12 @@ def main_page():
 
 
 # Страница товара
-@app.route('/item/<int:item_id>')
+@blueprint.route('/item/<int:item_id>')
 def item_page(item_id):
     store_settings = get_store_settings()
-    session = db_session.create_session()
+    catalog = get_catalog()
     # Получение товара по идентификатору
-    item = session.query(Item).get(item_id)
+    item = catalog.items.get(item_id)
     if not item:
         # Если товар не найден, возвращаю особую страницу
         store_settings['title'] = '?????????'
@@ -106,39 +132,24 @@ def item_page(item_id):
         item_info = dict()
         item_info['item_id'] = item_id
         item_info['name'] = item.name
-        item_info['source'] = url_for('static', filename=f'img/items/{item.photo_name}')
+        item_info['source'] = item.photo_url
         store_settings['title'] = item.name
-        item_info['properties'] = item.description.split(';')
-        # Если у товара есть особая цена и валюта, добавляю их в словарь
-        if item.special_price:
-            item_info['price'] = item.special_price
-            currency = session.query(Currency).get(item.special_currency)
-        # Если нет, выбираем случайные цену и валюту и заносим их в словарь
-        else:
-            item_info['price'] = random.randint(0, 99999999)
-            item_info['price'] /= 10 ** random.randint(0, len(str(item_info['price'])))
-            currency = random.choice(session.query(Currency).all())
-        item_info['currency_id'] = currency.id
-        # Загрузка фото для валюты
-        item_info['currency'] = url_for('static', filename=f'img/currencies/'f'{currency.logotype}')
-        # Если будет скидка, определяю её размер и новую цену
-        if random.randint(1, 10) == 10:
-            # Размер скидки в процентах
-            item_info['discount'] = random.randint(1, 400)
-            # Преобразование цены в зависимости от размера скидки
-            item_info['discount_price'] = item_info['price'] - item_info['price'] * item_info['discount'] / 100
-            if currency.is_integer:
-                item_info['price'] = int(item_info['price'])
-                item_info['discount_price'] = int(item_info['discount_price'])
-        # Если нет, ставлю заглушку в словарь
-        else:
-            item_info['discount_price'] = None
-            item_info['discount'] = None
+        item_info['properties'] = item.properties
+        # Цена, валюта и скидка из таблицы цен текущего периода (особая цена товара, если она есть)
+        quote = pricing.get_prices().quote(item_id)
+        item_info['price'] = quote.price
+        item_info['currency_id'] = quote.currency_id
+        # Фото для валюты
+        item_info['currency'] = catalog.currencies[quote.currency_id].logo_url
+        item_info['discount'] = quote.discount
+        item_info['discount_price'] = quote.discount_price
+        # Похожие товары из таблицы, которую собирает python build_recommendations.py
+        item_info['similar'] = recommendations.similar_items(catalog, item_id, SIMILAR_ITEMS)
         return render_template('item_page.html', **store_settings, **item_info)
 
 
 # Страница регистрации
-@app.route('/register', methods=['GET', 'POST'])
+@blueprint.route('/register', methods=['GET', 'POST'])
 def register():
     # Загрузка формы регистрации
     form = RegisterForm()
@@ -155,7 +166,7 @@ def register():
         if not form.age.data.isnumeric():
             return render_template('register.html', form=form,
                                    message="Неверный возраст", **store_settings)
-        db_sess = db_session.create_session()
+        db_sess = db_session.current_session()
         if db_sess.query(User).filter(User.email == form.email.data).first():
             return render_template('register.html', form=form,
                                    message="Такой пользователь уже есть", **store_settings)
@@ -170,50 +181,57 @@ def register():
         )
         user.set_password(form.password.data)
         db_sess.add(user)
+        db_sess.flush()
+        # Пустой счёт создаёт фоновая задача, которая добавляется в той же транзакции, что и пользователь
+        jobs.enqueue(db_sess, 'accounts.create', {'user_id': user.id}, key=f'account:{user.id}')
         db_sess.commit()
-        # Создание json-файла с данными нового пользователя: счёт, корзина и заказы
-        with open(f'accounts/user_{user.id}.json', 'w', encoding='utf-8') as jsonfile:
-            data = {'shopping_cart': {'items': [], 'summary': {}}, 'orders': {}, 'currencies': dict()}
-            for i in db_sess.query(Currency).all():
-                data['currencies'][i.id] = 0
-            json.dump(data, jsonfile)
         return redirect("/")
     return render_template('register.html', form=form, **store_settings)
 
 
 # Страница входа в аккаунт
-@app.route('/login', methods=['GET', 'POST'])
+@blueprint.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     store_settings = get_store_settings()
     store_settings['title'] = 'Вход'
     # Проверка данных
     if form.validate_on_submit():
-        db_sess = db_session.create_session()
+        db_sess = db_session.current_session()
         user = db_sess.query(User).filter(User.email == form.email.data).first()
-        if user and user.check_password(form.password.data):
-            login_user(user, remember=form.remember_me.data)
-            return redirect("/")
         # Возврат страницы с сообщением в случае ошибки
-        elif not user:
+        if not user:
             return render_template('login.html',
                                    message="Пользователь не найден",
                                    form=form, **store_settings)
-        elif not user.check_password(form.password.data):
+        # Пароль проверяется один раз в пуле хэширования, запросы сверх очереди получают ответ 503
+        try:
+            with passwords.login_slot():
+                valid = user.check_password(form.password.data)
+        except passwords.Busy:
+            return render_template('login.html',
+                                   message="Слишком много попыток входа, попробуйте позже",
+                                   form=form, **store_settings), 503, {'Retry-After': '1'}
+        if not valid:
             return render_template('login.html',
                                    message="Неверный пароль",
                                    form=form, **store_settings)
+        # Сохранение хэша, пересчитанного с новыми параметрами
+        if user in db_sess.dirty:
+            db_sess.commit()
+        login_user(user, remember=form.remember_me.data)
+        return redirect("/")
     return render_template('login.html', form=form, **store_settings)
 
 
 # Страница изменения данных аккаунта
-@app.route('/edit_account', methods=['GET', 'POST'])
+@blueprint.route('/edit_account', methods=['GET', 'POST'])
 @login_required
 def edit_account():
     store_settings = get_store_settings()
     store_settings['title'] = 'Изменить данные'
-    edit_form = RegisterForm()
-    db_sess = db_session.create_session()
+    edit_form = EditAccountForm()
+    db_sess = db_session.current_session()
     user = db_sess.query(User).filter(User.id == current_user.id).first()
     if not user:
         return abort(404)
@@ -238,21 +256,23 @@ def edit_account():
         user.surname = edit_form.surname.data
         user.age = int(edit_form.age.data)
         user.address = edit_form.address.data
-        user.set_password(edit_form.password.data)
+        # Пустое поле пароля оставляет прежний пароль без повторного хэширования
+        if edit_form.password.data:
+            user.set_password(edit_form.password.data)
         db_sess.commit()
+        user_cache.invalidate(user.id)
         return redirect('/user_page')
     return render_template('register.html', form=edit_form, **store_settings)
 
 
-# Загрузка пользователя из базы данных
+# Загрузка пользователя: из кэша процесса, таблица users читается только при промахе
 @login_manager.user_loader
 def load_user(user_id):
-    db_sess = db_session.create_session()
-    return db_sess.query(User).get(user_id)
+    return user_cache.get_user(db_session.current_session(), user_id)
 
 
 # Функция для выхода из аккаунта
-@app.route('/logout')
+@blueprint.route('/logout')
 @login_required
 def logout():
     logout_user()
@@ -260,338 +280,256 @@ def logout():
 
 
 # Обновление страницы со сменой магазина
-@app.route('/refresh')
+@blueprint.route('/refresh')
 def refresh():
-    set_current_store()
+    switch_store()
     return redirect('/')
 
 
 # Личный кабинет пользователя
-@app.route('/user_page')
+@blueprint.route('/user_page')
 @login_required
 def user_page():
     store_settings = get_store_settings()
     store_settings['title'] = 'Личный кабинет'
-    db_sess = db_session.create_session()
-    # Загрузка данных о счёте из json-файла пользователя
-    with open(f'accounts/user_{current_user.id}.json', 'r', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)['currencies']
+    db_sess = db_session.current_session()
+    catalog = get_catalog()
     money = []
-    # Загрузка фотографий валют
-    for i in data.keys():
-        logo = db_sess.query(Currency).filter(Currency.id == int(i)).first().logotype
-        money.append(
-            [url_for('static', filename=f'img/currencies/{logo}'), data[i]])
-    return render_template('user_page.html', money=money, **store_settings)
+    amounts = dict()
+    # Загрузка счёта пользователя и фотографий валют
+    for balance in account_store.get_balances(db_sess, current_user.id):
+        money.append([catalog.currencies[balance.currency_id].logo_url, balance.amount])
+        amounts[balance.currency_id] = balance.amount
+    # Стоимость всего счёта в первой валюте справочника по текущим курсам
+    main_currency = catalog.currency_list[0]
+    total = [main_currency.logo_url, round(exchange_rates.get_rates().revalue(amounts, main_currency.id), 2)]
+    return render_template('user_page.html', money=money, total=total, **store_settings)
 
 
 # Получение бонуса пользователем
-@app.route('/get_bonus')
+@blueprint.route('/get_bonus')
 @login_required
 def get_bonus():
-    # Загрузка данных пользователя из json-файла
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        jsonfile.seek(0)
-        db_sess = db_session.create_session()
-        # Добавление случайного количества каждой валюты
-        for i in db_sess.query(Currency).all():
-            money = random.randint(0, 9999)
-            money /= 10 ** random.randint(0, len(str(money)))
-            if i.is_integer == 1:
-                money = int(money)
-            data['currencies'][str(i.id)] += money
-        # Запись в json-файл новых данных
-        json.dump(data, jsonfile)
-        # Смена значения логического флага got_bonus для текущего пользователя и записи в базе данных
-        user = db_sess.query(User).filter(User.id == current_user.id).first()
-        user.got_bonus = 1
-        current_user.got_bonus = 1
-        db_sess.commit()
+    grants = dict()
+    # Добавление случайного количества каждой валюты
+    for i in get_catalog().currency_list:
+        money = random.randint(0, 9999)
+        money /= 10 ** random.randint(0, len(str(money)))
+        if i.is_integer == 1:
+            money = int(money)
+        grants[i.id] = money
+    # Начисление и смена флага got_bonus происходят одной транзакцией в фоновой задаче, повторно бонус не выдаётся
+    # Ключ задачи не даёт поставить её в очередь второй раз при повторном нажатии
+    user_id = current_user.id
+    jobs.submit('accounts.bonus', {'user_id': user_id, 'grants': grants}, key=f'bonus:{user_id}')
     return redirect(f'/user_page')
 
 
 # Добавление товара в корзину
-@app.route('/add_to_cart')
+@blueprint.route('/add_to_cart')
 @login_required
 def add_to_cart():
-    info = dict()
-    # Получение информации из запроса
-    for i in ['item_id', 'currency_id', 'price', 'discount', 'discount_price']:
-        info[i] = request.args.get(i)
-    # Загрузка данных из файла пользователя
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        # Добавление информации о товаре
-        data['shopping_cart']['items'].append(info)
-        # Добавление цены товара к сумме цен товаров в корзине
-        if info['currency_id'] not in data['shopping_cart']['summary'].keys():
-            data['shopping_cart']['summary'][info['currency_id']] = 0
-        if info['discount_price'] != 'None':
-            data['shopping_cart']['summary'][info['currency_id']] += float(info['discount_price'])
-        else:
-            data['shopping_cart']['summary'][info['currency_id']] += float(info['price'])
-        # Перезапись данных
-        jsonfile.seek(0)
-        json.dump(data, jsonfile)
+    db_sess = db_session.current_session()
+    # Цена из запроса сверяется с таблицей цен, при расхождении открывается страница товара с новой ценой
+    item_id = request.args.get('item_id', type=int)
+    quote = pricing.validate(
+        item_id,
+        currency_id=request.args.get('currency_id', type=int),
+        price=request.args.get('price', type=float),
+        discount=request.args.get('discount', type=lambda value: account_store.parse_optional(value, int)),
+        discount_price=request.args.get('discount_price', type=account_store.parse_optional)
+    )
+    if quote is None:
+        return redirect(f'/item/{item_id}')
+    account_store.add_lines(db_sess, current_user.id, [quote])
     return redirect('/')
 
 
 # Страница корзины
-@app.route('/shopping_cart')
+@blueprint.route('/shopping_cart')
 @login_required
 def shopping_cart(message=None):
-    items = []
-    summary = {}
-    currencies = dict()
-    db_sess = db_session.create_session()
-    # Создание словаря с фотографиями валюты
-    for i in db_sess.query(Currency).all():
-        currencies[str(i.id)] = url_for('static', filename=f'img/currencies/{i.logotype}')
-    # Загрузка данных из файла
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        # Заполенение списка с информацией о товарах
-        for i in data['shopping_cart']['items']:
-            item = db_sess.query(Item).filter(Item.id == i['item_id']).first()
-            items.append({'name': item.name, 'price': i['price'], 'discount': i['discount'],
-                          'discount_price': i['discount_price'], 'currency': currencies[i['currency_id']],
-                          'image': url_for('static', filename=f'img/items/{item.photo_name}'), 'id': i['item_id']})
-        # Заполнение словаря с суммой цен товаров в корзине
-        for i in data['shopping_cart']['summary'].keys():
-            summary[i] = {'currency': currencies[i], 'price':  data['shopping_cart']['summary'][i]}
+    db_sess = db_session.current_session()
+    # Заполенение списка с информацией о товарах и суммы цен товаров в корзине
+    items, summary = build_line_rows(db_sess, account_store.get_cart(db_sess, current_user.id))
     store_settings = get_store_settings()
     store_settings['title'] = 'Корзина'
     return render_template('shopping_cart.html', items=items, summary=summary, message=message, **store_settings)
 
 
-# Удаление товара из корзины
-@app.route('/delete_from_cart/<int:item_id>')
+# Удаление позиции из корзины по её идентификатору
+@blueprint.route('/delete_from_cart/<int:line_id>')
 @login_required
-def delete_from_cart(item_id):
-    # Загрузка данных
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        for i in range(len(data['shopping_cart']['items'])):
-            # Удаление записи о товаре
-            if data['shopping_cart']['items'][i]['item_id'] == str(item_id):
-                item = data['shopping_cart']['items'][i]
-                del data['shopping_cart']['items'][i]
-                # Вычет цены из суммы цен товаров
-                if item['discount_price'] == 'None':
-                    data['shopping_cart']['summary'][item['currency_id']] -= float(item['price'])
-                else:
-                    data['shopping_cart']['summary'][item['currency_id']] -= float(item['discount_price'])
-                break
-        # Перезапись данных
-        jsonfile.seek(0)
-        jsonfile.truncate()
-        json.dump(data, jsonfile)
+def delete_from_cart(line_id):
+    db_sess = db_session.current_session()
+    account_store.remove_line(db_sess, current_user.id, line_id)
     return redirect('/shopping_cart')
 
 
 # Страница поиска
-@app.route('/search', methods=['GET', 'POST'])
+@blueprint.route('/search', methods=['GET', 'POST'])
 def search_page():
     # Загрузка формы
     form = SearchForm()
-    db_sess = db_session.create_session()
+    catalog = get_catalog()
     # Занесение категорий в форму
     form.category.choices = ['Всё']
-    form.category.choices.extend([i.name for i in db_sess.query(Category).all()])
+    form.category.choices.extend([i.name for i in catalog.category_list])
     store_settings = get_store_settings()
     store_settings['title'] = 'Поиск'
-    # Обработка поиска
+    # Обработка поиска: отправка формы открывает первую страницу,
+    # остальные страницы запрашиваются ссылками с параметрами name, category и page
     if form.validate_on_submit():
-        # Поиск только по имени
-        if form.category.data != 'Всё':
-            category_id = db_sess.query(Category).filter(Category.name == form.category.data).first().id
-            items = db_sess.query(Item).filter(Item.name.like(f"%{form.name.data}%"), Item.category == category_id).all()
-        # Поиск по имени и категории
-        else:
-            items = db_sess.query(Item).filter(Item.name.like(f"%{form.name.data}%")).all()
-        # Заполенение словаря получеными данными
-        items = {'items': items, 'rows': len(items) // 3 if len(items) % 3 == 0 else len(items) // 3 + 1,
-                 'length': len(items)}
-        # Возврат результатов
-        return render_template('search.html', items=items, form=form, **store_settings)
-    return render_template('search.html', items={'items': []}, form=form, **store_settings)
+        page = 1
+    elif request.args.get('name'):
+        form.name.data = request.args['name']
+        form.category.data = request.args.get('category', 'Всё')
+        page = request.args.get('page', 1, type=int)
+    else:
+        return render_template('search.html', items={'items': []}, form=form, **store_settings)
+    # Поиск по названию и свойствам, категория фильтруется внутри индекса
+    category_id = catalog.category_ids.get(form.category.data)
+    db_sess = db_session.current_session()
+    ids, total = search_index.search(db_sess, form.name.data, category_id, page)
+    found = resolve_items(db_sess, ids)
+    items = [found[i] for i in ids if i in found]
+    # Заполенение словаря получеными данными
+    items = {'items': items, 'rows': len(items) // 3 if len(items) % 3 == 0 else len(items) // 3 + 1,
+             'length': len(items)}
+    pages = {'current': page, 'count': (total + search_index.PER_PAGE - 1) // search_index.PER_PAGE,
+             'name': form.name.data, 'category': form.category.data}
+    # Возврат результатов
+    return render_template('search.html', items=items, pages=pages, form=form, **store_settings)
 
 
 # Оформление заказа
-@app.route('/order')
+@blueprint.route('/order')
 @login_required
 def order():
-    # Логический флаг для идентификации успеха заказа
-    success = True
-    # Загрузка данных пользователя
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        # Перебор значений валют в сумме цен товаров в корзине
-        # Если какой-то валюты не хватает, меняю значение флага на False
-        for i in data['shopping_cart']['summary'].keys():
-            if data['currencies'][i] < data['shopping_cart']['summary'][i]:
-                success = False
-                break
-        # В случае нехватки средств возвращаю страницу корзины с соответствувющим сообщением
-        if not success:
-            return shopping_cart('На вашем счёте недостаточно средств для оформления заказа')
-        else:
-            # В противном случае генерирую идентификатор заказа
-            while True:
-                key = random.randint(100000, 999999)
-                if key not in data['orders'].keys():
-                    break
-            # Заношу данные о заказе в данные опльзователя
-            data['orders'][key] = dict()
-            data['orders'][key]['summary'] = data['shopping_cart']['summary'].copy()
-            # Вычитаю сумму цен заказа
-            for i in list(data['shopping_cart']['summary']):
-                data['currencies'][i] -= data['shopping_cart']['summary'][i]
-                del data['shopping_cart']['summary'][i]
-            data['orders'][key]['items'] = data['shopping_cart']['items']
-            data['shopping_cart']['items'] = []
-            # Перезаписываю данные в файл
-            jsonfile.seek(0)
-            jsonfile.truncate()
-            json.dump(data, jsonfile)
-            return redirect('/orders')
+    db_sess = db_session.current_session()
+    # Списание средств, перенос корзины в заказ и очистка корзины происходят одной транзакцией
+    # В случае нехватки средств возвращаю страницу корзины с соответствувющим сообщением
+    if account_store.checkout(db_sess, current_user.id) is None:
+        return shopping_cart('На вашем счёте недостаточно средств для оформления заказа')
+    return redirect('/orders')
 
 
 # Страница заказов
-@app.route('/orders')
+@blueprint.route('/orders')
 @login_required
 def orders():
     store_settings = get_store_settings()
     store_settings['title'] = 'Заказы'
-    # Загрузка данных пользователя
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-    return render_template('orders.html', orders=data['orders'], **store_settings)
+    db_sess = db_session.current_session()
+    currencies = get_catalog().currencies
+    # Страница заказов старше before, ссылка на следующую страницу содержит последний показанный номер
+    order_ids, next_before = account_store.get_orders_page(db_sess, current_user.id,
+                                                           request.args.get('before', type=int))
+    user_orders = {order_id: [(currencies[currency_id].logo_url, amount) for currency_id, amount in totals.items()]
+                   for order_id, totals in account_store.get_order_totals(db_sess, order_ids).items()}
+    return render_template('orders.html', orders=user_orders, next_before=next_before,
+                           first_page=request.args.get('before') is None, **store_settings)
+
+
+# Выгрузка всех заказов в CSV (позиция заказа в строке) или NDJSON (заказ в строке)
+# Ответ формируется генератором по мере чтения заказов из базы
+@blueprint.route('/orders/export')
+@login_required
+def export_orders():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in orders_export.FORMATS:
+        return abort(404)
+    rows = orders_export.FORMATS[export_format](db_session.current_session(), current_user.id)
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(rows), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=orders.{export_format}'})
 
 
 # Удаление заказа
-@app.route('/delete_order/<int:order_id>')
+@blueprint.route('/delete_order/<int:order_id>')
 @login_required
 def delete_order(order_id):
-    order_id = str(order_id)
-    # Загрузка данных
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        # Проверка на наличие заказа в данных по идентификатору
-        if order_id in data['orders'].keys():
-            # Удаление заказа и перезпись
-            del data['orders'][order_id]
-            jsonfile.seek(0)
-            jsonfile.truncate() 
-            json.dump(data, jsonfile)
-            return redirect('/orders')
-        else:
-            return abort(404)
+    db_sess = db_session.current_session()
+    if not account_store.delete_order(db_sess, current_user.id, order_id):
+        return abort(404)
+    return redirect('/orders')
 
 
 # Страница заказа
-@app.route('/order/<int:order_id>')
+@blueprint.route('/order/<int:order_id>')
 @login_required
 def order_page(order_id):
     store_settings = get_store_settings()
-    order_id = str(order_id)
-    store_settings['title'] = 'Заказ №' + order_id
-    # Загрузка данных
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        if order_id not in data['orders'].keys():
-            return abort(404)
-    order_data = {'items': [], 'summary': {}}
-    db_sess = db_session.create_session()
-    currencies = dict()
-    # Создание словаря с фото валют
-    for i in db_sess.query(Currency).all():
-        currencies[str(i.id)] = url_for('static', filename=f'img/currencies/{i.logotype}')
-    # Заполнение списка товаров в заказе
-    for i in data['orders'][order_id]['items']:
-        item = db_sess.query(Item).filter(Item.id == int(i['item_id'])).first()
-        order_data['items'].append({'name': item.name, 'price': i['price'], 'discount': i['discount'],
-                          'discount_price': i['discount_price'], 'currency': currencies[i['currency_id']],
-                          'image': url_for('static', filename=f'img/items/{item.photo_name}'), 'id': i['item_id']})
-    # Заполенение словаря с суммой
-    for i in data['orders'][order_id]['summary'].keys():
-        order_data['summary'][i] = {'currency': currencies[i], 'price':  data['orders'][order_id]['summary'][i]}
+    store_settings['title'] = 'Заказ №' + str(order_id)
+    db_sess = db_session.current_session()
+    lines = account_store.get_order_lines(db_sess, current_user.id, order_id)
+    if lines is None:
+        return abort(404)
+    # Заполнение списка товаров в заказе и словаря с суммой
+    order_data = dict()
+    order_data['items'], order_data['summary'] = build_line_rows(db_sess, lines)
     return render_template('order.html', order_data=order_data, order_id=order_id, **store_settings)
 
 
 # Возвращение денег за заказ
-@app.route('/refund_order/<int:order_id>')
+@blueprint.route('/refund_order/<int:order_id>')
 @login_required
 def refund_order(order_id):
-    order_id = str(order_id)
-    # Загрузка данных
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        # Поиск заказа по идентификатору
-        if order_id not in data['orders'].keys():
-            return abort(404)
-        # Возврат денег
-        for i in data['orders'][order_id]['summary'].keys():
-            data['currencies'][i] += data['orders'][order_id]['summary'][i]
-        # Перезапись данных
-        jsonfile.seek(0)
-        jsonfile.truncate()
-        json.dump(data, jsonfile)
-    # Редирект на страницу удаления заказа
-    return delete_order(order_id)
+    db_sess = db_session.current_session()
+    # Возврат денег и удаление заказа
+    if not account_store.refund_order(db_sess, current_user.id, order_id):
+        return abort(404)
+    return redirect('/orders')
 
 
 # Страница обмена валют
-@app.route('/exchange')
+@blueprint.route('/exchange')
 @login_required
 def exchange(message=None):
     store_settings = get_store_settings()
     store_settings['title'] = 'Обмен валют'
-    db_sess = db_session.create_session()
     data = []
-    currencies = db_sess.query(Currency).all()
-    # Случайное определение валюты и цены
-    for i in currencies:
-        j = random.choice(currencies)
-        price = random.randint(0, 9999)
-        price /= 10 ** random.randint(0, len(str(price)))
-        if j.is_integer == 1:
-            price = int(price)
-        # Занесение курса в список
-        data.append({'first_id': i.id, 'first_logo': url_for('static', filename=f'img/currencies/{i.logotype}'),
-                     'second_id': j.id, 'second_logo': url_for('static', filename=f'img/currencies/{j.logotype}'),
-                     'amount': price})
+    catalog = get_catalog()
+    rates = exchange_rates.get_rates()
+    # Для каждой валюты - предлагаемая пара и курс текущего периода
+    for first_id, second_id in zip(rates.ids.tolist(), rates.pairs.tolist()):
+        first, second = catalog.currencies[first_id], catalog.currencies[second_id]
+        data.append({'first_id': first_id, 'first_logo': first.logo_url, 'first_integer': first.is_integer,
+                     'second_id': second_id, 'second_logo': second.logo_url,
+                     'amount': rates.convert(1, first_id, second_id)})
     return render_template('exchange.html', message=message, data=data, **store_settings)
 
 
 # Обработка обмена валют
-@app.route('/change_currencies')
+@blueprint.route('/change_currencies')
 @login_required
 def change_currencies():
-    info = dict()
-    # Получение данных из запроса
-    for i in ['first_id', 'second_id', 'amount']:
-        info[i] = request.args.get(i)
-    # Загрузка данных пользователя
-    with open(f'accounts/user_{current_user.id}.json', 'r+', encoding='utf-8') as jsonfile:
-        data = json.load(jsonfile)
-        # Проверка наличия достаточного количества денег у пользователя
-        if data['currencies'][info['first_id']] < 1:
-            return exchange('На вашем счёте недостаточно средств для совершения обмена')
-        else:
-            # Совершение обмена
-            data['currencies'][info['first_id']] -= 1
-            data['currencies'][info['second_id']] += float(info['amount'])
-            # Перезапись данных
-            jsonfile.seek(0)
-            jsonfile.truncate()
-            json.dump(data, jsonfile)
-            return redirect('/exchange')
+    db_sess = db_session.current_session()
+    first_id = request.args.get('first_id', type=int)
+    second_id = request.args.get('second_id', type=int)
+    # amount - сколько единиц первой валюты обменять, полученная сумма считается по текущему курсу
+    # Отсутствующая, нечисловая, бесконечная или неположительная сумма отклоняется, а не заменяется единицей
+    try:
+        amount = float(request.args['amount'])
+    except (KeyError, ValueError):
+        amount = math.nan
+    currencies = get_catalog().currencies
+    if first_id not in currencies or second_id not in currencies or first_id == second_id \
+            or not 0 < amount < math.inf or currencies[first_id].is_integer and not amount.is_integer():
+        return exchange('Неверная сумма обмена')
+    received = exchange_rates.get_rates().convert(amount, first_id, second_id)
+    # Для целочисленной валюты полученная сумма округляется вниз и может оказаться нулевой
+    if not received > 0:
+        return exchange('Сумма слишком мала для обмена')
+    # Проверка наличия средств и обмен выполняются одной транзакцией
+    if not account_store.exchange(db_sess, current_user.id, first_id, second_id, amount, received):
+        return exchange('На вашем счёте недостаточно средств для совершения обмена')
+    return redirect('/exchange')
 
 
 # FAQ по доставке
-@app.route('/delivery_info')
+@blueprint.route('/delivery_info')
+@page_cache.cached_page
 def delivery_info():
     store_settings = get_store_settings()
     store_settings['title'] = 'Условия доставки'
@@ -599,7 +537,8 @@ def delivery_info():
 
 
 # Общее FAQ
-@app.route('/faq')
+@blueprint.route('/faq')
+@page_cache.cached_page
 def faq():
     store_settings = get_store_settings()
     store_settings['title'] = 'Частые вопросы'
@@ -607,19 +546,19 @@ def faq():
 
 
 # Замена стандартных страниц ошибок
-@app.errorhandler(404)
+@blueprint.app_errorhandler(404)
 def not_found(error):
-    return render_template('404.html')
+    return page_cache.cached_template('404.html')
 
 
-@app.errorhandler(401)
+@blueprint.app_errorhandler(401)
 def unauthorized(error):
-    return render_template('401.html')
+    return page_cache.cached_template('401.html')
 
 
-@app.errorhandler(500)
+@blueprint.app_errorhandler(500)
 def server_error(error):
-    return render_template('500.html')
+    return page_cache.cached_template('500.html')
 
 
 # Главный цикл
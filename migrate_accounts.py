@@ -0,0 +1,13 @@
+from data import db_session, account_store
+
+
+# Одноразовый перенос счетов, корзин и заказов из json-файлов accounts/user_<id>.json в базу данных
+def main():
+    db_session.global_init("db/store_database.db")
+    db_sess = db_session.create_session()
+    migrated = account_store.migrate_json_accounts(db_sess, 'accounts')
+    print(f"Перенесено аккаунтов: {migrated}")
+
+
+if __name__ == '__main__':
+    main()
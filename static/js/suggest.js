@@ -0,0 +1,30 @@
+// Подсказки при вводе названия товара на странице поиска: запрос к /api/suggest не чаще раза в 150 мс
+(function () {
+    var input = document.querySelector('input[list="suggestions"]');
+    var list = document.getElementById('suggestions');
+    if (!input || !list) {
+        return;
+    }
+    var timer = null;
+    var last = '';
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            var text = input.value.trim();
+            if (!text || text === last) {
+                return;
+            }
+            last = text;
+            fetch('/api/suggest?q=' + encodeURIComponent(text))
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    list.innerHTML = '';
+                    data.items.forEach(function (item) {
+                        var option = document.createElement('option');
+                        option.value = item.name;
+                        list.appendChild(option);
+                    });
+                });
+        }, 150);
+    });
+})();
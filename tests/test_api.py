@@ -0,0 +1,118 @@
+# Договор JSON API корзины и заказов: повтор по Idempotency-Key, 409 при устаревшей цене и 400 при неверном теле
+# Запуск из корня проекта: python -m pytest tests
+import os
+import shutil
+import pytest
+from data import db_session, account_store
+from data.currency import Currency
+from data.item import Item
+from data.order import Order
+from data.user import User
+
+DATABASE = os.path.join(os.path.dirname(__file__), '..', 'db', 'store_database.db')
+
+
+# Копия базы проекта; db_session подключается к одной базе на процесс, поэтому приложение общее для модуля
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    database = tmp_path_factory.mktemp('db') / 'store_database.db'
+    shutil.copy(DATABASE, database)
+    from main import create_app
+    return create_app({'DATABASE_URL': str(database), 'JOB_WORKERS': 0, 'TESTING': True,
+                       'TEMPLATE_CACHE_DIR': str(tmp_path_factory.mktemp('templates'))})
+
+
+# Новый пользователь с пустой корзиной и деньгами на счёте, вошедший в тестовом клиенте
+@pytest.fixture
+def client(app, request):
+    db_sess = db_session.create_session()
+    user = User(name='test', email=f'{request.node.name}@api.test', got_bonus=0)
+    db_sess.add(user)
+    db_sess.flush()
+    currency_ids = [i for i, in db_sess.query(Currency.id)]
+    account_store.create_account(db_sess, user.id, currency_ids)
+    account_store.apply_bonus(db_sess, user.id, {i: 10 ** 9 for i in currency_ids})
+    db_sess.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    client.user_id = user.id
+    yield client
+    db_sess.close()
+
+
+# Актуальная цена товара: ответ 409 на заведомо неверную цену
+def current_price(client, item_id):
+    response = client.post('/api/cart/items', json={'items': [{'item_id': item_id, 'currency_id': 1, 'price': -1}]})
+    assert response.status_code == 409
+    return response.get_json()['items'][0]['current']
+
+
+@pytest.fixture
+def item_id():
+    db_sess = db_session.create_session()
+    try:
+        return db_sess.query(Item.id).order_by(Item.id).first()[0]
+    finally:
+        db_sess.close()
+
+
+def cart_size(client):
+    return len(client.get('/api/cart').get_json()['lines'])
+
+
+def test_stale_price_returns_409_with_current_price(client, item_id):
+    response = client.post('/api/cart/items', json={'items': [{'item_id': item_id, 'currency_id': 1, 'price': -1}]})
+    assert response.status_code == 409
+    body = response.get_json()
+    assert body['error'] == 'price_changed'
+    assert body['items'][0]['item_id'] == item_id
+    assert body['items'][0]['current']['item_id'] == item_id
+    assert cart_size(client) == 0
+    # Повтор с актуальной ценой проходит
+    assert client.post('/api/cart/items', json={'items': [body['items'][0]['current']]}).status_code == 201
+    assert cart_size(client) == 1
+
+
+@pytest.mark.parametrize('data, content_type', [
+    ('{"items": [', 'application/json'),
+    ('items=1', 'application/x-www-form-urlencoded'),
+    ('[]', 'application/json'),
+    ('{"items": []}', 'application/json'),
+    ('{"items": [{"item_id": "1", "currency_id": 1, "price": 1}]}', 'application/json'),
+])
+def test_invalid_body_returns_json_400(client, data, content_type):
+    response = client.post('/api/cart/items', data=data, content_type=content_type)
+    assert response.status_code == 400
+    assert response.is_json
+    assert response.get_json()['error'] == 'invalid_items'
+
+
+def test_idempotent_replay_returns_saved_response(client, item_id):
+    payload = {'items': [current_price(client, item_id)]}
+    headers = {'Idempotency-Key': 'add-1'}
+    first = client.post('/api/cart/items', json=payload, headers=headers)
+    second = client.post('/api/cart/items', json=payload, headers=headers)
+    assert first.status_code == second.status_code == 201
+    assert first.get_json() == second.get_json()
+    assert cart_size(client) == 1
+    # Тот же ключ с другим телом - ошибка, а не выполнение
+    other = client.post('/api/cart/items', json={'items': payload['items'] * 2}, headers=headers)
+    assert other.status_code == 422
+    assert cart_size(client) == 1
+
+
+def test_idempotent_order_is_created_once(client, item_id):
+    client.post('/api/cart/items', json={'items': [current_price(client, item_id)]})
+    headers = {'Idempotency-Key': 'order-1'}
+    first = client.post('/api/orders', headers=headers)
+    second = client.post('/api/orders', headers=headers)
+    assert first.status_code == second.status_code == 201
+    assert first.get_json()['order_id'] == second.get_json()['order_id']
+    db_sess = db_session.create_session()
+    try:
+        assert db_sess.query(Order).filter(Order.user_id == client.user_id).count() == 1
+    finally:
+        db_sess.close()
+    assert cart_size(client) == 0
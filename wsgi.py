@@ -0,0 +1,7 @@
+from main import create_app
+from data import startup
+
+# Точка входа для WSGI-сервера: gunicorn -c gunicorn.conf.py wsgi:app
+# Прогрев (шаблоны, каталог, таблицы цен) выполняется до того, как процесс начнёт принимать запросы
+app = create_app()
+startup.warm(app)